@@ -1,19 +1,36 @@
 # Main.py (versi logging JSON + simpan semua pertanyaan termasuk skor 0)
+import time  # TTL cache jawaban & laporan waktu startup
+_t_import_start = time.perf_counter()  # awal import (laporan waktu startup)
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup  # Untuk akses objek Update Telegram dan inline buttons
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, CallbackContext  # Framework bot Telegram
-from transformers import AutoTokenizer, AutoModelForQuestionAnswering  # Model QA IndoBERT
-from sklearn.feature_extraction.text import TfidfVectorizer  # Untuk representasi kata kunci jadi angka (TF-IDF)
-from sklearn.metrics.pairwise import cosine_similarity  # Hitung kemiripan cosine antara pertanyaan dan keyword
-import torch  # Operasi tensor untuk model
+from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, TypeHandler, filters, CallbackContext  # Framework bot Telegram
+import numpy as np  # softmax skor span untuk rerank top-k
+import asyncio  # kirim beberapa kandidat context ke batcher sekaligus
 import json  # Baca/tulis JSON
 import os  # Manipulasi path file
+import sys  # argumen command line (--build-index)
 import sqlite3  # SQLite untuk penyimpanan dataset & kartu pekerjaan
 from datetime import datetime, timedelta  # untuk penjadwalan antrian/tanggal
 from typing import List, Tuple
-import re  # untuk parsing placeholder
+import hashlib  # signature isi tabel untuk hot-reload dataset
+import functools  # wrapper handler (lock per chat)
+import difflib  # kemiripan pertanyaan user vs pertanyaan dataset (near-exact match)
+from collections import OrderedDict  # LRU cache jawaban
+import threading  # lock koneksi SQLite yang dipakai bersama oleh worker thread
+from price_map import PriceMap, ensure_price_change_log  # harga_data di memori
+from db_pool import ConnectionPool, configure_connection, CACHED_STATEMENTS  # koneksi SQLite per worker thread
+from chat_log_sink import ChatLogSink  # chat log JSONL ditulis di background
+from chat_log_store import ChatLogStore  # chat log di SQLite (opsional)
+from session_store import SessionStore, STEP_PLAT, STEP_KONFIRMASI  # sesi user (TTL + LRU + SQLite)
+import precomputed_answers as pa  # jawaban model yang dihitung offline (precomputed_answers.py build)
+from metrics import Metrics  # latency per tahap (p50/p95/p99) untuk /stats
+from qa_batcher import MicroBatcher  # micro-batching inferensi IndoBERT
+import worker_pool as wp  # executor untuk kerja berat di luar event loop
+from eval_chatbot import normalize_text  # normalisasi pertanyaan yang sama dengan evaluasi
 
 # ========== CONFIG ==========
 finetuned_model_path = r"C:\Users\Widya HW\OneDrive - Universitas Tarumanagara\Desktop\Skripsi\Fix Program\indobert-qa-finetuned-final-v2"
+onnx_model_path = os.path.join(finetuned_model_path, "model.onnx")  # hasil `python qa_backend.py export`
+QA_BACKEND = "torch_fp32"  # "torch_fp32", "torch_int8" atau "onnx" (cek dulu dengan `python qa_backend.py parity`)
 
 # file JSON (fallback jika DB tidak ada)
 qa_service_path = r"C:\Users\Widya HW\OneDrive - Universitas Tarumanagara\Desktop\Skripsi\Fix Program\converted_jsons\QA_Final\QA_Service.json"
@@ -27,13 +44,95 @@ DB_PATH = r"C:\Users\Widya HW\OneDrive - Universitas Tarumanagara\Desktop\Skrips
 TOKEN = "[INPUT TOKEN DARI BOTFATHER]" # Token bot Telegram
 ADMIN_CHAT_ID = "[INPUT ID TELEGRAM]"  # ID Telegram admin untuk invoice
 TFIDF_THRESHOLD = 0.3  # Ambang batas similarity TF-IDF
+BATCH_MAX_SIZE = 8      # maksimal pasangan (question, context) per forward pass
+BATCH_MAX_WAIT_MS = 10  # lama batcher menunggu pertanyaan lain sebelum forward pass
+CONCURRENT_UPDATES = 32 # jumlah update Telegram yang boleh diproses bersamaan (perlu agar batch terisi); satu chat tetap berurutan
+BOT_MODE = "polling"    # "polling" (default) atau "webhook" (server HTTP asyncio di dalam bot)
+WEBHOOK_LISTEN = "0.0.0.0"
+WEBHOOK_PORT = 8443
+WEBHOOK_PATH = "/telegram"
+WEBHOOK_URL = ""        # URL https publik (mis. reverse proxy) → setWebhook saat start; kosong = tidak didaftarkan (uji lokal)
+WEBHOOK_SECRET = ""     # secret_token untuk header X-Telegram-Bot-Api-Secret-Token (wajib jika WEBHOOK_URL diisi; kosong = tidak dicek, hanya uji lokal)
+WEBHOOK_MAX_PENDING = 1000  # update menunggu maksimal; lebih dari ini dibalas 503 agar Telegram mengirim ulang
+SHARD_WORKERS = 0       # >1: proses depan menerima update lalu membaginya ke N proses worker berdasarkan chat_id
+                        # (butuh fork → Linux/macOS; model di-load sekali lalu dipakai bersama lewat copy-on-write)
+# Top-k retrieval: k kandidat paragraf dijawab dalam satu batch, lalu dipilih dengan
+# skor gabungan w_retrieval * skor TF-IDF + w_span * skor span model (softmax antar kandidat).
+# k = 1 → perilaku lama (hanya paragraf dengan skor TF-IDF tertinggi).
+TOPK_DEFAULT = {"k": 3, "w_retrieval": 0.6, "w_span": 0.4}
+TOPK_CONFIG = {
+    "layanan": {"k": 3, "w_retrieval": 0.6, "w_span": 0.4},
+    "harga_oli": {"k": 3, "w_retrieval": 0.7, "w_span": 0.3},
+    "harga_umum_mobil": {"k": 3, "w_retrieval": 0.6, "w_span": 0.4},
+    "harga_umum_bis": {"k": 3, "w_retrieval": 0.6, "w_span": 0.4},
+}
+# Confidence model = p(start) * p(end) span terpilih. Di bawah ambang → jawaban tidak dikirim (fallback "belum tahu").
+# Ambang per mode bisa di-tuning dari chat log: `python eval_chatbot.py --tune-confidence` → confidence_thresholds.json
+CONFIDENCE_DEFAULT = 0.1
+CONFIDENCE_THRESHOLDS = {}  # mode -> ambang (kosong = CONFIDENCE_DEFAULT), ditimpa isi file di bawah jika ada
+CONFIDENCE_THRESHOLDS_PATH = os.path.join(os.path.dirname(__file__), "confidence_thresholds.json")
+EXACT_QUESTION_FASTPATH = True  # pertanyaan identik dengan pertanyaan dataset → jawaban dataset (tanpa TF-IDF & model)
+NEAR_EXACT_RATIO = 0.92     # pertanyaan hampir sama persis dengan pertanyaan dataset → jawaban dataset, tanpa IndoBERT
+PRECOMPUTED_ANSWERS = True  # pakai tabel precomputed_answers (isi dengan `python precomputed_answers.py build`)
+PARAPHRASE_RATIO = 0.8      # kemiripan minimal dengan salah satu pertanyaan di cluster parafrase kandidat
+SEARCH_EVERYWHERE_FALLBACK = False  # jika skor mode < TFIDF_THRESHOLD, coba cari di semua katalog
+DATASET_RELOAD_INTERVAL = 30  # detik antar pengecekan perubahan tabel dataset (0 = hot-reload mati)
+ANSWER_CACHE_SIZE = 1024   # maksimal jawaban yang disimpan di cache (LRU)
+ANSWER_CACHE_TTL = 3600    # umur jawaban di cache (detik)
+EXECUTOR_KIND = "thread"   # "thread" atau "process" (model di-load di tiap worker process)
+EXECUTOR_WORKERS = 2       # jumlah worker untuk TF-IDF, SQLite dan inferensi model
+EXECUTOR_QUEUE_SIZE = 32   # maksimal pekerjaan menunggu; jika penuh handler ikut menunggu (backpressure)
+KAPASITAS_HARIAN = 5       # default jumlah booking per hari (bisa di-override per tanggal di kapasitas_harian)
+CHATLOG_BACKEND = "jsonl"  # "jsonl" (chat_log_*.txt), "sqlite" (tabel chat_log di bengkel.db) atau "both"
+CHATLOG_FLUSH_EVERY = 50   # tulis chat log setiap N record ...
+CHATLOG_FLUSH_MS = 500     # ... atau setiap T milidetik, mana yang lebih dulu
+CHATLOG_ROTATE_BYTES = 0   # rotasi file log jika ukurannya melewati batas (0 = mati)
+CHATLOG_ROTATE_SECONDS = 0 # rotasi file log berdasarkan umur segmen (0 = mati)
+CHATLOG_GZIP = False       # kompres segmen log hasil rotasi (.gz)
+SESSION_TTL = 12 * 3600    # sesi user yang tidak aktif selama ini dibuang (detik)
+SESSION_MAX = 10000        # maksimal sesi di memori; lebih dari ini yang paling lama tidak aktif dibuang (LRU)
+SESSION_PERSIST = True     # simpan sesi ke tabel user_session (write-behind) agar bertahan saat restart
+SESSION_FLUSH_INTERVAL = 5 # jeda penulisan sesi ke DB (detik)
+HARI_TUTUP = set()          # hari libur mingguan, mis. {6} = Minggu (0=Senin ... 6=Minggu); tanggal tertentu: set_hari_tutup()
+RETRIEVAL_ARTIFACT_DIR = os.path.join(os.path.dirname(__file__), "retrieval_artifacts")  # hasil `python Main_Final.py --build-index`
+USE_RETRIEVAL_ARTIFACTS = True  # load index TF-IDF dari artefak jika isi tabel belum berubah; jika basi → fit ulang & simpan
+METRICS_WINDOW = 2048      # jumlah sampel terakhir per (mode, tahap) untuk hitung p50/p95/p99
+METRICS_DUMP_PATH = os.path.join(os.path.dirname(__file__), "metrics.json")  # dump metrics lokal
+METRICS_DUMP_INTERVAL = 60 # detik antar dump metrics ke file (0 = hanya saat shutdown)
+LAZY_STARTUP = True        # True: polling langsung jalan, model & index TF-IDF di-load di background
+                           # (paling terasa dengan EXECUTOR_KIND="thread"; process pool tetap load model saat start)
 
 # ============================
 
-# === Load model/tokenizer ===
-tokenizer = AutoTokenizer.from_pretrained(finetuned_model_path)  # Load tokenizer IndoBERT finetuned
-model = AutoModelForQuestionAnswering.from_pretrained(finetuned_model_path) # load model QA
-model.eval()  # set model ke mode evaluasi (tidak training)
+# === Laporan waktu startup ===
+startup_times = OrderedDict()  # tahap -> detik (import, model, DB, TF-IDF, ...)
+startup_times["import_bot"] = time.perf_counter() - _t_import_start
+
+class startup_stage:
+    """Context manager: catat lama satu tahap startup ke startup_times."""
+
+    def __init__(self, name, timings=None):
+        self.name = name
+        self.timings = startup_times if timings is None else timings
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.timings[self.name] = self.timings.get(self.name, 0.0) + time.perf_counter() - self.t0
+
+def format_startup_report(timings=None):
+    timings = startup_times if timings is None else timings
+    parts = [f"{name} {sec:.2f}s" for name, sec in timings.items()]
+    return " | ".join(parts) + f" | total {sum(timings.values()):.2f}s"
+
+# === Model/tokenizer (di-load oleh load_components) ===
+tokenizer = None  # tokenizer IndoBERT finetuned
+model = None      # model QA sesuai QA_BACKEND
+qa_inference = None    # modul inferensi QA (import torch), di-import oleh load_components
+RetrievalIndex = None  # kelas index TF-IDF (import sklearn), di-import oleh load_components
+components_ready = threading.Event()  # set setelah model + index TF-IDF siap dipakai
+components_error = None               # exception jika load di background gagal
 
 # === SQLite helpers ===
 def init_db_connection(db_path: str) -> sqlite3.Connection:
@@ -41,8 +140,10 @@ def init_db_connection(db_path: str) -> sqlite3.Connection:
     NOTE: detect_types disabled intentionally to avoid sqlite auto-conversion issues
     when strings with 'T' (isoformat datetimes) are stored. Treat dates as TEXT.
     """
-    conn = sqlite3.connect(db_path)
+    conn = sqlite3.connect(db_path, check_same_thread=False,  # dipakai dari worker thread (dijaga db_lock)
+                           cached_statements=CACHED_STATEMENTS)
     conn.row_factory = sqlite3.Row
+    configure_connection(conn)  # WAL, synchronous=NORMAL, cache_size, mmap_size, busy_timeout
     return conn
 
 def ensure_tables(conn: sqlite3.Connection):
@@ -70,7 +171,24 @@ def ensure_tables(conn: sqlite3.Connection):
         harga TEXT
     )
     """)
+    # Index + tabel kapasitas per tanggal untuk penjadwalan antrean
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_kartu_tanggal_datang ON kartu_pekerjaan(tanggal_datang)")
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS kapasitas_harian (
+        tanggal TEXT PRIMARY KEY,          -- YYYY-MM-DD
+        terisi INTEGER NOT NULL DEFAULT 0, -- jumlah slot yang sudah dipesan
+        kapasitas INTEGER,                 -- NULL = pakai KAPASITAS_HARIAN
+        tutup INTEGER NOT NULL DEFAULT 0   -- 1 = tutup, 0 = buka, -1 = buka walau hari libur mingguan (HARI_TUTUP)
+    )
+    """)
+    # Sinkronkan dengan booking yang sudah ada (mis. data lama sebelum tabel ini dibuat)
+    cur.execute("""
+    INSERT INTO kapasitas_harian (tanggal, terisi)
+    SELECT tanggal_datang, COUNT(*) FROM kartu_pekerjaan WHERE tanggal_datang IS NOT NULL GROUP BY tanggal_datang
+    ON CONFLICT(tanggal) DO UPDATE SET terisi = MAX(terisi, excluded.terisi)
+    """)
     conn.commit()
+    ensure_price_change_log(conn)  # log perubahan harga_data untuk refresh PriceMap secara incremental
 
 def load_keywords_and_paragraphs_from_db(conn: sqlite3.Connection, table_name: str) -> Tuple[List[str], List[dict]]:
     """
@@ -110,40 +228,29 @@ def load_keywords_and_paragraphs_from_db(conn: sqlite3.Connection, table_name: s
         paragraphs.append(para)
     return keywords, paragraphs
 
+# === Query yang sering dipakai ===
+# Teks SQL konstan → sqlite3 memakai ulang prepared statement dari cache per koneksi.
+SQL_HARGA_PLACEHOLDER = "SELECT harga FROM harga_data WHERE placeholder = ?"
+SQL_INSERT_KARTU = """
+    INSERT INTO kartu_pekerjaan (Nama_pengirim, Merek_mobil, Jenis_mobil, Plat_nomor, Keluhan, tanggal_input, tanggal_datang, nomor_antrian, status)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+SQL_KARTU_BY_ID = "SELECT * FROM kartu_pekerjaan WHERE id_kartu = ?"
+
 # === Harga placeholder helpers (baru) ===
 def get_price_by_placeholder(conn: sqlite3.Connection, placeholder_name: str) -> str:
     """
     Ambil harga dari tabel harga_data berdasarkan kolom placeholder.
     Jika tidak ditemukan, kembalikan None.
     """
-    cur = conn.cursor()
-    cur.execute("SELECT harga FROM harga_data WHERE placeholder = ?", (placeholder_name,))
-    r = cur.fetchone()
+    r = conn.execute(SQL_HARGA_PLACEHOLDER, (placeholder_name,)).fetchone()
     if r:
         return r["harga"]
     return None
 
-def replace_placeholders_in_text(conn: sqlite3.Connection, text: str) -> str:
-    if not text :
-        return text
-    
-    pattern = r"\{+\s*\{+\s*([A-Za-z0-9 _\-]+?)\s*\}+\s*\}+"
-
-    def repl(match):
-        raw = match.group(1)
-        # NORMALISASI:
-        # hilangkan spasi & underscore berantakan jadi underscore normal
-        cleaned = raw.replace(" ", "")
-        cleaned = re.sub(r"_+", "_", cleaned)  # rapikan underscore dobel
-
-        # ambil harga dari DB
-        price = get_price_by_placeholder(conn, cleaned)
-        if price:
-            return price
-        
-        # jika tidak ada di DB, kembalikan placeholder-nya utuh (atau kosong)
-        return match.group(0)
-    return re.sub(pattern, repl, text)
+# Semua harga_data disimpan di memori; placeholder diganti dalam satu pass regex tanpa query DB.
+# get_price_by_placeholder hanya dipakai saat refresh untuk placeholder yang berubah.
+price_map = PriceMap()
 
 # === Load datasets (DB preferred; fallback ke JSON) ===
 def load_json_safe(path):
@@ -154,12 +261,25 @@ def load_json_safe(path):
         return json.load(f)                        # parse isinya ke Python dict
 
 # Try to init DB and load keywords; if DB missing or table missing, fallback to JSON
+# - conn (+ db_lock): koneksi bersama untuk hot-reload, sesi & chat log. Commit dari koneksi ini
+#   tidak mengubah PRAGMA data_version miliknya sendiri, jadi tidak memicu cek reload.
+# - db_pool: koneksi per worker thread untuk booking (tanpa lock global, WAL + busy_timeout).
 conn = None
-try:
-    conn = init_db_connection(DB_PATH)
-    ensure_tables(conn)
-except Exception as e:
-    print(f"[WARN] Gagal konek DB: {e}. Akan fallback ke file JSON.")
+db_lock = threading.Lock()  # satu koneksi dipakai bersama → akses diserialkan
+db_pool = ConnectionPool(DB_PATH)
+
+def db_call(fn, *args, **kwargs):
+    """Jalankan helper SQLite sambil memegang db_lock (aman dipanggil dari worker thread)."""
+    with db_lock:
+        return fn(*args, **kwargs)
+
+with startup_stage("db"):
+    try:
+        conn = init_db_connection(DB_PATH)
+        ensure_tables(conn)
+        price_map.load(conn)
+    except Exception as e:
+        print(f"[WARN] Gagal konek DB: {e}. Akan fallback ke file JSON.")
 
 def load_dataset(table_name: str, json_path: str):
     """Return keywords, paragraphs — diberi prioritas DB kalau tersedia"""
@@ -179,12 +299,6 @@ def load_dataset(table_name: str, json_path: str):
             paras.append(para)
     return kws, paras
 
-# load datasets (db table names assumed: faq_service, harga_oli, harga_umum_mobil, harga_umum_bis_truk)
-kw_qa, para_qa = load_dataset("qa_service", qa_service_path)
-kw_oli, para_oli = load_dataset("oli_fix", oli_fix_path)
-kw_umum, para_umum = load_dataset("gabungan_umum", gab_umum_path)
-kw_bis, para_bis = load_dataset("gabungan_bis_truk", gab_bis_path)
-
 # === Extract keyword & paragraph (fungsi lama dipertahankan jika perlu) ===
 def extract_keyword_and_paragraphs_from_json(dataset):
     keywords, paragraphs = [], []
@@ -195,44 +309,448 @@ def extract_keyword_and_paragraphs_from_json(dataset):
             paragraphs.append(para)
     return keywords, paragraphs
 
-# === TF-IDF ===
-def build_tfidf(keywords):
-    # jika keywords kosong (misal DB kosong), beri fallback minimal agar tidak crash
-    if not keywords:
-        keywords = ["__nokey__"]
-    vectorizer = TfidfVectorizer().fit(keywords)          # latih TF-IDF dari semua keyword
-    matrix = vectorizer.transform(keywords)               # hasilkan matrix TF-IDF
-    return vectorizer, matrix
-
-# Buat TF-IDF untuk bisa digunakan ke 4 mode
-vec_qa, mat_qa = build_tfidf(kw_qa)
-vec_oli, mat_oli = build_tfidf(kw_oli)
-vec_umum, mat_umum = build_tfidf(kw_umum)
-vec_bis, mat_bis = build_tfidf(kw_bis)
-
-# === Retrieval function ===
-def find_best_keyword_match(question, vectorizer, tfidf_matrix, paragraphs, keywords):
-    q_vec = vectorizer.transform([question])              #  ubah pertanyaan jadi vektor TF-IDF
-    sims = cosine_similarity(q_vec, tfidf_matrix)         #  hitung kesamaan antar keyword
-    best_idx = int(sims.argmax())                         #  ambil index keyword dengan skor tertinggi
-    best_score = float(sims[0, best_idx])                 #  simpan skor kesamaannya
-    best_kw = keywords[best_idx]                          #  ambil keyword terbaik
-    best_para = paragraphs[best_idx]                      #  ambil paragraf yang sesuai
-    return best_para, best_kw, best_score, best_idx       #  kembalikan hasil pencarian
+# Konfigurasi tiap mode tanya-jawab: tag log, sumber data (tabel DB + JSON fallback),
+# dan teks log jika skor di bawah ambang. Katalog baru cukup ditambahkan di sini.
+QA_MODES = {
+    "layanan": {
+        "tag": "MODE1",
+        "table": "qa_service",
+        "json_path": qa_service_path,
+        "skip_answer": "— Tidak dijawab (skor di bawah threshold) —",
+    },
+    "harga_oli": {
+        "tag": "MODE3",
+        "table": "oli_fix",
+        "json_path": oli_fix_path,
+        "skip_answer": "— Tidak dijawab (skor di bawah threshold) —",
+    },
+    "harga_umum_mobil": {
+        "tag": "MODE4",
+        "table": "gabungan_umum",
+        "json_path": gab_umum_path,
+        "skip_answer": "— Tidak dijawab (skor di bawah ambang)",
+    },
+    "harga_umum_bis": {
+        "tag": "MODE5",
+        "table": "gabungan_bis_truk",
+        "json_path": gab_bis_path,
+        "skip_answer": "— Tidak dijawab (skor di bawah ambang) —",
+    },
+}
+
+def load_confidence_thresholds(path=CONFIDENCE_THRESHOLDS_PATH):
+    """Ambang confidence hasil tuning (eval_chatbot.py); file tidak ada → nilai di CONFIG."""
+    if not os.path.exists(path):
+        return
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            tuned = json.load(f)
+        CONFIDENCE_THRESHOLDS.update({m: float(t) for m, t in tuned.items() if m in QA_MODES})
+        print(f"[INFO] Ambang confidence dari {os.path.basename(path)}: {CONFIDENCE_THRESHOLDS}")
+    except (OSError, ValueError, TypeError) as e:
+        print(f"[WARN] Gagal membaca {path}: {e}")
+
+load_confidence_thresholds()
+
+# === Answer cache ===
+class AnswerCache:
+    """
+    Cache LRU + TTL untuk jawaban mentah model (sebelum placeholder diganti harga),
+    jadi perubahan harga di harga_data tetap langsung terlihat.
+    Key: (mode, pertanyaan ter-normalisasi, best_idx, versi dataset).
+    Value: (span jawaban mentah, (mode, index) paragraf yang dipilih setelah rerank top-k).
+    """
+
+    def __init__(self, max_size=1024, ttl_seconds=3600):
+        self.max_size = max_size
+        self.ttl = ttl_seconds
+        self._data = OrderedDict()  # key -> (jawaban, waktu kedaluwarsa)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        item = self._data.get(key)
+        if item is None or item[1] < time.monotonic():
+            if item is not None:
+                del self._data[key]  # sudah kedaluwarsa
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)  # tandai baru dipakai (LRU)
+        self.hits += 1
+        return item[0]
+
+    def put(self, key, answer):
+        self._data[key] = (answer, time.monotonic() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)  # buang yang paling lama tidak dipakai
+            self.evictions += 1
+
+    def invalidate(self, mode=None):
+        """Hapus semua entry (atau hanya yang berasal dari / menjawab dengan paragraf satu mode)."""
+        if mode is None:
+            self._data.clear()
+            return
+        for key in [k for k, (v, _) in self._data.items() if k[0] == mode or v[1][0] == mode]:
+            del self._data[key]
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+answer_cache = AnswerCache(max_size=ANSWER_CACHE_SIZE, ttl_seconds=ANSWER_CACHE_TTL)
+
+class DatasetSnapshot:
+    """Index retrieval gabungan + token context per mode. Diganti utuh saat dataset di-load ulang."""
+
+    def __init__(self, index, context_stores, question_index, precomputed=None, versions=None):
+        self.index = index                    # RetrievalIndex semua mode
+        self.versions = dict(versions or {})  # mode -> versi dataset (kunci answer cache), diisi saat dipasang
+        self.context_stores = context_stores  # mode -> ContextEncodingStore (index lokal per mode)
+        self.question_index = question_index  # mode -> {pertanyaan ternormalisasi: baris}
+        self.precomputed = precomputed or {}  # baris -> PrecomputedAnswer (hash pertanyaan & context masih cocok)
+        self.clusters = {}                    # cluster parafrase -> baris anggotanya
+        for row, entry in self.precomputed.items():
+            self.clusters.setdefault(entry.cluster, []).append(row)
+
+    def with_precomputed(self, precomputed):
+        """Snapshot yang sama dengan tabel precomputed baru (index & token context tidak dibangun ulang)."""
+        return DatasetSnapshot(self.index, self.context_stores, self.question_index, precomputed, self.versions)
+
+    def encoded_context(self, row):
+        return self.context_stores[self.index.mode_of(row)].get(self.index.local_index(row))
+
+def build_question_index(index, mode):
+    """Hash pertanyaan dataset (normalize_text yang sama dengan evaluasi) → baris, untuk jalur cepat tanpa model."""
+    start, end = index.mode_ranges[mode]
+    lookup = {}
+    for r in range(start, end):
+        key = normalize_text(index.questions[r])
+        if key and index.answers[r] and key not in lookup:  # pertanyaan kembar: baris pertama dipakai
+            lookup[key] = r
+    return lookup
+
+def load_precomputed_answers(index, stores):
+    """
+    Cocokkan isi precomputed_answers dengan baris index lewat hash pertanyaan + hash context model.
+    Baris yang pertanyaan/context-nya berubah sejak build terakhir otomatis tidak ikut (dijawab model).
+    """
+    if not (PRECOMPUTED_ANSWERS and conn):
+        return {}
+    with db_lock:
+        table = pa.fetch_precomputed(conn, pa.model_id(finetuned_model_path, QA_BACKEND))
+    if not table:
+        return {}
+    out = {}
+    for mode, (start, end) in index.mode_ranges.items():
+        store = stores[mode]
+        ctx_hashes = [pa.text_hash(t) for t in store.texts]  # sekali per context unik
+        for r in range(start, end):
+            entry = table.get((pa.text_hash(index.questions[r]), ctx_hashes[store.row_slot[r - start]]))
+            if entry is not None:
+                out[r] = entry
+    return out
+
+dataset_snapshot = None  # snapshot aktif; handler mengambil referensinya sekali per pesan
+
+def build_dataset_snapshot(modes, base=None, timings=None):
+    """
+    Baca ulang tabel untuk mode yang berubah, lalu bangun index gabungan + token context baru.
+    Mode lain diambil dari snapshot lama (tanpa query DB / tokenisasi ulang).
+    Aman dijalankan di worker thread: snapshot lama tidak diubah.
+    timings: dict opsional untuk mencatat lama baca dataset, fit TF-IDF dan tokenisasi context.
+    """
+    timings = {} if timings is None else timings
+    index = None
+    if base is None and USE_RETRIEVAL_ARTIFACTS and conn:
+        with startup_stage("artifact_load", timings):
+            with db_lock:
+                signatures = dataset_signatures(conn)
+            if all(signatures.values()):  # semua tabel ada di DB (bukan fallback JSON)
+                index = RetrievalIndex.load(RETRIEVAL_ARTIFACT_DIR, signatures)
+        if index is None:
+            print("[INFO] Artefak index tidak ada / basi, fit ulang TF-IDF")
+
+    if index is None:
+        datasets = {}
+        with startup_stage("dataset_load", timings):
+            for mode, cfg in QA_MODES.items():
+                if mode in modes or base is None or mode not in base.index.mode_ranges:
+                    with db_lock:
+                        datasets[mode] = load_dataset(cfg["table"], cfg["json_path"])
+                else:
+                    datasets[mode] = base.index.export_mode(mode)
+
+        with startup_stage("tfidf_fit", timings):
+            index = RetrievalIndex(datasets)
+        if base is None and USE_RETRIEVAL_ARTIFACTS and conn and all(signatures.values()):
+            with startup_stage("artifact_save", timings):
+                save_retrieval_artifacts(index, signatures)
+    stores = dict(base.context_stores) if base else {}
+    with startup_stage("context_tokenize", timings):
+        for mode in QA_MODES:
+            if mode in modes or mode not in stores:
+                # token id + offset tiap paragraf dihitung sekali di sini, bukan per pertanyaan
+                start, end = index.mode_ranges[mode]
+                stores[mode] = qa_inference.ContextEncodingStore(
+                    tokenizer, [qa_inference.build_model_context(index.keywords[r], index.context(r)) for r in range(start, end)])
+    with startup_stage("question_index", timings):
+        # baris gabungan bisa bergeser saat mode lain di-reload → hash dibangun ulang untuk semua mode (murah)
+        questions = {mode: build_question_index(index, mode) for mode in QA_MODES}
+    with startup_stage("precomputed_load", timings):
+        precomputed = load_precomputed_answers(index, stores)
+    return DatasetSnapshot(index, stores, questions, precomputed)
+
+def save_retrieval_artifacts(index, signatures):
+    """Simpan index ke RETRIEVAL_ARTIFACT_DIR supaya start berikutnya tidak perlu fit ulang."""
+    try:
+        index.save(RETRIEVAL_ARTIFACT_DIR, signatures)
+    except OSError as e:
+        print(f"[WARN] Gagal menyimpan artefak index: {e}")
+
+def build_retrieval_artifacts():
+    """Langkah offline: baca semua tabel dataset, fit TF-IDF, simpan artefak (tanpa load model)."""
+    global RetrievalIndex
+    from retrieval_index import RetrievalIndex
+    if not conn:
+        print("[WARN] DB tidak tersedia, artefak index tidak dibuat")
+        return
+    t0 = time.perf_counter()
+    with db_lock:
+        signatures = dataset_signatures(conn)
+        datasets = {mode: load_dataset(cfg["table"], cfg["json_path"]) for mode, cfg in QA_MODES.items()}
+    index = RetrievalIndex(datasets)
+    index.save(RETRIEVAL_ARTIFACT_DIR, signatures)
+    print(f"✅ Artefak index ({len(index)} baris) disimpan ke {RETRIEVAL_ARTIFACT_DIR} "
+          f"dalam {time.perf_counter() - t0:.2f}s")
+
+def install_dataset_snapshot(snapshot, modes):
+    """Ganti snapshot aktif (satu assignment → atomic), naikkan versi & kosongkan cache mode tsb."""
+    global dataset_snapshot
+    prev = dataset_snapshot.versions if dataset_snapshot is not None else {}
+    snapshot.versions = {**prev, **{mode: prev.get(mode, 0) + 1 for mode in modes}}
+    dataset_snapshot = snapshot
+    for mode in modes:
+        answer_cache.invalidate(mode)
+
+def reload_datasets(modes=None, timings=None):
+    """Load (ulang) dataset untuk mode tertentu (default: semua mode) secara sinkron."""
+    modes = list(modes or QA_MODES)
+    install_dataset_snapshot(build_dataset_snapshot(modes, dataset_snapshot, timings), modes)
+
+def load_components():
+    """
+    Import library berat (torch, transformers, sklearn), load tokenizer + model, lalu bangun
+    index TF-IDF gabungan. Dengan LAZY_STARTUP dijalankan di background setelah polling mulai.
+    """
+    global tokenizer, model, qa_inference, RetrievalIndex
+    with startup_stage("import_ml"):
+        import qa_inference                             # inti inferensi QA (torch)
+        import qa_backend                               # backend model QA: PyTorch fp32 / int8 / ONNX Runtime
+        from transformers import AutoTokenizer          # Tokenizer IndoBERT
+        from retrieval_index import RetrievalIndex      # Satu index TF-IDF (cosine similarity) untuk semua mode
+    with startup_stage("model_load"):
+        tokenizer = AutoTokenizer.from_pretrained(finetuned_model_path)  # Load tokenizer IndoBERT finetuned
+        model = qa_backend.load_qa_model(finetuned_model_path, QA_BACKEND, onnx_model_path) # load model QA sesuai backend
+        model.eval()  # set model ke mode evaluasi (tidak training)
+        wp.set_local_model(tokenizer, model)
+    # Bangun index TF-IDF gabungan untuk semua mode
+    reload_datasets(timings=startup_times)
+    components_ready.set()
+
+if not LAZY_STARTUP:
+    load_components()
+
+# === Hot-reload dataset ===
+def table_signature(conn: sqlite3.Connection, table_name: str):
+    """Hash isi tabel dataset (ukurannya kecil) untuk mendeteksi insert/update/delete."""
+    h = hashlib.sha1()
+    try:
+        cur = conn.execute(f"SELECT id, question, answer, context, keyword FROM {table_name} ORDER BY rowid")
+    except sqlite3.Error:
+        return None
+    for r in cur:
+        h.update(repr(tuple(r)).encode("utf-8"))
+    return h.hexdigest()
+
+def dataset_signatures(conn: sqlite3.Connection):
+    return {mode: table_signature(conn, cfg["table"]) for mode, cfg in QA_MODES.items()}
+
+def db_data_version(conn: sqlite3.Connection) -> int:
+    # berubah setiap ada commit dari koneksi lain (mis. create_database.py)
+    return conn.execute("PRAGMA data_version").fetchone()[0]
+
+class DatasetReloader:
+    """
+    Cek DB tiap beberapa detik. Perubahan harga_data diterapkan ke price_map.
+    Jika tabel dataset suatu mode berubah, bangun snapshot baru
+    di worker thread lalu tukar secara atomic. Pesan yang sedang diproses tetap memakai snapshot lama,
+    dan sesi user tidak hilang karena bot tidak perlu restart.
+    """
+
+    def __init__(self, interval_seconds):
+        self.interval = interval_seconds
+        self.data_version = None
+        self.signatures = {}
+        self.precomputed_version = None
+        self._task = None
+
+    def prime(self):
+        # catat kondisi awal supaya reload pertama hanya terjadi jika benar-benar ada perubahan
+        with db_lock:
+            self.data_version = db_data_version(conn)
+            self.signatures = dataset_signatures(conn)
+            self.precomputed_version = pa.precomputed_version(conn)
+
+    async def check(self):
+        version = await worker_pool.run(db_call, db_data_version, conn)
+        if version == self.data_version:
+            return  # tidak ada commit baru sejak cek terakhir
+        # data_version/signatures baru disimpan setelah semua langkah berhasil: jika ada yang gagal
+        # (mis. DB terkunci), cek berikutnya mengulang perubahan ini, bukan melewatinya
+        updated = await worker_pool.run(db_call, price_map.refresh, conn, get_price_by_placeholder)
+        if updated:
+            print(f"[INFO] Harga diperbarui: {updated} placeholder")
+        signatures = await worker_pool.run(db_call, dataset_signatures, conn)
+        changed = [m for m in QA_MODES if signatures.get(m) != self.signatures.get(m)]
+        if changed:
+            snapshot = await worker_pool.run(build_dataset_snapshot, changed, dataset_snapshot)
+            install_dataset_snapshot(snapshot, changed)
+            print(f"[INFO] Dataset di-reload tanpa restart: {', '.join(changed)}")
+            if USE_RETRIEVAL_ARTIFACTS and all(signatures.values()):
+                await worker_pool.run(save_retrieval_artifacts, snapshot.index, signatures)
+        precomputed_version = await worker_pool.run(db_call, pa.precomputed_version, conn)
+        if precomputed_version != self.precomputed_version:
+            if not changed:  # snapshot baru di atas sudah memuat tabel precomputed terbaru
+                snap = dataset_snapshot
+                precomputed = await worker_pool.run(load_precomputed_answers, snap.index, snap.context_stores)
+                install_dataset_snapshot(snap.with_precomputed(precomputed), [])  # versi & cache tetap
+                print(f"[INFO] Jawaban precomputed dimuat ulang: {len(precomputed)} baris")
+            self.precomputed_version = precomputed_version
+        self.signatures = signatures
+        self.data_version = version
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.check()
+            except Exception as e:
+                print(f"[WARN] Gagal reload dataset: {e}")
+
+    def start(self):
+        if self._task is None:
+            self.prime()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+dataset_reloader = DatasetReloader(DATASET_RELOAD_INTERVAL)
+
+def pick_best_candidate(candidates, preds, w_retrieval, w_span):
+    """
+    Pilih kandidat dengan skor gabungan retrieval + span.
+    Skor span (logit) di-softmax antar kandidat supaya skalanya 0..1 seperti cosine similarity.
+    """
+    span = np.array([p.score for p in preds], dtype=np.float64)
+    if not np.isfinite(span).any():  # tidak ada span valid di semua kandidat → pakai skor retrieval saja
+        span = np.zeros_like(span)
+    else:
+        span = np.exp(span - span[np.isfinite(span)].max())  # skor -inf (tanpa span valid) → 0
+        span /= span.sum()
+    combined = [w_retrieval * sim + w_span * sp for (_, sim), sp in zip(candidates, span)]
+    return int(np.argmax(combined))
+
+# === Metrics ===
+metrics = Metrics(window=METRICS_WINDOW)
+
+def record_model_timings(timings, batch_size):
+    # tahap per batch (bisa berisi pertanyaan dari beberapa mode) dicatat di mode "model"
+    timings = dict(timings)
+    windows = timings.pop("windows", None)  # jumlah baris forward pass (context panjang → >1 window)
+    for stage, sec in timings.items():
+        metrics.record("model", stage, sec)
+    metrics.record_value("model", "batch_size", batch_size)
+    if windows is not None:
+        metrics.record_value("model", "windows", windows)
+
+def metrics_extra():
+    """Info tambahan di file dump metrics."""
+    return {
+        "answer_cache": answer_cache.stats(),
+        "batcher": {"batches": qa_batcher.total_batches, "items": qa_batcher.total_items},
+        "worker_pending": worker_pool.pending,
+        "sessions": len(sessions),
+        "exact_question": exact_question_hit_rate(),
+        "precomputed_rows": len(dataset_snapshot.precomputed) if dataset_snapshot else 0,
+        "startup_s": {k: round(v, 3) for k, v in startup_times.items()},
+    }
 
 # === IndoBERT QA ===
-def answer_question_with_model(question, context):
-    inputs = tokenizer(question, context, return_tensors="pt", truncation=True, max_length=512)  #  encoding
-    with torch.no_grad():                                             #  matikan gradient (evaluasi mode)
-        outputs = model(**inputs)                                     #  forward pass model
-    start_idx = torch.argmax(outputs.start_logits, dim=-1)[0].item()  #  cari posisi awal jawaban
-    end_idx = torch.argmax(outputs.end_logits, dim=-1)[0].item() + 1  #  cari posisi akhir jawaban
-    tokens = inputs["input_ids"][0][start_idx:end_idx]                #  ambil token hasil prediksi
-    return tokenizer.decode(tokens, skip_special_tokens=True).strip() #  decode ke teks jawaban
+def answer_questions_batch(pairs):
+    """Jawab banyak pasangan (question, context) dalam satu forward pass → list QAPrediction."""
+    timings = {}
+    preds = qa_inference.predict_batch(tokenizer, model, pairs, timings=timings)
+    record_model_timings(timings, len(pairs))
+    return preds
+
+async def answer_question_with_model(question, context):
+    """
+    Jawab satu pertanyaan (→ QAPrediction) lewat micro-batcher: pertanyaan yang datang bersamaan
+    (user lain / kandidat context lain) digabung dalam satu forward pass di worker pool.
+    """
+    return await qa_batcher.submit(question, context)
+
+# Executor untuk TF-IDF, SQLite, log & model (thread pool, atau process pool dengan model di tiap worker)
+worker_pool = wp.WorkerPool(
+    kind=EXECUTOR_KIND,
+    workers=EXECUTOR_WORKERS,
+    queue_size=EXECUTOR_QUEUE_SIZE,
+    model_path=finetuned_model_path,
+    backend=QA_BACKEND,
+    onnx_path=onnx_model_path,
+    local_model_fn=answer_questions_batch,
+    on_model_timings=record_model_timings,
+)
+
+# Semua mode QA mengirim pertanyaan ke batcher yang sama → satu forward pass untuk banyak user
+qa_batcher = MicroBatcher(
+    worker_pool.run_model,
+    max_batch_size=BATCH_MAX_SIZE,
+    max_wait_ms=BATCH_MAX_WAIT_MS,
+    max_inflight=EXECUTOR_WORKERS,
+)
 
 # === Logging JSON per baris ===
-def save_chat_log(mode, question, answer, keyword, score, best_idx=None, context_text=None):
-    """Simpan log dalam format JSON per baris agar bisa dievaluasi otomatis"""
+chat_log_sink = ChatLogSink(
+    os.path.dirname(__file__),
+    flush_every=CHATLOG_FLUSH_EVERY,
+    flush_ms=CHATLOG_FLUSH_MS,
+    rotate_bytes=CHATLOG_ROTATE_BYTES,
+    rotate_seconds=CHATLOG_ROTATE_SECONDS,
+    gzip_rotated=CHATLOG_GZIP,
+    run_blocking=worker_pool.run,
+    store=ChatLogStore(DB_PATH, conn=conn, lock=db_lock) if CHATLOG_BACKEND in ("sqlite", "both") and conn else None,
+    write_files=CHATLOG_BACKEND in ("jsonl", "both"),
+)
+
+def save_chat_log(mode, question, answer, keyword, score, best_idx=None, context_text=None,
+                  confidence=None, model_answer=None):
+    """Simpan log dalam format JSON per baris agar bisa dievaluasi otomatis (ditulis di background oleh chat_log_sink)"""
     log_files = {
         "layanan": "chat_log_service.txt",
         "harga_oli": "chat_log_oli.txt",
@@ -244,69 +762,158 @@ def save_chat_log(mode, question, answer, keyword, score, best_idx=None, context
     if not file_name:
         return
 
-    log_path = os.path.join(os.path.dirname(__file__), file_name) # buat path lengkap file log
-
     log_data = {                   # struktur data yang disimpan
         "mode": mode,
         "question": question,
         "prediction": answer,
         "keyword": keyword,
-        "tfidf_score": round(score, 3),
+        "tfidf_score": round(score, 3) if score is not None else None,
         "tfidf_threshold": TFIDF_THRESHOLD,
         "best_index": best_idx,
         "context_used": context_text,
+        "confidence": round(confidence, 4) if confidence is not None else None,  # p(start)*p(end), None = bukan dari model
+        "model_answer": model_answer,  # jawaban model yang ditolak gate confidence (untuk tuning ambang)
     }
-    # simpan log sebagai satu baris JSON per interaksi
-    with open(log_path, "a", encoding="utf-8") as f:
-        f.write(json.dumps(log_data, ensure_ascii=False) + "\n")
+    # satu baris JSON per interaksi; hanya masuk antrean, tidak menunggu disk
+    chat_log_sink.write(file_name, log_data)
 
 # === User state ===
-user_data = {}   # menyimpan mode aktif tiap user dan state tambahan (Menunggu Plat, Menunggu Konfirmasi, dsb.)
+# mode aktif tiap user dan state form keluhan (menunggu plat, menunggu konfirmasi, dsb.)
+sessions = SessionStore(
+    ttl_seconds=SESSION_TTL,
+    max_sessions=SESSION_MAX,
+    conn=conn if SESSION_PERSIST else None,
+    lock=db_lock,
+    flush_interval=SESSION_FLUSH_INTERVAL,
+    run_blocking=worker_pool.run,
+)
+
+# Handler berjalan paralel (CONCURRENT_UPDATES), tapi update dari chat yang sama tetap diproses
+# berurutan: dua "Ya, Buatkan." yang datang bersamaan tidak boleh sama-sama lolos cek STEP_KONFIRMASI.
+_chat_locks = {}  # chat_id -> [asyncio.Lock, jumlah handler yang memakai/menunggu]
+
+def serialize_per_chat(handler):
+    @functools.wraps(handler)
+    async def wrapper(update: Update, context: CallbackContext):
+        chat_id = update.effective_chat.id if update.effective_chat else None
+        entry = _chat_locks.setdefault(chat_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                return await handler(update, context)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:  # tidak ada yang menunggu → buang, supaya dict tidak tumbuh terus
+                del _chat_locks[chat_id]
+    return wrapper
 
 # === Helpers for kartu pekerjaan (antrian) ===
-def count_bookings_on_date(conn: sqlite3.Connection, date_obj: datetime.date) -> int:
-    """
-    Menghitung jumlah booking pada tanggal tertentu. date_obj adalah datetime.date
-    Simpan di DB sebagai ISO date string (YYYY-MM-DD).
+# Tanggal kosong berikutnya dalam satu query (memakai primary key kapasitas_harian):
+# - :mulai sendiri jika belum ada barisnya (belum ada booking sama sekali)
+# - tanggal >= :mulai yang buka dan belum penuh
+# - hari setelah tanggal yang sudah tercatat, jika hari itu belum punya baris
+SQL_SLOT_BERIKUTNYA = """
+SELECT MIN(tanggal) FROM (
+    SELECT :mulai AS tanggal
+     WHERE NOT EXISTS (SELECT 1 FROM kapasitas_harian WHERE tanggal = :mulai)
+    UNION ALL
+    SELECT tanggal FROM kapasitas_harian
+     WHERE tanggal >= :mulai AND tutup <= 0 AND terisi < COALESCE(kapasitas, :kapasitas)
+    UNION ALL
+    SELECT date(k.tanggal, '+1 day') FROM kapasitas_harian k
+     WHERE k.tanggal >= :mulai
+       AND NOT EXISTS (SELECT 1 FROM kapasitas_harian n WHERE n.tanggal = date(k.tanggal, '+1 day'))
+)
+"""
+
+def find_next_free_date(conn: sqlite3.Connection, start_date=None, capacity=KAPASITAS_HARIAN,
+                        closed_weekdays=HARI_TUTUP) -> str:
     """
-    cur = conn.cursor()
-    cur.execute("SELECT COUNT(*) as c FROM kartu_pekerjaan WHERE tanggal_datang = ?", (date_obj.isoformat(),))
-    r = cur.fetchone()
-    # r mungkin None jika tidak ada
-    return r["c"] if r and "c" in r.keys() else (r[0] if r else 0)
+    Tanggal (ISO) pertama mulai start_date (default H+1) yang buka dan masih punya slot.
 
-def schedule_next_available_date_and_position(conn: sqlite3.Connection) -> Tuple[str, int]:
+    Hari libur mingguan (closed_weekdays) selalu dilewati, termasuk tanggal yang sudah punya
+    baris tutup=0 (mis. booking lama sebelum hari itu dijadikan libur). Pengecualian hanya
+    tutup=-1, yang dipasang set_hari_tutup(..., tutup=False) untuk membuka satu tanggal libur.
+    Tanggal libur yang belum punya baris dicatat sebagai tutup=1, jadi jumlah query tidak
+    bergantung pada banyaknya hari yang sudah penuh.
     """
-    Logika:
-    - Mulai dari hari esok (H+1)
-    - Jika hari itu sudah memiliki <5 booking, pakai hari itu dengan nomor_antrian = count+1
-    - Jika >=5, maju 1 hari, ulangi
+    start = (start_date or datetime.now().date() + timedelta(days=1)).isoformat()
+    while True:
+        tanggal = conn.execute(SQL_SLOT_BERIKUTNYA, {"mulai": start, "kapasitas": capacity}).fetchone()[0]
+        hari = datetime.fromisoformat(tanggal).date()
+        if hari.weekday() not in closed_weekdays:
+            return tanggal
+        r = conn.execute("SELECT tutup FROM kapasitas_harian WHERE tanggal = ?", (tanggal,)).fetchone()
+        if r is not None and r[0] < 0:  # dibuka khusus walau hari libur mingguan
+            return tanggal
+        if r is None:
+            conn.execute("INSERT INTO kapasitas_harian (tanggal, tutup) VALUES (?, 1)", (tanggal,))
+        start = (hari + timedelta(days=1)).isoformat()  # lanjut dari hari berikutnya, jangan ulang tanggal yang sama
+
+def reserve_slot(conn: sqlite3.Connection) -> Tuple[str, int]:
+    """
+    Pesan satu slot: cari tanggal kosong lalu naikkan terisi. Harus dipanggil di dalam
+    transaksi (BEGIN IMMEDIATE) supaya dua konfirmasi tidak mendapat nomor yang sama.
     Return: (tanggal_datang_iso_str, nomor_antrian)
     """
-    day = datetime.now().date() + timedelta(days=1)
-    while True:
-        c = count_bookings_on_date(conn, day)
-        if c < 5:
-            return day.isoformat(), c + 1
-        day = day + timedelta(days=1)
+    tanggal = find_next_free_date(conn)
+    conn.execute("""
+        INSERT INTO kapasitas_harian (tanggal, terisi) VALUES (?, 1)
+        ON CONFLICT(tanggal) DO UPDATE SET terisi = terisi + 1
+    """, (tanggal,))
+    nomor = conn.execute("SELECT terisi FROM kapasitas_harian WHERE tanggal = ?", (tanggal,)).fetchone()[0]
+    return tanggal, nomor
+
+def set_hari_tutup(conn: sqlite3.Connection, tanggal_iso: str, tutup: bool = True, kapasitas=None):
+    """
+    Tandai tanggal tertentu tutup/buka, opsional dengan kapasitas khusus (mis. setengah hari).
+    Baris per tanggal mengalahkan HARI_TUTUP: tutup=False pada hari libur mingguan membuka tanggal itu.
+    """
+    conn.execute("""
+        INSERT INTO kapasitas_harian (tanggal, tutup, kapasitas) VALUES (?, ?, ?)
+        ON CONFLICT(tanggal) DO UPDATE SET tutup = excluded.tutup, kapasitas = excluded.kapasitas
+    """, (tanggal_iso, 1 if tutup else -1, kapasitas))
+    conn.commit()
 
-def insert_kartu_pekerjaan(conn: sqlite3.Connection, nama, merek, jenis, plat, keluhan, tanggal_input, tanggal_datang, nomor_antrian, status="Menunggu"):
+def insert_kartu_pekerjaan(conn: sqlite3.Connection, nama, merek, jenis, plat, keluhan, tanggal_input, tanggal_datang, nomor_antrian, status="Menunggu", commit=True):
     """
     tanggal_input: ISO string (YYYY-MM-DD atau datetime iso)
     tanggal_datang: ISO string (YYYY-MM-DD)
+    commit=False jika dipanggil di dalam transaksi yang lebih besar (create_kartu_pekerjaan)
     """
-    cur = conn.cursor()
-    cur.execute("""
-        INSERT INTO kartu_pekerjaan (Nama_pengirim, Merek_mobil, Jenis_mobil, Plat_nomor, Keluhan, tanggal_input, tanggal_datang, nomor_antrian, status)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (nama, merek, jenis, plat, keluhan, tanggal_input, tanggal_datang, nomor_antrian, status))
-    conn.commit()
+    cur = conn.execute(SQL_INSERT_KARTU, (nama, merek, jenis, plat, keluhan, tanggal_input, tanggal_datang, nomor_antrian, status))
+    if commit:
+        conn.commit()
     return cur.lastrowid
 
 def fetch_kartu_by_id(conn: sqlite3.Connection, id_kartu: int):
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM kartu_pekerjaan WHERE id_kartu = ?", (id_kartu,))
-    return cur.fetchone()
+    return conn.execute(SQL_KARTU_BY_ID, (id_kartu,)).fetchone()
+
+def create_kartu_pekerjaan(conn: sqlite3.Connection, nama, merek, jenis, plat, keluhan, tanggal_input):
+    """
+    Jadwalkan, simpan, lalu ambil ulang kartu pekerjaan dalam satu langkah.
+    Pemesanan slot + insert berada dalam satu transaksi BEGIN IMMEDIATE, jadi aman juga
+    terhadap proses lain yang memakai bengkel.db (bukan hanya thread di bot ini).
+    """
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN IMMEDIATE")  # kunci tulis sejak awal: tidak ada dua pemesan membaca slot yang sama
+    try:
+        # Tentukan jadwal & nomor antrean (tanggal_datang adalah ISO date 'YYYY-MM-DD')
+        tanggal_datang_iso, nomor_antrian = reserve_slot(conn)
+
+        # Simpan ke DB (tanggal_input dan tanggal_datang sebagai string ISO)
+        id_kartu = insert_kartu_pekerjaan(
+            conn, nama, merek, jenis, plat, keluhan,
+            tanggal_input, tanggal_datang_iso, nomor_antrian, status="Menunggu", commit=False
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    # Ambil ulang dari DB untuk memastikan valid
+    return fetch_kartu_by_id(conn, id_kartu)
 
 # === Build Inline Keyboard for /start ===
 def build_start_keyboard():
@@ -329,6 +936,7 @@ async def start(update: Update, context: CallbackContext):
     )
 
 # CallbackQuery handler (untuk inline buttons)
+@serialize_per_chat
 async def callback_query_handler(update: Update, context: CallbackContext):
     query = update.callback_query
     await query.answer()
@@ -337,7 +945,7 @@ async def callback_query_handler(update: Update, context: CallbackContext):
     chat_id = query.message.chat.id
     # map callback_data ke mode
     if data == "mode_1":
-        user_data[chat_id] = {"mode": "layanan"}
+        sessions.start(chat_id, "layanan")
         await query.message.reply_text(
             "Berikut merupakan layanan yang tersedia di Bengkel D. Maju Jaya:\n"
             "- Ganti Ban\n"
@@ -355,7 +963,7 @@ async def callback_query_handler(update: Update, context: CallbackContext):
         return
 
     if data == "mode_2":
-        user_data[chat_id] = {"mode": "keluhan"}
+        sessions.start(chat_id, "keluhan")
         # Kirim template langsung supaya user tinggal isi
         template = (
             "Silakan isi template berikut (salin & isi di kotak chat lalu kirim):\n\n"
@@ -369,7 +977,7 @@ async def callback_query_handler(update: Update, context: CallbackContext):
         return
 
     if data == "mode_3":
-        user_data[chat_id] = {"mode": "harga_oli"}
+        sessions.start(chat_id, "harga_oli")
         await query.message.reply_text(
             "🛢️ Layanan Tanya Harga Oli — kategori tersedia:\n"
             "- Castrol\n"
@@ -384,20 +992,202 @@ async def callback_query_handler(update: Update, context: CallbackContext):
         return
 
     if data == "mode_4":
-        user_data[chat_id] = {"mode": "harga_umum_mobil"}
+        sessions.start(chat_id, "harga_umum_mobil")
         await query.message.reply_text(
             "💬 Mode 4 — Tanya harga barang/jasa umum untuk kategori *Mobil*.\nSilakan ketik pertanyaan Anda."
         )
         return
 
     if data == "mode_5":
-        user_data[chat_id] = {"mode": "harga_umum_bis"}
+        sessions.start(chat_id, "harga_umum_bis")
         await query.message.reply_text(
             "🚌 Mode 5 — Tanya harga barang/jasa umum untuk kategori *Bis/Truk*.\nSilakan ketik pertanyaan Anda."
         )
         return
 
+# === Jawab pertanyaan untuk mode QA (1, 3, 4, 5) ===
+LOW_CONFIDENCE_REPLY = ("Maaf, saya belum menemukan jawaban yang pasti untuk pertanyaan itu. "
+                        "Coba tanyakan dengan kata lain atau hubungi admin bengkel.")
+LOW_CONFIDENCE_LOG = "— Tidak dijawab (confidence model rendah) —"
+
+def near_exact_match(index, question, candidates):
+    """
+    Baris dataset yang pertanyaannya hampir sama persis dengan pertanyaan user (atau None).
+    Dicek semua baris yang ber-context sama dengan kandidat, bukan hanya baris yang lolos dedup context.
+    """
+    q = normalize_text(question)
+    for cand, _ in candidates:
+        for row in index.rows_with_context(cand):
+            stored = normalize_text(index.questions[row])
+            if stored and index.answers[row] and difflib.SequenceMatcher(None, q, stored).ratio() >= NEAR_EXACT_RATIO:
+                return row
+    return None
+
+async def answer_exact_question(update: Update, mode: str, text: str) -> bool:
+    """
+    Jalur cepat: pertanyaan yang sama persis (setelah normalize_text) dengan pertanyaan dataset
+    dijawab langsung dari kolom answer + harga placeholder, tanpa TF-IDF maupun IndoBERT.
+    Return False jika tidak ada di index (lanjut ke jalur biasa).
+    """
+    snap = dataset_snapshot
+    if snap is None or not EXACT_QUESTION_FASTPATH:
+        return False
+    row = snap.question_index.get(mode, {}).get(normalize_text(text))
+    if row is None:
+        metrics.incr("exact_question", "miss")
+        return False
+    trace = metrics.trace(mode)
+    metrics.incr("exact_question", "hit")
+    with trace.stage("exact_lookup"):
+        ans_with_price = price_map.expand(snap.index.answers[row])
+    with trace.stage("send"):
+        await update.message.reply_text(f"💬 {ans_with_price}")
+    with trace.stage("log"):
+        save_chat_log(mode, text, ans_with_price, snap.index.keywords[row], None, snap.index.local_index(row),
+                      snap.encoded_context(row).text)  # skor TF-IDF None: retrieval tidak dijalankan
+    trace.finish()
+    return True
+
+def exact_question_hit_rate():
+    counters = metrics.snapshot().get("exact_question", {}).get("counters", {})
+    hit, miss = counters.get("hit", 0), counters.get("miss", 0)
+    return {"hit": hit, "miss": miss, "hit_rate": round(hit / (hit + miss), 4) if hit + miss else 0.0}
+
+def match_precomputed(snap, question, candidates):
+    """
+    Cari pertanyaan dataset yang mirip (parafrase) di cluster kandidat retrieval.
+    Return (baris, PrecomputedAnswer) ber-confidence tertinggi di cluster tsb (atau None).
+    """
+    if not snap.precomputed:
+        return None
+    q = normalize_text(question)
+    best_ratio, best_cluster = PARAPHRASE_RATIO, None
+    seen = set()
+    for row, _ in candidates:
+        entry = snap.precomputed.get(row)
+        if entry is None or entry.cluster in seen:
+            continue
+        seen.add(entry.cluster)
+        for member in snap.clusters[entry.cluster]:
+            ratio = difflib.SequenceMatcher(None, q, normalize_text(snap.index.questions[member])).ratio()
+            if ratio >= best_ratio:
+                best_ratio, best_cluster = ratio, entry.cluster
+    if best_cluster is None:
+        return None
+    best_row = max(snap.clusters[best_cluster], key=lambda r: snap.precomputed[r].confidence)
+    return best_row, snap.precomputed[best_row]
+
+async def answer_qa_mode(update: Update, mode: str, text: str):
+    cfg = QA_MODES[mode]
+    if await answer_exact_question(update, mode, text):
+        return
+    if not components_ready.is_set():  # LAZY_STARTUP: model / index masih di-load
+        if components_error is not None:
+            await update.message.reply_text("⚠️ Maaf, layanan tanya-jawab sedang tidak tersedia.")
+        else:
+            await update.message.reply_text("⏳ Bot sedang menyiapkan model, silakan kirim ulang pertanyaan beberapa saat lagi.")
+        return
+    trace = metrics.trace(mode)
+    snap = dataset_snapshot   # pakai satu snapshot sampai pesan selesai dijawab
+    index = snap.index
+    topk = TOPK_CONFIG.get(mode, TOPK_DEFAULT)
+    with trace.stage("retrieval"):
+        candidates = await worker_pool.run(index.search, text, mode, topk["k"])
+        if SEARCH_EVERYWHERE_FALLBACK and (not candidates or candidates[0][1] < TFIDF_THRESHOLD):
+            everywhere = await worker_pool.run(index.search_everywhere, text, topk["k"])
+            if everywhere and (not candidates or everywhere[0][1] > candidates[0][1]):
+                candidates = everywhere
+
+    row, score = candidates[0] if candidates else (None, 0.0)
+    kw = index.keywords[row] if row is not None else ""
+    idx = index.local_index(row) if row is not None else None
+    print(f"[{cfg['tag']}] Q: {text}\nBest KW: {kw} | Score={score:.3f}")
+
+    match = near_exact_match(index, text, candidates)
+    if match is not None:  # pertanyaan sudah ada di dataset → jawaban tersimpan, tanpa forward pass
+        with trace.stage("placeholder"):
+            ans_with_price = price_map.expand(index.answers[match])
+        with trace.stage("send"):
+            await update.message.reply_text(f"💬 {ans_with_price}")
+        with trace.stage("log"):
+            save_chat_log(mode, text, ans_with_price, index.keywords[match], score, index.local_index(match),
+                          snap.encoded_context(match).text)
+        metrics.incr(mode, "dataset_match")
+        trace.finish()
+        return
+
+    if score < TFIDF_THRESHOLD: # jika skor di bawah ambang
+        with trace.stage("send"):
+            await update.message.reply_text("Maaf, pertanyaan tidak dapat dipahami.")
+        save_chat_log(mode, text, cfg["skip_answer"], kw, score, idx, None) # simpan log
+        metrics.incr(mode, "skipped")
+        trace.finish()
+        return
+
+    row_mode = index.mode_of(row)
+    if row_mode != mode:
+        print(f"[{cfg['tag']}] Fallback ke katalog: {row_mode}")
+    candidates = [c for c in candidates if c[1] >= TFIDF_THRESHOLD]  # kandidat lemah tidak ikut dijawab
+
+    matched = match_precomputed(snap, text, candidates)
+    pre_row, pre = matched if matched is not None else (None, None)
+    if pre is not None and pre.answer and pre.confidence >= CONFIDENCE_THRESHOLDS.get(mode, CONFIDENCE_DEFAULT):
+        # parafrase pertanyaan dataset → jawaban model yang sudah dihitung offline, tanpa forward pass
+        with trace.stage("placeholder"):
+            ans_with_price = price_map.expand(pre.answer)
+        with trace.stage("send"):
+            await update.message.reply_text(f"💬 {ans_with_price}")
+        with trace.stage("log"):  # log baris yang jawabannya dipakai, bukan kandidat teratas
+            pre_score = next((sc for r, sc in candidates if r == pre_row), score)
+            save_chat_log(mode, text, ans_with_price, index.keywords[pre_row], pre_score,
+                          index.local_index(pre_row), snap.encoded_context(pre_row).text, pre.confidence)
+        metrics.incr(mode, "precomputed")
+        trace.finish()
+        return
+    cache_key = (mode, normalize_text(text), (row_mode, idx), snap.versions[row_mode])  # versi dari snapshot yang dipakai menjawab
+    cached = answer_cache.get(cache_key)                           #  pertanyaan yang sama → tanpa forward pass
+    if cached is None:
+        # semua kandidat dikirim bersamaan → masuk ke batch yang sama di batcher
+        with trace.stage("model"):  # tunggu batch + tokenize + forward + decode (rinciannya di mode "model")
+            preds = await asyncio.gather(*[answer_question_with_model(text, snap.encoded_context(r)) for r, _ in candidates])
+        best = pick_best_candidate(candidates, preds, topk["w_retrieval"], topk["w_span"]) if len(candidates) > 1 else 0
+        best_row = candidates[best][0]
+        cached = (preds[best].answer, (index.mode_of(best_row), index.local_index(best_row)), preds[best].prob)
+        answer_cache.put(cache_key, cached)
+    else:
+        metrics.incr(mode, "cache_hit")
+    ans, chosen, confidence = cached
+    chosen_row = index.row_of(*chosen)
+    if chosen_row != row:  # rerank memilih paragraf lain
+        row, score = next((c for c in candidates if c[0] == chosen_row), (chosen_row, score))
+        kw, idx = index.keywords[row], index.local_index(row)
+        print(f"[{cfg['tag']}] Rerank → KW: {kw} | Score={score:.3f}")
+    metrics.record_value(mode, "confidence", confidence)
+
+    if not ans or confidence < CONFIDENCE_THRESHOLDS.get(mode, CONFIDENCE_DEFAULT):
+        # model tidak yakin: jangan kirim span asal-asalan; lookup harga & context log dilewati
+        print(f"[{cfg['tag']}] Confidence rendah ({confidence:.3f}) → tidak dijawab")
+        with trace.stage("send"):
+            await update.message.reply_text(LOW_CONFIDENCE_REPLY)
+        save_chat_log(mode, text, LOW_CONFIDENCE_LOG, kw, score, idx, None, confidence, ans)
+        metrics.incr(mode, "low_confidence")
+        trace.finish()
+        return
+
+    ctx = snap.encoded_context(row).text                           #  "Keyword terkait: {kw}. {context}"
+
+    # replace placeholder(s) di jawaban dengan harga dari harga_data (di memori, tanpa query DB)
+    with trace.stage("placeholder"):
+        ans_with_price = price_map.expand(ans)
+
+    with trace.stage("send"):
+        await update.message.reply_text(f"💬 {ans_with_price}")
+    with trace.stage("log"):
+        save_chat_log(mode, text, ans_with_price, kw, score, idx, ctx, confidence)
+    trace.finish()
+
 # === Message handler ===
+@serialize_per_chat
 async def handle_message(update: Update, context: CallbackContext):
     chat_id = update.message.chat.id     # ambil ID user
     text = update.message.text.strip()   #  ambil teks pesan user
@@ -405,7 +1195,7 @@ async def handle_message(update: Update, context: CallbackContext):
     # === support: if user types /start again, show keyboard (handled by command) ===
     # === MENU PILIHAN via numeric typing (tetap didukung seperti sebelumnya) ===
     if text == "1":
-        user_data[chat_id] = {"mode": "layanan"}            # set mode user ke "layanan"
+        sessions.start(chat_id, "layanan")            # set mode user ke "layanan"
         await update.message.reply_text(                     # menampilkan daftar layanan
             "Berikut merupakan layanan yang tersedia di Bengkel D. Maju Jaya:\n"
             "- Service Ban\n"
@@ -423,7 +1213,7 @@ async def handle_message(update: Update, context: CallbackContext):
         return
 
     if text == "2":
-        user_data[chat_id] = {"mode": "keluhan"}
+        sessions.start(chat_id, "keluhan")
         # Kirim template langsung supaya user tinggal isi
         template = (
             "Silakan isi template berikut (salin & isi di kotak chat lalu kirim):\n\n"
@@ -437,7 +1227,7 @@ async def handle_message(update: Update, context: CallbackContext):
         return
 
     if text == "3":
-        user_data[chat_id] = {"mode": "harga_oli"}
+        sessions.start(chat_id, "harga_oli")
         await update.message.reply_text(
             "🛢️ Layanan Tanya Harga Oli — kategori tersedia:\n"
             "- Castrol\n"
@@ -452,111 +1242,24 @@ async def handle_message(update: Update, context: CallbackContext):
         return
 
     if text == "4":
-        user_data[chat_id] = {"mode": "harga_umum_mobil"}
+        sessions.start(chat_id, "harga_umum_mobil")
         await update.message.reply_text(
             "💬 Mode 4 — Tanya harga barang/jasa umum untuk kategori *Mobil*.\nSilakan ketik pertanyaan Anda."
         )
         return
 
     if text == "5":
-        user_data[chat_id] = {"mode": "harga_umum_bis"}
+        sessions.start(chat_id, "harga_umum_bis")
         await update.message.reply_text(
             "🚌 Mode 5 — Tanya harga barang/jasa umum untuk kategori *Bis/Truk*.\nSilakan ketik pertanyaan Anda."
         )
         return
 
-    # === MODE 1: Layanan ===
-    if chat_id in user_data and user_data[chat_id].get("mode") == "layanan":
-        para, kw, score, idx = find_best_keyword_match(text, vec_qa, mat_qa, para_qa, kw_qa)
-        print(f"[MODE1] Q: {text}\nBest KW: {kw} | Score={score:.3f}")
-
-        if score < TFIDF_THRESHOLD: # jika skor di bawah ambang
-            ans = "— Tidak dijawab (skor di bawah threshold) —"
-            await update.message.reply_text("Maaf, pertanyaan tidak dapat dipahami.")
-            save_chat_log("layanan", text, ans, kw, score, idx, None) # simpan log
-            return
-
-        ctx = f"Keyword terkait: {kw}. {para.get('context','')}"       #  ambil context teks
-        ans = answer_question_with_model(text, ctx)                    #  jawab pakai IndoBERT
-
-        ans = replace_placeholders_in_text(conn, ans)
-
-        # -----------------------------
-        # NOTE: untuk mode layanan (mode 1) TIDAK melakukan placeholder replacement,
-        # karena data layanan umumnya tidak mengandung placeholder harga.
-        # Jika ada placeholder di context/answer untuk mode 1, dan ingin diganti,
-        # kita bisa tambahkan replace_placeholders_in_text(conn, ans) — beri tahu saya.
-        # -----------------------------
-
-        await update.message.reply_text(f"💬 {ans or 'Maaf, belum ada jawaban yang sesuai.'}")
-        save_chat_log("layanan", text, ans, kw, score, idx, ctx)
-        return
-
-    # === MODE 3: Harga Oli ===
-    if chat_id in user_data and user_data[chat_id].get("mode") == "harga_oli":
-        para, kw, score, idx = find_best_keyword_match(text, vec_oli, mat_oli, para_oli, kw_oli)
-        print(f"[MODE3] Q: {text}\nBest KW: {kw} | Score={score:.3f}")
-
-        if score < TFIDF_THRESHOLD:
-            ans = "— Tidak dijawab (skor di bawah threshold) —"
-            await update.message.reply_text("Maaf, pertanyaan tidak dapat dipahami.")
-            save_chat_log("harga_oli", text, ans, kw, score, idx, None)
-            return
-
-        ctx = f"Keyword terkait: {kw}. {para.get('context','')}"
-        ans = answer_question_with_model(text, ctx)
-
-        # ====== PATCH: replace placeholder(s) in ans using harga_data table ======
-        # jika ans mengandung {{placeholder}} -> ganti tiap placeholder dengan nilai dari DB
-        ans_with_price = replace_placeholders_in_text(conn, ans) if conn else ans
-        # =======================================================================
-
-        await update.message.reply_text(f"💬 {ans_with_price or 'Maaf, belum ada jawaban yang sesuai.'}")
-        save_chat_log("harga_oli", text, ans_with_price, kw, score, idx, ctx)
-        return
-
-    # === MODE 4: Umum Mobil ===
-    if chat_id in user_data and user_data[chat_id].get("mode") == "harga_umum_mobil":
-        para, kw, score, idx = find_best_keyword_match(text, vec_umum, mat_umum, para_umum, kw_umum)
-        print(f"[MODE4] Q: {text}\nBest KW: {kw} | Score={score:.3f}")
-
-        if score < TFIDF_THRESHOLD:
-            ans = "— Tidak dijawab (skor di bawah ambang)" 
-            await update.message.reply_text("Maaf, pertanyaan tidak dapat dipahami.")
-            save_chat_log("harga_umum_mobil", text, ans, kw, score, idx, None)
-            return
-
-        ctx = f"Keyword terkait: {kw}. {para.get('context','')}"
-        ans = answer_question_with_model(text, ctx)
-
-        # ====== PATCH: replace placeholder(s) in ans using harga_data table ======
-        ans_with_price = replace_placeholders_in_text(conn, ans) if conn else ans
-        # =======================================================================
-
-        await update.message.reply_text(f"💬 {ans_with_price or 'Maaf, belum ada jawaban yang sesuai.'}")
-        save_chat_log("harga_umum_mobil", text, ans_with_price, kw, score, idx, ctx)
-        return
-
-    # === MODE 5: Umum Bis/Truk ===
-    if chat_id in user_data and user_data[chat_id].get("mode") == "harga_umum_bis":
-        para, kw, score, idx = find_best_keyword_match(text, vec_bis, mat_bis, para_bis, kw_bis)
-        print(f"[MODE5] Q: {text}\nBest KW: {kw} | Score={score:.3f}")
-
-        if score < TFIDF_THRESHOLD:
-            ans = "— Tidak dijawab (skor di bawah ambang) —"
-            await update.message.reply_text("Maaf, pertanyaan tidak dapat dipahami.")
-            save_chat_log("harga_umum_bis", text, ans, kw, score, idx, None)
-            return
-
-        ctx = f"Keyword terkait: {kw}. {para.get('context','')}"
-        ans = answer_question_with_model(text, ctx)
-
-        # ====== PATCH: replace placeholder(s) in ans using harga_data table ======
-        ans_with_price = replace_placeholders_in_text(conn, ans) if conn else ans
-        # =======================================================================
-
-        await update.message.reply_text(f"💬 {ans_with_price or 'Maaf, belum ada jawaban yang sesuai.'}")
-        save_chat_log("harga_umum_bis", text, ans_with_price, kw, score, idx, ctx)
+    # === MODE 1, 3, 4, 5: tanya-jawab (TF-IDF + IndoBERT) ===
+    sess = await sessions.get(chat_id)
+    mode = sess.mode if sess else None
+    if mode in QA_MODES:
+        await answer_qa_mode(update, mode, text)
         return
 
     # === MODE 2: Keluhan (Kartu Pekerjaan) ===
@@ -565,37 +1268,32 @@ async def handle_message(update: Update, context: CallbackContext):
     # 2) User mengirim filled template -> bot langsung meminta nomor plat (Menunggu Plat = True)
     # 3) User kirim plat -> bot menyimpan Plat, lalu meminta konfirmasi "Ya, Buatkan." (Menunggu Konfirmasi = True)
     # 4) Jika user konfirmasi Ya, Buatkan. -> bot schedule booking, insert ke DB, kirim ringkasan ke admin, kirim konfirmasi ke user (mengambil data dari DB)
-    if chat_id in user_data and user_data[chat_id].get("mode") == "keluhan":
+    if mode == "keluhan":
         # normalize text for checks but keep original for storage
         text_lower = text.lower()
 
         # === Jika sedang menunggu konfirmasi "Ya, Buatkan." ===
-        if user_data[chat_id].get("MenungguKonfirmasi"):
+        if sess.step == STEP_KONFIRMASI:
             if text_lower.replace(",", "").replace(".", "").strip() in ["ya buatkan", "ya, buatkan", "ya buatkan."]:
                 
                 if not conn:
                     await update.message.reply_text("⚠️ Maaf, terjadi kesalahan server (database tidak tersedia).")
                     return
 
-                data_state = user_data[chat_id]
-                nama = data_state.get("Nama")
-                merek = data_state.get("Merek Mobil")
-                jenis = data_state.get("Jenis Mobil")
-                plat = data_state.get("Plat No")
-                keluhan = data_state.get("Keluhan")
+                nama = sess.nama
+                merek = sess.merek
+                jenis = sess.jenis
+                plat = sess.plat
+                keluhan = sess.keluhan
                 tanggal_input = datetime.now().isoformat()  # simpan datetime ISO agar lengkap
 
-                # Tentukan jadwal & nomor antrean (tanggal_datang adalah ISO date 'YYYY-MM-DD')
-                tanggal_datang_iso, nomor_antrian = schedule_next_available_date_and_position(conn)
-
-                # Simpan ke DB (tanggal_input dan tanggal_datang sebagai string ISO)
-                id_kartu = insert_kartu_pekerjaan(
-                    conn, nama, merek, jenis, plat, keluhan,
-                    tanggal_input, tanggal_datang_iso, nomor_antrian, status="Menunggu"
-                )
-
-                # Ambil ulang dari DB untuk memastikan valid
-                rec = fetch_kartu_by_id(conn, id_kartu)
+                trace = metrics.trace("keluhan")
+                # Jadwal + insert + ambil ulang dijalankan di worker thread dengan koneksi milik thread tsb
+                with trace.stage("db_insert"):
+                    rec = await worker_pool.run(
+                        db_pool.run, create_kartu_pekerjaan,
+                        nama, merek, jenis, plat, keluhan, tanggal_input
+                    )
 
                 # === Kirim ke Admin ===
                 invoice = (
@@ -610,23 +1308,26 @@ async def handle_message(update: Update, context: CallbackContext):
                     f"Nomor Antrian : {rec['nomor_antrian']}\n"
                     f"Status        : {rec['status']}"
                 )
-                await context.bot.send_message(chat_id=ADMIN_CHAT_ID, text=invoice)
+                with trace.stage("send_admin"):
+                    await context.bot.send_message(chat_id=ADMIN_CHAT_ID, text=invoice)
 
                 # === Kirim Konfirmasi ke User ===
                 tanggal = rec["tanggal_datang"]
                 antrian = rec["nomor_antrian"]
 
                 # gunakan parse_mode agar tanda *tebal* bekerja; pastikan string di bawah tertutup rapi
-                await update.message.reply_text(
-                    f"✅ Keluhan berhasil dicatat!\n\n"
-                    f"📅 *Tanggal datang:* {tanggal}\n"
-                    f"🔢 *Nomor antrean:* {antrian}\n\n"
-                    "Silakan membawa kendaraan Anda sesuai jadwal tersebut ya 😊",
-                    parse_mode="Markdown"
-                )
+                with trace.stage("send"):
+                    await update.message.reply_text(
+                        f"✅ Keluhan berhasil dicatat!\n\n"
+                        f"📅 *Tanggal datang:* {tanggal}\n"
+                        f"🔢 *Nomor antrean:* {antrian}\n\n"
+                        "Silakan membawa kendaraan Anda sesuai jadwal tersebut ya 😊",
+                        parse_mode="Markdown"
+                    )
+                trace.finish()
 
                 # Selesai → reset state
-                del user_data[chat_id]
+                sessions.drop(chat_id)
                 return
             
             else:
@@ -637,19 +1338,17 @@ async def handle_message(update: Update, context: CallbackContext):
                 return
 
         # jika sedang menunggu plat
-        if user_data[chat_id].get("Menunggu Plat"):
+        if sess.step == STEP_PLAT:
             # treat this message as plat
-            user_data[chat_id]["Plat No"] = text.strip()
+            sess.plat = text.strip()
             # setelah plat, minta konfirmasi
-            user_data[chat_id]["MenungguKonfirmasi"] = True
-            # jangan hapus Menunggu Plat sebab flow sudah selesai tapi kita bisa del
-            if "Menunggu Plat" in user_data[chat_id]:
-                del user_data[chat_id]["Menunggu Plat"]
+            sess.step = STEP_KONFIRMASI
+            sessions.save(sess)
             await update.message.reply_text("Apakah Anda ingin saya buatkan kartu pekerjaan sekarang? Jika ya ketik: Ya, Buatkan.")
             return
 
         # jika belum mengisi template (pertama kali), bot akan mencoba parse template
-        if "Nama" not in user_data[chat_id]:
+        if sess.nama is None:
             # parsing yang diharapkan: 4 baris dengan format "Nama: nilai"
             lines = text.split("\n")
             # menerima varian: jika user copy paste template but leaves blank, still require filled entries
@@ -662,12 +1361,13 @@ async def handle_message(update: Update, context: CallbackContext):
             # cek apakah keempat field ada
             if all(k in parsed for k in ["nama", "merek mobil", "jenis mobil", "keluhan"]):
                 # simpan state
-                user_data[chat_id]["Nama"] = parsed["nama"]
-                user_data[chat_id]["Merek Mobil"] = parsed["merek mobil"]
-                user_data[chat_id]["Jenis Mobil"] = parsed["jenis mobil"]
-                user_data[chat_id]["Keluhan"] = parsed["keluhan"]
+                sess.nama = parsed["nama"]
+                sess.merek = parsed["merek mobil"]
+                sess.jenis = parsed["jenis mobil"]
+                sess.keluhan = parsed["keluhan"]
                 # setelah mengisi template, langsung minta plat (sesuai flow yang diminta)
-                user_data[chat_id]["Menunggu Plat"] = True
+                sess.step = STEP_PLAT
+                sessions.save(sess)
                 await update.message.reply_text("Terima kasih. Silakan kirim nomor plat kendaraan:")
             else:
                 await update.message.reply_text("⚠️ Format tidak dikenali. Pastikan mengisi template seperti:\n\nNama: <nama>\nMerek Mobil: <merek>\nJenis Mobil: <jenis>\nKeluhan: <isi keluhan>\n\n")
@@ -676,17 +1376,224 @@ async def handle_message(update: Update, context: CallbackContext):
     # jika tidak cocok dengan mode apapun
     await update.message.reply_text("Silakan pilih 1–5, klik tombol pada /start, atau ketik /start untuk mulai kembali.")
 
+# === /stats (khusus admin) ===
+async def stats_command(update: Update, context: CallbackContext):
+    if str(update.effective_chat.id) != str(ADMIN_CHAT_ID):
+        return  # user biasa tidak mendapat balasan
+    extra = metrics_extra()
+    report = (
+        metrics.format_report()
+        + f"\n\nCache jawaban: {extra['answer_cache']}"
+        + f"\nBatch model: {extra['batcher']['items']} pertanyaan / {extra['batcher']['batches']} batch"
+        + f"\nPekerjaan di worker: {extra['worker_pending']} | Sesi aktif: {extra['sessions']}"
+        + f"\nPertanyaan persis dataset: {extra['exact_question']['hit']} hit / "
+          f"{extra['exact_question']['miss']} miss ({extra['exact_question']['hit_rate'] * 100:.1f}%)"
+    )
+    await update.message.reply_text(report[:4000])  # batas panjang pesan Telegram 4096
+
 # === Run bot ===
-def main():
-    app = Application.builder().token(TOKEN).build() #  inisialisasi bot
+async def load_components_background():
+    global components_error
+    try:
+        await asyncio.to_thread(load_components)  # thread terpisah: handler /start & menu tetap jalan
+    except Exception as e:
+        components_error = e
+        print(f"[WARN] Gagal load model/dataset: {e}")
+        return
+    print(f"[INFO] Model & index siap. Waktu startup: {format_startup_report()}")
+    if conn and DATASET_RELOAD_INTERVAL > 0:
+        dataset_reloader.start()  # pantau perubahan tabel dataset di background
+
+async def on_startup(app: Application):
+    sessions.start_flusher()  # tulis perubahan sesi ke DB secara berkala
+    metrics.start_dumper(METRICS_DUMP_PATH, METRICS_DUMP_INTERVAL, metrics_extra)
+    if components_ready.is_set():
+        print(f"[INFO] Waktu startup: {format_startup_report()}")
+        if conn and DATASET_RELOAD_INTERVAL > 0:
+            dataset_reloader.start()  # pantau perubahan tabel dataset di background
+    else:
+        app.create_task(load_components_background())
+
+async def on_shutdown(app: Application):
+    await dataset_reloader.stop()
+    await qa_batcher.stop()  # hentikan worker micro-batch
+    await chat_log_sink.stop()  # tulis semua chat log yang masih di buffer
+    await sessions.stop()       # simpan sesi yang belum ditulis
+    await metrics.stop()
+    try:
+        metrics.dump(METRICS_DUMP_PATH, metrics_extra())  # dump terakhir sebelum keluar
+    except OSError as e:
+        print(f"[WARN] Gagal menulis metrics: {e}")
+    if chat_log_sink.store is not None:
+        chat_log_sink.store.close()
+    worker_pool.shutdown()   # tutup thread/process pool
+    db_pool.close_all()      # koneksi per thread (thread-nya sudah berhenti)
+
+def build_application() -> Application:
+    app = (
+        Application.builder()
+        .token(TOKEN)
+        .concurrent_updates(CONCURRENT_UPDATES)  # handler berjalan paralel → pertanyaan bisa di-batch
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    ) #  inisialisasi bot
     app.add_handler(CommandHandler("start", start)) #  tangani perintah /start
+    app.add_handler(CommandHandler("stats", stats_command))  # ringkasan latency (admin)
     app.add_handler(CallbackQueryHandler(callback_query_handler))  # tangani inline button callback
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message)) #  tangani semua teks biasa
+    return app
+
+def check_webhook_config():
+    """Webhook publik tanpa secret menerima update palsu dari siapa saja (mis. chat.id admin untuk /stats)."""
+    if BOT_MODE == "webhook" and WEBHOOK_URL and not WEBHOOK_SECRET:
+        raise SystemExit("[ERROR] WEBHOOK_URL diisi tapi WEBHOOK_SECRET kosong: isi WEBHOOK_SECRET "
+                         "(A-Z, a-z, 0-9, _ dan -, maks. 256 karakter) sebelum mendaftarkan webhook publik")
+
+async def run_webhook(app: Application, startup=on_startup, shutdown=on_shutdown):
+    """
+    Mode webhook: update diterima oleh WebhookServer (asyncio, loop yang sama) dan diproses
+    Application seperti polling. Uji lokal: WEBHOOK_URL kosong lalu POST payload dengan
+    `python replay_webhook.py`.
+    """
+    check_webhook_config()
+    from webhook_server import WebhookServer
+    server = WebhookServer(app, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH,
+                           secret_token=WEBHOOK_SECRET, max_pending=WEBHOOK_MAX_PENDING)
+    async with app:                # initialize() ... shutdown()
+        if startup:
+            await startup(app)     # post_init/post_shutdown hanya dipanggil otomatis oleh run_polling
+        await app.start()
+        await server.start()
+        if WEBHOOK_URL:
+            await app.bot.set_webhook(WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+                                      secret_token=WEBHOOK_SECRET or None,
+                                      max_connections=min(100, CONCURRENT_UPDATES))
+        try:
+            await asyncio.Event().wait()  # jalan terus sampai Ctrl+C
+        finally:
+            await server.stop()
+            await app.stop()
+            if shutdown:
+                await shutdown(app)
+
+# === Mode sharded: proses depan + N proses worker ===
+def shard_of(chat_id, n_shards):
+    """Chat yang sama selalu ke worker yang sama → sesi & form keluhan tetap konsisten."""
+    return (chat_id or 0) % n_shards
+
+def prepare_shard_process(shard_id, n_shards):
+    """
+    Dipanggil di proses anak setelah fork. Model, tokenizer & index sudah ada di memori
+    (diwarisi dari induk, halaman memori dipakai bersama selama tidak ditulis).
+    Koneksi SQLite tidak boleh dibawa lintas fork, jadi dibuka ulang di sini.
+    """
+    global conn, METRICS_DUMP_PATH
+    try:
+        conn = init_db_connection(DB_PATH)
+    except Exception as e:
+        conn = None
+        print(f"[WARN] shard {shard_id}: gagal konek DB: {e}")
+    sessions.conn = conn if SESSION_PERSIST else None
+    if chat_log_sink.store is not None:
+        chat_log_sink.store = ChatLogStore(DB_PATH, conn=conn, lock=db_lock) if conn else None
+    root, ext = os.path.splitext(METRICS_DUMP_PATH)
+    METRICS_DUMP_PATH = f"{root}.shard{shard_id}{ext}"
+    import torch
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // n_shards))  # bagi core antar worker
+    worker_pool.start()
+
+async def _shard_loop(shard_id, inbox):
+    app = build_application()
+    loop = asyncio.get_running_loop()
+    async with app:
+        await on_startup(app)
+        await app.start()
+        print(f"[INFO] shard {shard_id} siap (pid {os.getpid()})")
+        try:
+            while True:
+                data = await loop.run_in_executor(None, inbox.get)  # update dari proses depan
+                if data is None:
+                    break
+                await app.update_queue.put(Update.de_json(data, app.bot))
+        finally:
+            await app.stop()
+            await on_shutdown(app)
+
+def shard_worker_main(shard_id, n_shards, inbox):
+    prepare_shard_process(shard_id, n_shards)
+    try:
+        asyncio.run(_shard_loop(shard_id, inbox))
+    except KeyboardInterrupt:
+        pass
+
+def run_sharded(n_shards):
+    """
+    Proses depan hanya menerima update (polling/webhook) dan meneruskannya sebagai dict ke
+    worker chat_id % n_shards. Worker menjalankan handler lengkap dan membalas langsung.
+    """
+    import multiprocessing as mp
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")  # tokenizer Rust tidak aman setelah fork
+    if not components_ready.is_set():
+        load_components()  # load sekali di induk sebelum fork → dipakai bersama semua worker
+    print(f"[INFO] Waktu startup: {format_startup_report()}")
+    ctx = mp.get_context("fork")
+    inboxes = [ctx.Queue() for _ in range(n_shards)]
+    # bukan daemon: proses daemon tidak boleh punya anak, padahal EXECUTOR_KIND="process"
+    # membuat ProcessPoolExecutor di tiap shard. Worker dihentikan lewat None di inbox + join di bawah.
+    procs = [ctx.Process(target=shard_worker_main, args=(i, n_shards, q), name=f"bot-shard-{i}")
+             for i, q in enumerate(inboxes)]
+    for p in procs:
+        p.start()
+
+    async def route(update: Update, context: CallbackContext):
+        chat = update.effective_chat
+        inboxes[shard_of(chat.id if chat else None, n_shards)].put(update.to_dict())
+
+    front = Application.builder().token(TOKEN).concurrent_updates(True).build()
+    front.add_handler(TypeHandler(Update, route))
+    try:
+        if BOT_MODE == "webhook":
+            asyncio.run(run_webhook(front, startup=None, shutdown=None))
+        else:
+            front.run_polling()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for q in inboxes:
+            q.put(None)  # worker menyelesaikan update yang sudah diterima lalu berhenti
+        for p in procs:
+            p.join(timeout=30)
+            if p.is_alive():  # macet: jangan biarkan induk menunggu selamanya saat exit
+                print(f"[WARN] {p.name} tidak berhenti dalam 30 detik, dihentikan paksa")
+                p.terminate()
+                p.join()
+
+def main():
+    check_webhook_config()  # sebelum load model / fork shard
+    if SHARD_WORKERS > 1:
+        import multiprocessing as mp
+        if "fork" in mp.get_all_start_methods():
+            print(f"🚀 Bot Chatbot D.Maju Jaya siap dijalankan di Telegram! ({SHARD_WORKERS} shard)")
+            run_sharded(SHARD_WORKERS)
+            return
+        print("[WARN] SHARD_WORKERS butuh fork (Linux/macOS); jalan sebagai satu proses")
+    worker_pool.start()  # buat executor (dan fork worker process) sebelum polling dimulai
+    app = build_application()
     print("🚀 Bot Chatbot D.Maju Jaya siap dijalankan di Telegram!")
-    app.run_polling()      #  jalankan polling Telegram (loop utama)
+    if BOT_MODE == "webhook":
+        try:
+            asyncio.run(run_webhook(app))
+        except KeyboardInterrupt:
+            pass
+    else:
+        app.run_polling()      #  jalankan polling Telegram (loop utama)
 
 if __name__ == "__main__":
     # pastikan koneksi db ready jika tersedia
     if conn:
         ensure_tables(conn)
-    main()
+    if "--build-index" in sys.argv:
+        build_retrieval_artifacts()  # python Main_Final.py --build-index
+    else:
+        main()
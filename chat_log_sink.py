@@ -0,0 +1,136 @@
+# chat_log_sink.py — penulisan chat log JSONL di background (buffer + rotasi)
+import asyncio  # queue & task background
+import gzip  # kompres segmen lama (opsional)
+import json  # format log tetap satu JSON per baris
+import os  # path, ukuran file, rename
+import shutil  # salin isi file ke gzip
+import time  # batas waktu flush & rotasi
+from datetime import datetime
+from typing import Dict, List, Optional
+
+_STOP = object()  # penanda di queue: tulis sisa batch lalu berhenti
+
+
+class ChatLogSink:
+    """
+    Log interaksi dimasukkan ke asyncio.Queue (tanpa I/O di handler), lalu ditulis
+    per file sekaligus setiap flush_every record atau flush_ms milidetik.
+
+    Rotasi (default mati, supaya eval_chatbot.py tetap membaca satu file per mode):
+    - rotate_bytes: pindahkan file ke segmen baru jika ukurannya melewati batas
+    - rotate_seconds: pindahkan file jika umur segmen aktif melewati batas
+    Segmen lama diberi nama <nama>.<YYYYmmdd-HHMMSS>.txt, opsional dikompres jadi .gz.
+
+    store: ChatLogStore opsional; batch yang sama juga dimasukkan ke tabel chat_log.
+    write_files=False jika log hanya disimpan di SQLite.
+    """
+
+    def __init__(self, base_dir: str, flush_every: int = 50, flush_ms: float = 500.0,
+                 rotate_bytes: int = 0, rotate_seconds: int = 0, gzip_rotated: bool = False,
+                 run_blocking=None, store=None, write_files: bool = True):
+        self.base_dir = base_dir
+        self.flush_every = max(1, int(flush_every))
+        self.flush_wait = max(0.0, float(flush_ms)) / 1000.0
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.gzip_rotated = gzip_rotated
+        self.run_blocking = run_blocking or asyncio.to_thread  # mis. WorkerPool.run
+        self.store = store
+        self.write_files = write_files
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._opened_at: Dict[str, float] = {}  # file -> waktu segmen aktif dimulai
+        self.written = 0
+
+    def _ensure_worker(self):
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.get_running_loop().create_task(self._worker())
+
+    def write(self, file_name: str, record: dict):
+        """Antrekan satu record (dipanggil dari event loop, tidak menunggu I/O)."""
+        self._ensure_worker()
+        self._queue.put_nowait((file_name, record))
+
+    async def _collect(self):
+        # Return (batch, stop): batch penuh, waktu habis, atau ketemu _STOP
+        batch = []
+        deadline = None
+        while len(batch) < self.flush_every:
+            if deadline is None:
+                item = await self._queue.get()  # tunggu record pertama tanpa batas waktu
+                deadline = time.monotonic() + self.flush_wait
+            else:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _worker(self):
+        stop = False
+        while not stop:
+            batch, stop = await self._collect()
+            if not batch:
+                continue
+            try:
+                if stop:
+                    self._flush(batch)  # saat shutdown executor bisa jadi sudah ditutup
+                else:
+                    await self.run_blocking(self._flush, batch)
+            except Exception as e:  # log gagal ditulis tidak boleh menghentikan bot
+                print(f"[WARN] chat log gagal ditulis ({len(batch)} record): {e}")
+
+    # --- I/O (berjalan di thread) ---
+    def _flush(self, batch):
+        if self.store is not None:
+            self.store.insert_many(batch)  # satu transaksi untuk seluruh batch
+        if self.write_files:
+            self._append_files(batch)
+        self.written += len(batch)
+
+    def _append_files(self, batch):
+        grouped: Dict[str, List[str]] = {}
+        for file_name, record in batch:
+            grouped.setdefault(file_name, []).append(json.dumps(record, ensure_ascii=False) + "\n")
+        for file_name, lines in grouped.items():
+            path = os.path.join(self.base_dir, file_name)
+            self._maybe_rotate(path)
+            with open(path, "a", encoding="utf-8") as f:  # satu open + satu write per file per batch
+                f.write("".join(lines))
+
+    def _maybe_rotate(self, path):
+        if not (self.rotate_bytes or self.rotate_seconds):
+            return
+        opened = self._opened_at.setdefault(path, time.time())
+        if not os.path.exists(path):
+            return
+        too_big = self.rotate_bytes and os.path.getsize(path) >= self.rotate_bytes
+        too_old = self.rotate_seconds and time.time() - opened >= self.rotate_seconds
+        if not (too_big or too_old):
+            return
+        root, ext = os.path.splitext(path)
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        rotated, n = f"{root}.{stamp}{ext}", 1
+        while os.path.exists(rotated) or os.path.exists(rotated + ".gz"):  # dua rotasi di detik yang sama
+            rotated, n = f"{root}.{stamp}-{n}{ext}", n + 1
+        os.replace(path, rotated)
+        self._opened_at[path] = time.time()
+        if self.gzip_rotated:
+            with open(rotated, "rb") as src, gzip.open(rotated + ".gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rotated)
+
+    async def stop(self):
+        """Hentikan worker dan tulis semua record yang masih di antrean (dipanggil saat shutdown)."""
+        if self._task is None or self._task.done():
+            return
+        self._queue.put_nowait(_STOP)  # diproses setelah semua record yang sudah antre
+        await self._task
+        self._task = None
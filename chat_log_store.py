@@ -0,0 +1,208 @@
+# chat_log_store.py — chat log di tabel SQLite (bengkel.db) dengan query ber-index
+#
+# Pemakaian dari command line:
+#   python chat_log_store.py import                       # salin chat_log_*.txt lama ke tabel chat_log
+#   python chat_log_store.py export --out-dir .           # tulis ulang chat_log_*.txt (format JSONL yang sama)
+#   python chat_log_store.py low-score --mode harga_oli   # pertanyaan dengan skor TF-IDF rendah
+import argparse  # argumen command line
+import json  # format JSONL untuk export/import
+import os  # path file log
+import sqlite3  # tabel chat_log
+import threading  # satu koneksi dipakai dari thread flush & thread utama
+from datetime import datetime
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+# ========== CONFIG ==========
+DB_PATH = r"C:\Users\Widya HW\OneDrive - Universitas Tarumanagara\Desktop\Skripsi\Fix Program\bengkel.db"
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+CHATLOG_FILE_NAMES = ["chat_log_service.txt", "chat_log_oli.txt", "chat_log_umum_mobil.txt", "chat_log_bis_truk.txt"]
+LOW_SCORE_THRESHOLD = 0.3  # sama dengan TFIDF_THRESHOLD di Main_Final.py
+# ============================
+
+# kolom JSONL (urutan sama dengan save_chat_log) -> kolom tabel
+LOG_FIELDS = ["mode", "question", "prediction", "keyword", "tfidf_score", "tfidf_threshold", "best_index", "context_used",
+              "confidence", "model_answer"]
+# kolom yang ditambahkan setelah tabel pertama kali dibuat (ALTER TABLE untuk DB lama)
+ADDED_COLUMNS = {"confidence": "REAL", "model_answer": "TEXT"}
+
+
+class ChatLogStore:
+    """
+    Tabel chat_log di bengkel.db (WAL, jadi bot bisa menulis sambil evaluasi membaca).
+    log_file menyimpan nama file JSONL asal, sehingga export menghasilkan file yang sama persis.
+
+    conn/lock: koneksi bot yang sudah ada (commit dari koneksi yang sama tidak mengubah
+    PRAGMA data_version, jadi tidak memicu DatasetReloader); tanpa conn, buka koneksi sendiri.
+    """
+
+    def __init__(self, db_path: str = DB_PATH, conn: Optional[sqlite3.Connection] = None, lock=None):
+        self.db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = conn
+        self._owns_conn = conn is None
+        self._lock = lock or threading.Lock()
+        if conn is not None:
+            with self._lock:
+                conn.execute("PRAGMA journal_mode=WAL")  # evaluasi bisa membaca sambil bot menulis
+                ensure_chat_log_table(conn)
+
+    def connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")  # aman di WAL, commit jauh lebih cepat
+            ensure_chat_log_table(conn)
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        if self._conn is not None and self._owns_conn:
+            self._conn.close()
+            self._conn = None
+
+    def insert_many(self, items: Iterable[Tuple[str, dict]]):
+        """items: (log_file, record JSONL). Semua baris masuk dalam satu transaksi."""
+        now = datetime.now().isoformat()
+        rows = [(now, log_file) + tuple(rec.get(f) for f in LOG_FIELDS) for log_file, rec in items]
+        if not rows:
+            return 0
+        with self._lock:
+            conn = self.connect()
+            with conn:
+                conn.executemany(f"""
+                    INSERT INTO chat_log (timestamp, log_file, {", ".join(LOG_FIELDS)})
+                    VALUES (?, ?, {", ".join("?" for _ in LOG_FIELDS)})
+                """, rows)
+        return len(rows)
+
+    def iter_records(self, log_file: Optional[str] = None, mode: Optional[str] = None) -> Iterator[dict]:
+        """Record dalam format JSONL, urut sesuai waktu masuk."""
+        where, params = [], []
+        if log_file:
+            where.append("log_file = ?")
+            params.append(log_file)
+        if mode:
+            where.append("mode = ?")
+            params.append(mode)
+        sql = f"SELECT {', '.join(LOG_FIELDS)} FROM chat_log"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY id"
+        with self._lock:
+            rows = self.connect().execute(sql, params).fetchall()
+        for row in rows:
+            yield dict(zip(LOG_FIELDS, row))
+
+    def log_files(self) -> List[str]:
+        with self._lock:
+            return [r[0] for r in self.connect().execute("SELECT DISTINCT log_file FROM chat_log ORDER BY log_file")]
+
+    def export_jsonl(self, out_dir: str = BASE_DIR) -> dict:
+        """Tulis ulang chat_log_*.txt dari tabel (satu JSON per baris, format sama dengan bot)."""
+        counts = {}
+        for log_file in self.log_files():
+            path = os.path.join(out_dir, log_file)
+            n = 0
+            with open(path, "w", encoding="utf-8") as f:
+                for rec in self.iter_records(log_file=log_file):
+                    f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                    n += 1
+            counts[log_file] = n
+        return counts
+
+    def import_jsonl(self, paths: Iterable[str]) -> int:
+        """Salin file chat log lama ke tabel (sekali saja saat pindah ke backend sqlite)."""
+        total = 0
+        for path in paths:
+            if not os.path.exists(path):
+                print(f"[WARN] chatlog not found: {path}")
+                continue
+            batch = []
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        batch.append((os.path.basename(path), json.loads(line)))
+                    except json.JSONDecodeError as e:
+                        print(f"[WARN] invalid json in {path}: {e}")
+            total += self.insert_many(batch)
+        return total
+
+    def low_score_questions(self, mode: Optional[str] = None, below: float = LOW_SCORE_THRESHOLD, limit: int = 50):
+        """Pertanyaan dengan tfidf_score < below, dikelompokkan: (question, jumlah, skor rata-rata, skor max)."""
+        sql = """
+            SELECT question, COUNT(*) AS n, AVG(tfidf_score), MAX(tfidf_score)
+            FROM chat_log WHERE tfidf_score < ?
+        """
+        params: list = [below]
+        if mode:
+            sql += " AND mode = ?"
+            params.append(mode)
+        sql += " GROUP BY question ORDER BY n DESC, MAX(tfidf_score) ASC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            return self.connect().execute(sql, params).fetchall()
+
+
+def ensure_chat_log_table(conn: sqlite3.Connection):
+    conn.executescript("""
+    CREATE TABLE IF NOT EXISTS chat_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp TEXT,
+        log_file TEXT,
+        mode TEXT,
+        question TEXT,
+        prediction TEXT,
+        keyword TEXT,
+        tfidf_score REAL,
+        tfidf_threshold REAL,
+        best_index INTEGER,
+        context_used TEXT,
+        confidence REAL,
+        model_answer TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_chat_log_mode_time ON chat_log(mode, timestamp);
+    CREATE INDEX IF NOT EXISTS idx_chat_log_mode_score ON chat_log(mode, tfidf_score);
+    CREATE INDEX IF NOT EXISTS idx_chat_log_score ON chat_log(tfidf_score);
+    CREATE INDEX IF NOT EXISTS idx_chat_log_file ON chat_log(log_file, id);
+    """)
+    existing = {r[1] for r in conn.execute("PRAGMA table_info(chat_log)")}
+    for name, col_type in ADDED_COLUMNS.items():
+        if name not in existing:
+            conn.execute(f"ALTER TABLE chat_log ADD COLUMN {name} {col_type}")
+    conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat log bot di SQLite")
+    parser.add_argument("--db", default=DB_PATH)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_imp = sub.add_parser("import", help="salin chat_log_*.txt ke tabel chat_log")
+    p_imp.add_argument("--dir", default=BASE_DIR)
+
+    p_exp = sub.add_parser("export", help="tulis tabel chat_log ke chat_log_*.txt (JSONL)")
+    p_exp.add_argument("--out-dir", default=BASE_DIR)
+
+    p_low = sub.add_parser("low-score", help="pertanyaan dengan skor TF-IDF rendah")
+    p_low.add_argument("--mode", default=None)
+    p_low.add_argument("--below", type=float, default=LOW_SCORE_THRESHOLD)
+    p_low.add_argument("--limit", type=int, default=50)
+
+    args = parser.parse_args()
+    store = ChatLogStore(args.db)
+    if args.cmd == "import":
+        n = store.import_jsonl(os.path.join(args.dir, name) for name in CHATLOG_FILE_NAMES)
+        print(f"✅ {n} baris chat log diimpor ke {args.db}")
+    elif args.cmd == "export":
+        for log_file, n in store.export_jsonl(args.out_dir).items():
+            print(f"✅ {log_file}: {n} baris")
+    elif args.cmd == "low-score":
+        for question, n, avg, best in store.low_score_questions(args.mode, args.below, args.limit):
+            print(f"{n:>4}x | avg={avg:.3f} max={best:.3f} | {question}")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
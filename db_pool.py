@@ -0,0 +1,91 @@
+# db_pool.py — koneksi SQLite per thread (WAL + pragma) untuk helper DB di worker thread
+import os  # deteksi fork (pid berubah → koneksi warisan induk dibuang)
+import sqlite3
+import threading
+from typing import Dict, Optional
+
+# Pragma yang dipasang di setiap koneksi baru.
+# journal_mode=WAL: pembaca tidak diblokir penulis (tersimpan permanen di file DB)
+# synchronous=NORMAL: aman untuk WAL, fsync hanya saat checkpoint
+DEFAULT_PRAGMAS: Dict[str, object] = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -16000,        # KiB (negatif) → ±16 MB page cache per koneksi
+    "mmap_size": 64 * 1024 * 1024,
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,        # ms menunggu lock tulis sebelum "database is locked"
+}
+CACHED_STATEMENTS = 256  # ukuran cache prepared statement sqlite3 per koneksi
+
+
+def configure_connection(conn: sqlite3.Connection, pragmas: Optional[Dict[str, object]] = None):
+    """Pasang pragma ke koneksi (juga dipakai untuk koneksi bersama di Main_Final.py)."""
+    for name, value in (DEFAULT_PRAGMAS if pragmas is None else pragmas).items():
+        try:
+            conn.execute(f"PRAGMA {name} = {value}")
+        except sqlite3.Error as e:
+            print(f"[WARN] PRAGMA {name} gagal: {e}")
+
+
+def open_connection(db_path: str, pragmas: Optional[Dict[str, object]] = None,
+                    cached_statements: int = CACHED_STATEMENTS) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path, check_same_thread=False, cached_statements=cached_statements)
+    conn.row_factory = sqlite3.Row
+    configure_connection(conn, pragmas)
+    return conn
+
+
+class ConnectionPool:
+    """
+    Satu koneksi per thread, dibuat saat pertama dipakai. Tidak perlu lock global:
+    tiap worker thread memakai koneksinya sendiri, penulis diserialkan oleh SQLite (WAL + busy_timeout).
+
+    Query ditulis sebagai konstanta SQL (teks sama persis) supaya statement cache sqlite3
+    memakai ulang hasil prepare, bukan mem-parse SQL di setiap pemanggilan.
+    """
+
+    def __init__(self, db_path: str, pragmas: Optional[Dict[str, object]] = None,
+                 cached_statements: int = CACHED_STATEMENTS):
+        self.db_path = db_path
+        self.pragmas = pragmas
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._conns = []
+        self._pid = os.getpid()
+
+    def connection(self) -> sqlite3.Connection:
+        if self._pid != os.getpid():
+            self._reset_after_fork()
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = open_connection(self.db_path, self.pragmas, self.cached_statements)
+            self._local.conn = conn
+            with self._lock:
+                self._conns.append(conn)
+        return conn
+
+    def run(self, fn, *args, **kwargs):
+        """fn(conn, *args) dengan koneksi milik thread ini (dipanggil dari worker thread)."""
+        return fn(self.connection(), *args, **kwargs)
+
+    def _reset_after_fork(self):
+        # koneksi SQLite tidak boleh dipakai lintas fork; jangan ditutup (file handle milik induk)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._conns = []
+        self._pid = os.getpid()
+
+    @property
+    def size(self):
+        return len(self._conns)
+
+    def close_all(self):
+        with self._lock:
+            conns, self._conns = self._conns, []
+        for conn in conns:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
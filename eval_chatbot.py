@@ -2,6 +2,8 @@
 import os
 import json
 import re
+import sqlite3
+import sys
 from collections import Counter, defaultdict
 
 # ---------- CONFIG ----------
@@ -22,6 +24,10 @@ DATASET_FILES = {
     "gabungan_bis_truk": os.path.join(CONVERTED_DIR, "gabungan_bis_truk.json"),
 }
 
+# sumber chatlog: "jsonl" (file di atas) atau "sqlite" (tabel chat_log, lihat chat_log_store.py)
+CHATLOG_SOURCE = "jsonl"
+CHATLOG_DB_PATH = os.path.join(BASE_DIR, "bengkel.db")
+
 OUTPUT_FILES = {
     "qa_service": os.path.join(BASE_DIR, "EVAL_QA_SERVICE.txt"),
     "oli_fix": os.path.join(BASE_DIR, "EVAL_OLI.txt"),
@@ -39,6 +45,15 @@ SCENARIOS = {
 
 SOFT_EM_THRESHOLD = 0.75  # token-F1 threshold for soft exact match
 
+# tuning confidence gate (python eval_chatbot.py --tune-confidence) -> dibaca Main_Final.py saat start
+CONFIDENCE_THRESHOLDS_PATH = os.path.join(BASE_DIR, "confidence_thresholds.json")
+CONFIDENCE_MIN_SAMPLES = 20  # mode dengan data lebih sedikit tidak di-tuning (pakai default di bot)
+
+# jawaban dataset berisi {{placeholder}}, jawaban bot di chatlog sudah berisi harga (price_map.expand)
+# → ground truth diisi harga dari harga_data yang sama sebelum dibandingkan
+EXPAND_GOLD_PRICES = True
+PRICE_DB_PATH = CHATLOG_DB_PATH
+
 # ---------- Helpers ----------
 def normalize_text(s: str) -> str:
     if s is None:
@@ -71,6 +86,23 @@ def soft_em(pred: str, gt: str, threshold=SOFT_EM_THRESHOLD) -> int:
     return 1 if token_f1(pred, gt) >= threshold else 0
 
 # build map question_normalized -> list of ground truths
+_price_map = None
+
+def load_price_map(db_path=PRICE_DB_PATH):
+    global _price_map
+    if _price_map is None:
+        from price_map import PriceMap
+        _price_map = PriceMap()
+        if os.path.exists(db_path):
+            conn = sqlite3.connect(db_path)
+            try:
+                _price_map.load(conn)
+            finally:
+                conn.close()
+        else:
+            print(f"[WARN] price db not found: {db_path} (placeholder di ground truth tidak diisi)")
+    return _price_map
+
 def load_dataset_qas(dataset_path):
     mapping = defaultdict(list)
     if not os.path.exists(dataset_path):
@@ -87,6 +119,15 @@ def load_dataset_qas(dataset_path):
                 for ans in qa.get("answers", []):
                     txt = ans.get("text", "")
                     mapping[q_norm].append(txt)
+    if EXPAND_GOLD_PRICES and mapping:
+        # semua ground truth satu dataset diisi harganya sekaligus
+        keys = list(mapping)
+        flat = load_price_map().expand_bulk(t for k in keys for t in mapping[k])
+        pos = 0
+        for k in keys:
+            n = len(mapping[k])
+            mapping[k] = flat[pos:pos + n]
+            pos += n
     return mapping
 
 def read_chatlog_lines(path):
@@ -107,6 +148,18 @@ def read_chatlog_lines(path):
                 print(f"[WARN] invalid json in {path} line {i}: {e}")
     return lines
 
+def read_chatlog_db(path, db_path=None):
+    # baris tabel chat_log yang berasal dari file log yang sama (format dict sama dengan JSONL)
+    from chat_log_store import ChatLogStore
+    store = ChatLogStore(db_path or CHATLOG_DB_PATH)
+    try:
+        return list(store.iter_records(log_file=os.path.basename(path)))
+    except Exception as e:
+        print(f"[WARN] chat_log table unreadable: {e}")
+        return []
+    finally:
+        store.close()
+
 # ---------- Evaluation flow ----------
 def evaluate_mode(mode_key):
     chatlog_path = CHATLOG_FILES[mode_key]
@@ -116,7 +169,7 @@ def evaluate_mode(mode_key):
 
     prints = []
     qmap = load_dataset_qas(dataset_path)  # normalized question -> list of answers
-    chat_lines = read_chatlog_lines(chatlog_path)
+    chat_lines = read_chatlog_db(chatlog_path) if CHATLOG_SOURCE == "sqlite" else read_chatlog_lines(chatlog_path)
 
     # if chatlog empty -> nothing to do but create empty file
     if not chat_lines:
@@ -229,6 +282,7 @@ def evaluate_mode(mode_key):
                 "tfidf_threshold": tfidf_threshold,
                 "best_index": best_index,
                 "context_used": context_used,
+                "confidence": item.get("confidence"),
                 "em": em_val,
                 "soft_em": soft_val,
                 "f1": round(f1_val, 4)
@@ -324,7 +378,68 @@ def evaluate_mode(mode_key):
     print(f"[DONE] Evaluasi untuk mode '{mode_key}' ditulis ke: {out_path}")
 
 
+# ---------- Confidence threshold tuning ----------
+def confidence_samples(mode_key):
+    """(bot mode, confidence, jawaban model benar?) dari chatlog yang pertanyaannya ada di dataset."""
+    qmap = load_dataset_qas(DATASET_FILES[mode_key])
+    path = CHATLOG_FILES[mode_key]
+    samples = []
+    for item in read_chatlog_db(path) if CHATLOG_SOURCE == "sqlite" else read_chatlog_lines(path):
+        conf = item.get("confidence")
+        gts = qmap.get(normalize_text(item.get("question", "")), [])
+        if conf is None or not gts:
+            continue  # bukan jawaban model (skip TF-IDF / jawaban dataset) atau tidak ada ground truth
+        answer = item.get("model_answer") or item.get("prediction", "") or ""  # jawaban model, termasuk yang ditolak
+        correct = max(token_f1(answer, gt) for gt in gts) >= SOFT_EM_THRESHOLD
+        samples.append((item.get("mode"), float(conf), correct))
+    return samples
+
+def best_threshold(samples):
+    """
+    Ambang yang memaksimalkan keputusan benar: jawaban benar diterima + jawaban salah ditolak.
+    samples: [(confidence, benar?)]. Return (ambang, akurasi keputusan).
+    """
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0, 0.0
+    n_ok = sum(1 for _, ok in ordered if ok)
+    best_t, best_score = 0.0, n_ok  # ambang 0: semua jawaban diterima
+    rejected_ok = rejected_wrong = 0
+    for i, (conf, ok) in enumerate(ordered):
+        rejected_ok += ok
+        rejected_wrong += not ok
+        if i + 1 < len(ordered) and ordered[i + 1][0] == conf:
+            continue  # confidence sama harus diterima/ditolak bersama
+        score = (n_ok - rejected_ok) + rejected_wrong  # ambang di atas sampel ke-i → sampel 0..i ditolak
+        if score > best_score:
+            nxt = ordered[i + 1][0] if i + 1 < len(ordered) else conf + 1e-4
+            best_t, best_score = (conf + nxt) / 2, score
+    return best_t, best_score / len(ordered)
+
+def tune_confidence_thresholds(out_path=CONFIDENCE_THRESHOLDS_PATH):
+    by_mode = defaultdict(list)
+    for key in CHATLOG_FILES:
+        for mode, conf, ok in confidence_samples(key):
+            by_mode[mode].append((conf, ok))
+    thresholds = {}
+    for mode, samples in sorted(by_mode.items()):
+        if len(samples) < CONFIDENCE_MIN_SAMPLES:
+            print(f"[INFO] {mode}: hanya {len(samples)} sampel, tidak di-tuning")
+            continue
+        t, acc = best_threshold(samples)
+        thresholds[mode] = round(t, 4)
+        n_ok = sum(ok for _, ok in samples)
+        print(f"[TUNE] {mode}: ambang={t:.4f} | akurasi keputusan={acc * 100:.2f}% | "
+              f"{n_ok}/{len(samples)} jawaban model benar")
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(thresholds, f, ensure_ascii=False, indent=2)
+    print(f"[DONE] Ambang confidence ditulis ke: {out_path}")
+    return thresholds
+
 def main():
+    if "--tune-confidence" in sys.argv:
+        tune_confidence_thresholds()
+        return
     print("Mulai evaluasi chatlog -> dataset ...")
     for key in ["qa_service", "oli_fix", "gabungan_umum", "gabungan_bis_truk"]:
         evaluate_mode(key)
@@ -1,7 +1,7 @@
 import json
-import torch
 from transformers import AutoTokenizer, AutoModelForQuestionAnswering
 import os
+from qa_inference import predict_batch  # window + decoder span yang sama dengan bot
 
 # ========== CONFIG ==========
 finetuned_model_path = r"C:\Users\Widya HW\OneDrive - Universitas Tarumanagara\Desktop\Skripsi\Fix Program\indobert-qa-finetuned-final"
@@ -13,6 +13,7 @@ datasets = {
     "umum": r"C:\Users\Widya HW\OneDrive - Universitas Tarumanagara\Desktop\Skripsi\Fix Program\converted_jsons\QA_V2\gabungan_umum.json",
     "bis_truk": r"C:\Users\Widya HW\OneDrive - Universitas Tarumanagara\Desktop\Skripsi\Fix Program\converted_jsons\QA_V2\gabungan_bis_truk.json",
 }
+BATCH_SIZE = 16  # pasangan (question, context) per forward pass
 # ============================
 
 # === Load IndoBERT model ===
@@ -40,37 +41,28 @@ def load_dataset(path):
                 })
     return qas
 
-# === Function prediksi dengan IndoBERT ===
-def predict_answer(question, context):
-    inputs = tokenizer(question, context, return_tensors="pt", truncation=True, max_length=512)
-    with torch.no_grad():
-        outputs = model(**inputs)
-    start_idx = torch.argmax(outputs.start_logits)
-    end_idx = torch.argmax(outputs.end_logits) + 1
-    tokens = inputs["input_ids"][0][start_idx:end_idx]
-    return tokenizer.decode(tokens, skip_special_tokens=True).strip()
-
 # === Generate predictions untuk tiap dataset ===
 for name, path in datasets.items():
     print(f"\n🚀 Memproses dataset: {name}")
     qas = load_dataset(path)
     predictions = []
 
-    for i, item in enumerate(qas):
-        q = item["question"]
-        c = item["context"]
-        gt = item["answer"]
-        pred = predict_answer(q, c)
+    for b in range(0, len(qas), BATCH_SIZE):
+        chunk = qas[b:b + BATCH_SIZE]
+        # span terbaik (top-n start x end, start <= end, panjang dibatasi) — sama persis dengan jawaban bot
+        preds = predict_batch(tokenizer, model, [(item["question"], item["context"]) for item in chunk])
 
-        predictions.append({
-            "question": q,
-            "context": c,
-            "ground_truth": gt,
-            "prediction": pred
-        })
+        for item, pred in zip(chunk, preds):
+            predictions.append({
+                "question": item["question"],
+                "context": item["context"],
+                "ground_truth": item["answer"],
+                "prediction": pred.answer,
+                "span_score": pred.score if pred.answer else None,
+                "span_prob": round(pred.prob, 4),
+            })
 
-        if (i + 1) % 10 == 0:
-            print(f"  > {i + 1}/{len(qas)} pertanyaan selesai...")
+        print(f"  > {len(predictions)}/{len(qas)} pertanyaan selesai...")
 
     # Simpan hasil prediksi ke file JSON
     output_path = f"predictions_{name}.json"
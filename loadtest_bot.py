@@ -0,0 +1,326 @@
+# loadtest_bot.py — uji beban offline: replay pertanyaan ke handler bot tanpa Telegram
+#
+# Pemakaian:
+#   python loadtest_bot.py                                  # replay chat_log_*.txt, concurrency 1,4,16,32
+#   python loadtest_bot.py --source dataset --messages 500 --no-exact  # pertanyaan dataset lewat TF-IDF + model
+#   python loadtest_bot.py --concurrency 8,64 --send-latency-ms 50 --no-cache
+#   python loadtest_bot.py --shards 1,4 --no-cache             # bandingkan satu proses vs 4 shard (fork)
+#
+# Update/bot Telegram diganti objek tiruan, jadi tidak ada request jaringan. Chat log hasil uji
+# ditulis ke folder sementara (file log asli tidak tersentuh) dan sesi tidak disimpan ke DB.
+import argparse  # argumen command line
+import asyncio  # handler bot adalah coroutine
+import multiprocessing as mp  # mode --shards (fork, model dipakai bersama)
+import os  # path chat log
+import random  # urutan pertanyaan & pembagian user
+import statistics  # median latency
+import tempfile  # folder chat log sementara
+import threading  # sampler memori
+import time  # ukur latency & throughput
+
+from eval_chatbot import CHATLOG_FILES, read_chatlog_lines
+
+# mode QA -> callback_data tombol /start
+MODE_CALLBACKS = {
+    "layanan": "mode_1",
+    "harga_oli": "mode_3",
+    "harga_umum_mobil": "mode_4",
+    "harga_umum_bis": "mode_5",
+}
+
+
+# === Objek tiruan Telegram ===
+class FakeChat:
+    def __init__(self, chat_id):
+        self.id = chat_id
+
+
+class FakeMessage:
+    def __init__(self, chat_id, text, send_latency):
+        self.chat = FakeChat(chat_id)
+        self.text = text
+        self.send_latency = send_latency
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        if self.send_latency:
+            await asyncio.sleep(self.send_latency)  # simulasi round-trip API Telegram
+        self.replies.append(text)
+
+
+class FakeCallbackQuery:
+    def __init__(self, chat_id, data, send_latency):
+        self.data = data
+        self.message = FakeMessage(chat_id, None, send_latency)
+
+    async def answer(self):
+        return None
+
+
+class FakeUpdate:
+    def __init__(self, chat_id, text=None, callback_data=None, send_latency=0.0):
+        self.message = FakeMessage(chat_id, text, send_latency) if text is not None else None
+        self.callback_query = FakeCallbackQuery(chat_id, callback_data, send_latency) if callback_data else None
+        self.effective_chat = FakeChat(chat_id)
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent += 1
+
+
+class FakeContext:
+    def __init__(self, bot):
+        self.bot = bot
+
+
+# === Sumber pertanyaan ===
+def questions_from_chatlogs():
+    items = []
+    for path in CHATLOG_FILES.values():
+        for rec in read_chatlog_lines(path):
+            if rec.get("mode") in MODE_CALLBACKS and rec.get("question"):
+                items.append((rec["mode"], rec["question"]))
+    return items
+
+
+def questions_from_dataset(bot):
+    index = bot.dataset_snapshot.index
+    items = []
+    for mode in MODE_CALLBACKS:
+        if mode not in index.mode_ranges:
+            continue
+        start, end = index.mode_ranges[mode]
+        items.extend((mode, q) for q in index.questions[start:end] if q)
+    return items
+
+
+# === Memori ===
+class PeakMemory:
+    """Sampling RSS proses tiap 50 ms (psutil jika ada, jika tidak ru_maxrss)."""
+
+    def __init__(self):
+        self.peak = 0
+        self._stop = threading.Event()
+        try:
+            import psutil
+            self._proc = psutil.Process()
+        except ImportError:
+            self._proc = None
+
+    def _rss(self):
+        if self._proc is not None:
+            return self._proc.memory_info().rss
+        try:
+            import resource
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # Linux: KB
+        except ImportError:
+            return 0
+
+    def _run(self):
+        while not self._stop.wait(0.05):
+            self.peak = max(self.peak, self._rss())
+
+    def __enter__(self):
+        self.peak = self._rss()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._rss())
+
+
+# === Runner ===
+def percentile(data, p):
+    return data[min(len(data) - 1, int(p / 100 * len(data)))] if data else 0.0
+
+
+def split_users(items, concurrency, n_messages):
+    work = [items[i % len(items)] for i in range(n_messages)]
+    return {u: work[u::concurrency] for u in range(concurrency)}
+
+
+async def run_users(bot, per_user, send_latency, chat_id_base):
+    """User virtual (uid -> daftar (mode, pertanyaan)) bertanya bersamaan. Return (latencies ms, detik)."""
+    fake_bot = FakeBot()
+    context = FakeContext(fake_bot)
+    latencies = []
+
+    async def user(uid, questions):
+        chat_id = chat_id_base + uid
+        current_mode = None
+        for mode, question in questions:
+            if mode != current_mode:  # pilih mode lewat tombol inline, seperti user asli
+                await bot.callback_query_handler(FakeUpdate(chat_id, callback_data=MODE_CALLBACKS[mode],
+                                                            send_latency=send_latency), context)
+                current_mode = mode
+            t0 = time.perf_counter()
+            await bot.handle_message(FakeUpdate(chat_id, text=question, send_latency=send_latency), context)
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*[user(u, qs) for u, qs in per_user.items() if qs])
+    return latencies, time.perf_counter() - t0
+
+
+def summarize(concurrency, latencies, elapsed, avg_batch, peak_rss):
+    latencies = sorted(latencies)
+    return {
+        "concurrency": concurrency,
+        "messages": len(latencies),
+        "msgs_per_sec": len(latencies) / elapsed if elapsed else 0.0,
+        "p50": statistics.median(latencies) if latencies else 0.0,
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "max": latencies[-1] if latencies else 0.0,
+        "avg_batch": avg_batch,
+        "peak_rss_mb": peak_rss / 1024 / 1024,
+    }
+
+
+async def run_level(bot, items, concurrency, n_messages, send_latency, chat_id_base):
+    """Jalankan n_messages pertanyaan dengan `concurrency` user virtual yang bertanya bergantian."""
+    batches0, items0 = bot.qa_batcher.total_batches, bot.qa_batcher.total_items
+    with PeakMemory() as mem:
+        latencies, elapsed = await run_users(bot, split_users(items, concurrency, n_messages),
+                                             send_latency, chat_id_base)
+    batches = bot.qa_batcher.total_batches - batches0
+    avg_batch = (bot.qa_batcher.total_items - items0) / batches if batches else 0.0
+    return summarize(concurrency, latencies, elapsed, avg_batch, mem.peak)
+
+
+# === Mode --shards: tiap shard = proses hasil fork dengan bagian user sesuai chat_id % N ===
+def _shard_child(bot, shard_id, n_shards, per_user, send_latency, chat_id_base, barrier, results):
+    bot.prepare_shard_process(shard_id, n_shards)
+    bot.sessions.conn = None
+    bot.chat_log_sink.store = None
+
+    async def shard_run():
+        barrier.wait()  # semua shard mulai bersamaan
+        b0, i0 = bot.qa_batcher.total_batches, bot.qa_batcher.total_items
+        with PeakMemory() as mem:
+            latencies, _ = await run_users(bot, per_user, send_latency, chat_id_base)
+        await bot.qa_batcher.stop()
+        await bot.chat_log_sink.stop()
+        batches = bot.qa_batcher.total_batches - b0
+        return latencies, (bot.qa_batcher.total_items - i0, batches), mem.peak
+
+    results.put(asyncio.run(shard_run()))
+    bot.worker_pool.shutdown()
+
+
+def run_level_sharded(bot, items, concurrency, n_messages, send_latency, chat_id_base, n_shards):
+    per_user = split_users(items, concurrency, n_messages)
+    ctx = mp.get_context("fork")
+    barrier = ctx.Barrier(n_shards + 1)
+    results = ctx.Queue()
+    procs = []
+    for shard in range(n_shards):
+        part = {u: qs for u, qs in per_user.items() if bot.shard_of(chat_id_base + u, n_shards) == shard}
+        procs.append(ctx.Process(target=_shard_child, args=(bot, shard, n_shards, part, send_latency,
+                                                            chat_id_base, barrier, results)))
+    for p in procs:
+        p.start()
+    barrier.wait()
+    t0 = time.perf_counter()
+    outs = [results.get() for _ in procs]
+    elapsed = time.perf_counter() - t0
+    for p in procs:
+        p.join()
+    latencies = [ms for lat, _, _ in outs for ms in lat]
+    items_total = sum(i for _, (i, _), _ in outs)
+    batches = sum(b for _, (_, b), _ in outs)
+    peak = max(peak for _, _, peak in outs)  # per proses; sebagian besar halaman model dipakai bersama
+    return summarize(concurrency, latencies, elapsed, items_total / batches if batches else 0.0, peak)
+
+
+async def run_single_levels(bot, items, args):
+    """Semua level concurrency di satu proses (satu event loop)."""
+    bot.worker_pool.start()
+    # warm-up: beberapa pertanyaan (lazy init torch, batcher) lalu cache dikosongkan
+    await run_level(bot, items, 1, min(len(items), 4), 0.0, chat_id_base=10_000_000)
+    bot.answer_cache.invalidate()
+    results = []
+    for i, level in enumerate(args.concurrency):
+        results.append(await run_level(bot, items, level, args.messages, args.send_latency_ms / 1000.0,
+                                       chat_id_base=20_000_000 + i * 100_000))
+        if not args.keep_cache_between_levels:
+            bot.answer_cache.invalidate()
+    await bot.qa_batcher.stop()
+    await bot.chat_log_sink.stop()
+    bot.worker_pool.shutdown()  # --shards berikutnya fork dari proses tanpa executor aktif
+    return results
+
+
+def run(args):
+    import Main_Final as bot  # import di sini: --help tidak perlu load bot
+
+    # chat log uji ke folder sementara, sesi tidak ditulis ke user_session
+    bot.chat_log_sink.base_dir = tempfile.mkdtemp(prefix="loadtest_chatlog_")
+    bot.chat_log_sink.store = None
+    bot.sessions.conn = None
+    if args.no_cache:
+        bot.answer_cache.max_size = 0
+    if args.no_exact:
+        # --source dataset: semua pertanyaan identik dengan dataset → matikan semua jalur tanpa model
+        bot.EXACT_QUESTION_FASTPATH = False
+        bot.NEAR_EXACT_RATIO = 1.01       # rasio difflib maksimal 1.0 → near-exact tidak pernah cocok
+        bot.PRECOMPUTED_ANSWERS = False   # sebelum load_components: tabel precomputed tidak dimuat
+
+    if any(n > 1 for n in args.shards):
+        os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    if not bot.components_ready.is_set():
+        t0 = time.perf_counter()
+        bot.load_components()  # di thread utama, sebelum ada event loop: aman untuk fork (--shards)
+        print(f"[INFO] Model & index siap dalam {time.perf_counter() - t0:.1f}s ({bot.format_startup_report()})")
+
+    items = questions_from_dataset(bot) if args.source == "dataset" else questions_from_chatlogs()
+    if not items:
+        print("[WARN] tidak ada pertanyaan untuk di-replay")
+        return
+    random.Random(args.seed).shuffle(items)
+    print(f"[INFO] {len(items)} pertanyaan dari {args.source}, {args.messages} pesan per level")
+
+    print(f"{'shard':>5} | {'conc':>5} | {'msg/s':>7} | {'p50 ms':>8} | {'p95 ms':>8} | {'p99 ms':>8} | "
+          f"{'max ms':>8} | {'batch':>5} | {'peak RSS MB':>11}")
+    for n_shards in args.shards:
+        if n_shards > 1:
+            results = []
+            for i, level in enumerate(args.concurrency):
+                results.append(run_level_sharded(bot, items, level, args.messages, args.send_latency_ms / 1000.0,
+                                                 20_000_000 + i * 100_000, n_shards))
+                if not args.keep_cache_between_levels:
+                    bot.answer_cache.invalidate()
+        else:
+            results = asyncio.run(run_single_levels(bot, items, args))
+        for r in results:
+            print(f"{n_shards:>5} | {r['concurrency']:>5} | {r['msgs_per_sec']:>7.1f} | {r['p50']:>8.1f} | "
+                  f"{r['p95']:>8.1f} | {r['p99']:>8.1f} | {r['max']:>8.1f} | {r['avg_batch']:>5.2f} | "
+                  f"{r['peak_rss_mb']:>11.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Uji beban offline handler bot (tanpa Telegram)")
+    parser.add_argument("--source", choices=["chatlog", "dataset"], default="chatlog",
+                        help="chatlog: replay chat_log_*.txt; dataset: pertanyaan dari tabel QA")
+    parser.add_argument("--concurrency", type=lambda s: [int(x) for x in s.split(",")], default=[1, 4, 16, 32],
+                        help="daftar jumlah user bersamaan, mis. 1,4,16,32")
+    parser.add_argument("--messages", type=int, default=200, help="jumlah pesan per level concurrency")
+    parser.add_argument("--send-latency-ms", type=float, default=0.0, help="simulasi latency kirim pesan Telegram")
+    parser.add_argument("--no-cache", action="store_true", help="matikan cache jawaban (selalu forward pass)")
+    parser.add_argument("--keep-cache-between-levels", action="store_true")
+    parser.add_argument("--no-exact", action="store_true", help="matikan jalur cepat dataset (exact, near-exact, precomputed)")
+    parser.add_argument("--shards", type=lambda s: [int(x) for x in s.split(",")], default=[1],
+                        help="jumlah proses worker (mode SHARD_WORKERS), mis. 1,4 untuk perbandingan")
+    parser.add_argument("--seed", type=int, default=0)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
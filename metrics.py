@@ -0,0 +1,152 @@
+# metrics.py — latency per tahap (retrieval, model, kirim Telegram, ...) per mode
+import asyncio  # task dump berkala
+import json  # file dump metrics
+import os  # tulis file dump secara atomic
+import threading  # record() dipanggil dari event loop & worker thread
+import time  # perf_counter
+from collections import deque
+from typing import Callable, Dict, Optional
+
+PERCENTILES = (50, 95, 99)
+
+
+class RollingHistogram:
+    """Simpan window sampel terakhir (ms); persentil dihitung saat diminta."""
+
+    __slots__ = ("samples", "count", "total")
+
+    def __init__(self, window=2048):
+        self.samples = deque(maxlen=window)
+        self.count = 0      # total sampel sejak start (bukan hanya window)
+        self.total = 0.0
+
+    def add(self, ms):
+        self.samples.append(ms)
+        self.count += 1
+        self.total += ms
+
+    def summary(self):
+        data = sorted(self.samples)
+        if not data:
+            return {"count": self.count}
+        out = {"count": self.count, "mean": round(self.total / self.count, 2)}
+        for p in PERCENTILES:
+            out[f"p{p}"] = round(data[min(len(data) - 1, int(p / 100 * len(data)))], 2)
+        out["max"] = round(data[-1], 2)
+        return out
+
+
+class _Stage:
+    def __init__(self, trace, stage):
+        self.trace = trace
+        self.stage = stage
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.trace.metrics.record(self.trace.mode, self.stage, time.perf_counter() - self.t0)
+
+
+class Trace:
+    """Timing satu pesan: `with trace.stage("retrieval"): ...`, lalu finish() untuk total."""
+
+    def __init__(self, metrics, mode):
+        self.metrics = metrics
+        self.mode = mode
+        self.t0 = time.perf_counter()
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def finish(self):
+        self.metrics.record(self.mode, "total", time.perf_counter() - self.t0)
+
+
+class Metrics:
+    """
+    Histogram latency per (mode, tahap) + counter sederhana.
+    Mode khusus "model" berisi tahap per batch (tokenize, forward, decode, batch_size).
+    """
+
+    def __init__(self, window=2048):
+        self.window = window
+        self.started = time.time()
+        self._hist: Dict[str, Dict[str, RollingHistogram]] = {}
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+        self._task = None
+
+    def trace(self, mode) -> Trace:
+        return Trace(self, mode)
+
+    def record(self, mode, stage, seconds):
+        self.record_value(mode, stage, seconds * 1000.0)
+
+    def record_value(self, mode, stage, value):
+        with self._lock:
+            hist = self._hist.setdefault(mode, {}).get(stage)
+            if hist is None:
+                hist = self._hist[mode][stage] = RollingHistogram(self.window)
+            hist.add(value)
+
+    def incr(self, mode, name, n=1):
+        with self._lock:
+            counters = self._counters.setdefault(mode, {})
+            counters[name] = counters.get(name, 0) + n
+
+    def snapshot(self):
+        """dict siap JSON: {mode: {tahap: {count, mean, p50, p95, p99, max}, "counters": {...}}}"""
+        with self._lock:
+            out = {mode: {stage: h.summary() for stage, h in stages.items()} for mode, stages in self._hist.items()}
+            for mode, counters in self._counters.items():
+                out.setdefault(mode, {})["counters"] = dict(counters)
+        return out
+
+    def format_report(self, modes=None):
+        """Ringkasan teks untuk /stats (ms, persentil dari window sampel terakhir)."""
+        lines = [f"📊 Latency (ms) sejak {time.strftime('%Y-%m-%d %H:%M', time.localtime(self.started))}"]
+        for mode, stages in self.snapshot().items():
+            if modes and mode not in modes:
+                continue
+            lines.append(f"\n[{mode}]")
+            counters = stages.pop("counters", None)
+            for stage, s in stages.items():
+                if "p50" not in s:
+                    continue
+                lines.append(f"{stage:<12} n={s['count']:<6} p50={s['p50']:<8} p95={s['p95']:<8} p99={s['p99']}")
+            if counters:
+                lines.append("  " + ", ".join(f"{k}={v}" for k, v in counters.items()))
+        return "\n".join(lines)
+
+    def dump(self, path, extra: Optional[dict] = None):
+        data = {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "uptime_s": round(time.time() - self.started, 1),
+                "latency_ms": self.snapshot()}
+        if extra:
+            data.update(extra)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+
+    # --- dump berkala ---
+    def start_dumper(self, path, interval_seconds, extra_fn: Optional[Callable[[], dict]] = None):
+        async def _run():
+            while True:
+                await asyncio.sleep(interval_seconds)
+                try:
+                    await asyncio.to_thread(self.dump, path, extra_fn() if extra_fn else None)
+                except Exception as e:
+                    print(f"[WARN] Gagal menulis metrics: {e}")
+
+        if self._task is None and interval_seconds > 0:
+            self._task = asyncio.get_running_loop().create_task(_run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
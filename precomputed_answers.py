@@ -0,0 +1,210 @@
+# precomputed_answers.py — jawaban model untuk setiap pertanyaan dataset, dihitung offline
+#
+# Pemakaian dari command line:
+#   python precomputed_answers.py build           # incremental: hanya baris yang pertanyaan/context-nya berubah
+#   python precomputed_answers.py build --full    # hitung ulang semua baris
+#   python precomputed_answers.py stats           # jumlah baris, confidence, latency & placeholder tanpa harga per tabel
+#
+# Bot (Main_Final.py) memuat tabel ini saat dataset di-load: pertanyaan dataset dan parafrasenya
+# (pertanyaan lain dengan context + jawaban yang sama) dijawab dari sini tanpa forward pass.
+import argparse  # argumen command line
+import hashlib  # hash pertanyaan & context untuk rebuild incremental
+import sqlite3  # tabel precomputed_answers di bengkel.db
+import time  # latency per batch
+from datetime import datetime
+from typing import Dict, NamedTuple, Tuple
+
+from eval_chatbot import normalize_text  # normalisasi jawaban untuk cluster parafrase
+from price_map import PLACEHOLDER_RE, PriceMap  # cek placeholder yang belum punya harga (stats)
+
+# ========== CONFIG ==========
+MODEL_PATH = r"C:\Users\Widya HW\OneDrive - Universitas Tarumanagara\Desktop\Skripsi\Fix Program\indobert-qa-finetuned-final-v2"
+DB_PATH = r"C:\Users\Widya HW\OneDrive - Universitas Tarumanagara\Desktop\Skripsi\Fix Program\bengkel.db"
+QA_TABLES = ["qa_service", "oli_fix", "gabungan_umum", "gabungan_bis_truk"]
+QA_BACKEND = "torch_fp32"  # sama dengan QA_BACKEND di Main_Final.py
+BATCH_SIZE = 64            # offline → batch besar
+# ============================
+
+
+class PrecomputedAnswer(NamedTuple):
+    answer: str
+    confidence: float  # p(start) * p(end)
+    cluster: str       # baris dengan context + jawaban dataset yang sama = satu cluster parafrase
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1((text or "").encode("utf-8")).hexdigest()
+
+
+def model_id(model_path=MODEL_PATH, backend=QA_BACKEND) -> str:
+    """Jawaban dihitung ulang jika model atau backend berganti."""
+    name = model_path.replace("\\", "/").rstrip("/").rsplit("/", 1)[-1]  # path Windows juga
+    return f"{name}:{backend}"
+
+
+def ensure_precomputed_table(conn: sqlite3.Connection):
+    conn.executescript("""
+    CREATE TABLE IF NOT EXISTS precomputed_answers (
+        tbl TEXT NOT NULL,
+        row_id INTEGER NOT NULL,
+        question TEXT,
+        question_hash TEXT NOT NULL,  -- sha1 pertanyaan
+        context_hash TEXT NOT NULL,   -- sha1 context yang diberikan ke model (keyword + context)
+        answer TEXT,                  -- span prediksi model
+        span_start INTEGER,           -- offset karakter span di context model (-1 = tidak ada span)
+        span_end INTEGER,
+        score REAL,                   -- start_logit + end_logit
+        confidence REAL,              -- p(start) * p(end)
+        latency_ms REAL,              -- waktu forward per pertanyaan (rata-rata batch)
+        cluster TEXT,
+        model TEXT,
+        updated_at TEXT,
+        PRIMARY KEY (tbl, row_id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_precomputed_hash ON precomputed_answers(question_hash, context_hash);
+    """)
+    conn.commit()
+
+
+def precomputed_version(conn: sqlite3.Connection):
+    """Penanda murah untuk mendeteksi hasil build baru (dipakai DatasetReloader)."""
+    try:
+        return tuple(conn.execute("SELECT COUNT(*), MAX(updated_at) FROM precomputed_answers").fetchone())
+    except sqlite3.Error:
+        return None
+
+
+def fetch_precomputed(conn: sqlite3.Connection, model=None) -> Dict[Tuple[str, str], PrecomputedAnswer]:
+    """(question_hash, context_hash) -> PrecomputedAnswer; kosong jika tabel belum ada."""
+    sql = "SELECT question_hash, context_hash, answer, confidence, cluster FROM precomputed_answers WHERE span_start >= 0"
+    params = []
+    if model:
+        sql += " AND model = ?"
+        params.append(model)
+    try:
+        rows = conn.execute(sql, params).fetchall()
+    except sqlite3.Error:
+        return {}
+    return {(qh, ch): PrecomputedAnswer(ans, conf, cluster) for qh, ch, ans, conf, cluster in rows}
+
+
+def load_dataset_rows(conn: sqlite3.Connection, table: str):
+    """(row_id, question, jawaban dataset, context model) dengan format context yang sama dengan bot."""
+    from qa_inference import build_model_context
+    try:
+        rows = conn.execute(f"SELECT id, question, answer, context, keyword FROM {table}").fetchall()
+    except sqlite3.Error as e:
+        print(f"[WARN] tabel {table} tidak bisa dibaca: {e}")
+        return []
+    # keyword kosong → "_nokey", sama dengan load_keywords_and_paragraphs_from_db di Main_Final.py
+    return [(rid, q or "", a or "", build_model_context((kw or "").strip() or "_nokey", ctx or ""))
+            for rid, q, a, ctx, kw in rows]
+
+
+def build(db_path=DB_PATH, model_path=MODEL_PATH, backend=QA_BACKEND, batch_size=BATCH_SIZE, full=False):
+    conn = sqlite3.connect(db_path)
+    ensure_precomputed_table(conn)
+    mid = model_id(model_path, backend)
+    existing = {(tbl, rid): (qh, ch, m, cl) for tbl, rid, qh, ch, m, cl in conn.execute(
+        "SELECT tbl, row_id, question_hash, context_hash, model, cluster FROM precomputed_answers")}
+
+    todo, recluster, current = [], [], set()
+    for table in QA_TABLES:
+        for rid, question, gold, context in load_dataset_rows(conn, table):
+            key = (table, rid)
+            current.add(key)
+            qh, ch = text_hash(question), text_hash(context)
+            cluster = text_hash(f"{table}|{ch}|{normalize_text(gold)}")[:16]
+            old = existing.get(key)
+            if full or old is None or old[:3] != (qh, ch, mid):
+                todo.append((table, rid, question, qh, context, ch, cluster))
+            elif old[3] != cluster:  # hanya jawaban dataset yang berubah → cukup pindah cluster
+                recluster.append((cluster, table, rid))
+
+    stale = [k for k in existing if k not in current]
+    if stale or recluster:
+        conn.executemany("DELETE FROM precomputed_answers WHERE tbl = ? AND row_id = ?", stale)
+        now = datetime.now().isoformat()
+        conn.executemany("UPDATE precomputed_answers SET cluster = ?, updated_at = ? WHERE tbl = ? AND row_id = ?",
+                         [(cl, now, tbl, rid) for cl, tbl, rid in recluster])
+        conn.commit()
+    print(f"[INFO] {len(current)} baris dataset | {len(todo)} perlu dihitung | {len(stale)} dihapus "
+          f"| {len(recluster)} pindah cluster")
+    if not todo:
+        conn.close()
+        return 0
+
+    from transformers import AutoTokenizer
+    import qa_backend
+    import qa_inference
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    model = qa_backend.load_qa_model(model_path, backend)
+
+    todo.sort(key=lambda t: len(t[4]))  # panjang context mirip dalam satu batch → padding sedikit
+    t_start = time.perf_counter()
+    done = 0
+    for b in range(0, len(todo), batch_size):
+        chunk = todo[b:b + batch_size]
+        t0 = time.perf_counter()
+        preds = qa_inference.predict_batch(tokenizer, model, [(t[2], t[4]) for t in chunk])
+        per_item_ms = (time.perf_counter() - t0) * 1000 / len(chunk)
+        now = datetime.now().isoformat()
+        conn.executemany("""
+            INSERT OR REPLACE INTO precomputed_answers
+            (tbl, row_id, question, question_hash, context_hash, answer, span_start, span_end,
+             score, confidence, latency_ms, cluster, model, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, [(tbl, rid, q, qh, ch, p.answer, p.start, p.end,
+               p.score if p.start >= 0 else None, p.prob, round(per_item_ms, 3), cluster, mid, now)
+              for (tbl, rid, q, qh, _, ch, cluster), p in zip(chunk, preds)])
+        conn.commit()
+        done += len(chunk)
+        print(f"  > {done}/{len(todo)} pertanyaan selesai...")
+    conn.close()
+    print(f"✅ {done} jawaban dihitung dalam {time.perf_counter() - t_start:.1f}s ({mid})")
+    return done
+
+
+def unpriced_answers(conn: sqlite3.Connection, table: str, prices: PriceMap) -> int:
+    """Jumlah jawaban yang masih berisi {{placeholder}} setelah diisi harga (harga_data belum punya harganya)."""
+    answers = [a for (a,) in conn.execute(
+        "SELECT answer FROM precomputed_answers WHERE tbl = ? AND span_start >= 0", (table,))]
+    return sum(1 for a in prices.expand_bulk(answers) if a and PLACEHOLDER_RE.search(a))
+
+
+def stats(db_path=DB_PATH):
+    conn = sqlite3.connect(db_path)
+    ensure_precomputed_table(conn)
+    prices = PriceMap()
+    prices.load(conn)
+    for tbl, n, clusters, conf, lat, no_span in conn.execute("""
+        SELECT tbl, COUNT(*), COUNT(DISTINCT cluster), AVG(confidence), AVG(latency_ms), SUM(span_start < 0)
+        FROM precomputed_answers GROUP BY tbl ORDER BY tbl
+    """).fetchall():
+        print(f"📊 {tbl:<18} | {n:>5} baris | {clusters:>5} cluster | confidence avg={conf or 0:.3f} "
+              f"| latency avg={lat or 0:.1f} ms | tanpa span={no_span} "
+              f"| placeholder tanpa harga={unpriced_answers(conn, tbl, prices)}")
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute jawaban model untuk semua pertanyaan dataset")
+    parser.add_argument("--db", default=DB_PATH)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_build = sub.add_parser("build", help="hitung jawaban (incremental)")
+    p_build.add_argument("--full", action="store_true", help="hitung ulang semua baris")
+    p_build.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    p_build.add_argument("--backend", default=QA_BACKEND)
+
+    sub.add_parser("stats", help="ringkasan tabel precomputed_answers")
+
+    args = parser.parse_args()
+    if args.cmd == "build":
+        build(args.db, backend=args.backend, batch_size=args.batch_size, full=args.full)
+    elif args.cmd == "stats":
+        stats(args.db)
+
+
+if __name__ == "__main__":
+    main()
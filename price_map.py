@@ -0,0 +1,126 @@
+# price_map.py — tabel harga_data di memori untuk mengganti {{placeholder}} tanpa query DB
+import re
+import sqlite3
+from typing import Dict, Iterable, List, Optional
+
+# pola placeholder: {{nama_produk}}, {{ nama produk }}, {{{x}}} dst.
+PLACEHOLDER_RE = re.compile(r"\{+\s*\{+\s*([A-Za-z0-9 _\-]+?)\s*\}+\s*\}+")
+_MULTI_UNDERSCORE_RE = re.compile(r"_+")
+
+
+def normalize_placeholder(raw: str) -> str:
+    # hilangkan spasi & underscore berantakan jadi underscore normal
+    return _MULTI_UNDERSCORE_RE.sub("_", raw.replace(" ", ""))
+
+
+def ensure_price_change_log(conn: sqlite3.Connection):
+    """
+    Tabel log + trigger pada harga_data. Setiap insert/update/delete harga (dari bot maupun
+    create_database.py) mencatat placeholder yang berubah, sehingga PriceMap cukup
+    memuat ulang placeholder tsb, bukan seluruh tabel.
+    """
+    conn.executescript("""
+    CREATE TABLE IF NOT EXISTS harga_data_log (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        placeholder TEXT,
+        waktu TEXT DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TRIGGER IF NOT EXISTS harga_data_ai AFTER INSERT ON harga_data BEGIN
+        INSERT INTO harga_data_log (placeholder) VALUES (NEW.placeholder);
+    END;
+    CREATE TRIGGER IF NOT EXISTS harga_data_au AFTER UPDATE ON harga_data BEGIN
+        INSERT INTO harga_data_log (placeholder) VALUES (OLD.placeholder);
+        INSERT INTO harga_data_log (placeholder) VALUES (NEW.placeholder);
+    END;
+    CREATE TRIGGER IF NOT EXISTS harga_data_ad AFTER DELETE ON harga_data BEGIN
+        INSERT INTO harga_data_log (placeholder) VALUES (OLD.placeholder);
+    END;
+    """)
+    # log lama tidak dibutuhkan lagi (semua proses bot sudah membacanya)
+    conn.execute("DELETE FROM harga_data_log WHERE waktu < datetime('now', '-7 days')")
+    conn.commit()
+
+
+class PriceMap:
+    """
+    placeholder -> harga di memori. expand() mengganti semua placeholder dalam satu pass regex
+    tanpa query DB; refresh() hanya memuat placeholder yang tercatat berubah di harga_data_log.
+    """
+
+    def __init__(self):
+        self.prices: Dict[str, str] = {}
+        self.last_seq = 0  # seq terakhir di harga_data_log yang sudah diterapkan
+
+    @staticmethod
+    def _log_seq(conn) -> int:
+        try:
+            r = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM harga_data_log").fetchone()
+            return r[0]
+        except sqlite3.Error:
+            return 0
+
+    def load(self, conn: sqlite3.Connection):
+        """Muat seluruh harga_data (dipanggil saat start)."""
+        seq = self._log_seq(conn)
+        prices = {}
+        try:
+            rows = conn.execute("SELECT placeholder, harga FROM harga_data ORDER BY id").fetchall()
+        except sqlite3.Error as e:
+            print(f"[WARN] harga_data tidak bisa dibaca: {e}")
+            rows = []
+        for placeholder, harga in rows:
+            if placeholder and placeholder not in prices:  # sama dengan fetchone(): baris pertama menang
+                prices[placeholder] = harga
+        self.prices = prices
+        self.last_seq = seq
+
+    def refresh(self, conn: sqlite3.Connection, get_price=None) -> int:
+        """
+        Terapkan perubahan sejak refresh terakhir. get_price(conn, placeholder) dipakai untuk
+        membaca harga terbaru satu placeholder. Return jumlah placeholder yang diperbarui.
+        """
+        try:
+            rows = conn.execute(
+                "SELECT seq, placeholder FROM harga_data_log WHERE seq > ? ORDER BY seq", (self.last_seq,)
+            ).fetchall()
+        except sqlite3.Error:
+            return 0
+        if not rows:
+            return 0
+        changed = {p for _, p in rows if p}
+        prices = dict(self.prices)  # copy-on-write: pembaca lain tetap melihat dict lama yang utuh
+        for placeholder in changed:
+            harga = get_price(conn, placeholder) if get_price else self._fetch_price(conn, placeholder)
+            if harga is None:
+                prices.pop(placeholder, None)
+            else:
+                prices[placeholder] = harga
+        self.prices = prices
+        self.last_seq = rows[-1][0]
+        return len(changed)
+
+    @staticmethod
+    def _fetch_price(conn, placeholder) -> Optional[str]:
+        r = conn.execute("SELECT harga FROM harga_data WHERE placeholder = ? ORDER BY id LIMIT 1", (placeholder,)).fetchone()
+        return r[0] if r else None
+
+    def get(self, placeholder: str) -> Optional[str]:
+        return self.prices.get(placeholder)
+
+    @staticmethod
+    def _replacer(prices):
+        def repl(match):
+            price = prices.get(normalize_placeholder(match.group(1)))
+            return price if price else match.group(0)
+        return repl
+
+    def expand(self, text: str) -> str:
+        """Ganti semua {{placeholder}} dengan harga; placeholder yang tidak dikenal dibiarkan utuh."""
+        if not text:
+            return text
+        return PLACEHOLDER_RE.sub(self._replacer(self.prices), text)
+
+    def expand_bulk(self, texts: Iterable[str]) -> List[str]:
+        """Versi banyak teks sekaligus (evaluasi batch, jawaban precomputed): satu snapshot harga untuk semua teks."""
+        repl = self._replacer(self.prices)
+        return [PLACEHOLDER_RE.sub(repl, t) if t else t for t in texts]
@@ -0,0 +1,291 @@
+# qa_backend.py — pilihan backend inferensi model QA (PyTorch fp32 / int8 / ONNX Runtime)
+#
+# Pemakaian dari command line:
+#   python qa_backend.py export                 # ekspor model finetuned ke ONNX
+#   python qa_backend.py parity                 # cek kesamaan logits + EM/F1 tiap backend vs fp32
+#   python qa_backend.py bench --batch-size 8   # bandingkan latency & throughput tiap backend
+#   python qa_backend.py window-bench           # latency sliding window vs truncation per panjang context
+import argparse  # argumen command line
+import os  # cek file & folder
+import sqlite3  # ambil dataset QA dari bengkel.db
+import statistics  # hitung median latency
+import time  # ukur latency
+from types import SimpleNamespace  # output ONNX dibuat mirip output HuggingFace
+
+import torch  # tensor & quantization
+from transformers import AutoTokenizer, AutoModelForQuestionAnswering
+
+# ========== CONFIG ==========
+MODEL_PATH = r"C:\Users\Widya HW\OneDrive - Universitas Tarumanagara\Desktop\Skripsi\Fix Program\indobert-qa-finetuned-final-v2"
+ONNX_PATH = r"C:\Users\Widya HW\OneDrive - Universitas Tarumanagara\Desktop\Skripsi\Fix Program\indobert-qa-finetuned-final-v2\model.onnx"
+DB_PATH = r"C:\Users\Widya HW\OneDrive - Universitas Tarumanagara\Desktop\Skripsi\Fix Program\bengkel.db"
+QA_TABLES = ["qa_service", "oli_fix", "gabungan_umum", "gabungan_bis_truk"]
+
+BACKENDS = ("torch_fp32", "torch_int8", "onnx")
+ONNX_INPUT_NAMES = ["input_ids", "attention_mask", "token_type_ids"]
+ONNX_OPSET = 14
+# ============================
+
+
+class OnnxQAModel:
+    """Bungkus ONNX Runtime session supaya bisa dipanggil seperti model HuggingFace: model(**inputs)."""
+
+    def __init__(self, onnx_path, num_threads=None):
+        import onnxruntime as ort  # opsional: hanya dibutuhkan untuk backend "onnx"
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            opts.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(onnx_path, sess_options=opts, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def eval(self):
+        return self  # kompatibel dengan model.eval() di PyTorch
+
+    def __call__(self, **inputs):
+        feed = {k: v.cpu().numpy() for k, v in inputs.items() if k in self.input_names}
+        start_logits, end_logits = self.session.run(["start_logits", "end_logits"], feed)
+        return SimpleNamespace(start_logits=torch.from_numpy(start_logits),
+                               end_logits=torch.from_numpy(end_logits))
+
+
+def load_qa_model(model_path=MODEL_PATH, backend="torch_fp32", onnx_path=ONNX_PATH):
+    """
+    Load model QA sesuai backend:
+    - torch_fp32 : model asli (PyTorch float32)
+    - torch_int8 : dynamic quantization int8 pada semua layer Linear (CPU)
+    - onnx       : ONNX Runtime session dari file hasil `python qa_backend.py export`
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"backend tidak dikenal: {backend} (pilih salah satu dari {BACKENDS})")
+    if backend == "onnx":
+        if not os.path.exists(onnx_path):
+            raise FileNotFoundError(f"File ONNX tidak ditemukan: {onnx_path}. Jalankan dulu: python qa_backend.py export")
+        return OnnxQAModel(onnx_path)
+
+    model = AutoModelForQuestionAnswering.from_pretrained(model_path)
+    model.eval()
+    if backend == "torch_int8":
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+# === Export ===
+def export_onnx(model_path=MODEL_PATH, onnx_path=ONNX_PATH, opset=ONNX_OPSET):
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    model = AutoModelForQuestionAnswering.from_pretrained(model_path)
+    model.eval()
+    model.config.return_dict = False  # torch.onnx butuh output tuple
+
+    dummy = tokenizer("berapa harga oli?", "Keyword terkait: oli. Harga oli {{oli_castrol}}.", return_tensors="pt")
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in ONNX_INPUT_NAMES + ["start_logits", "end_logits"]}
+    os.makedirs(os.path.dirname(os.path.abspath(onnx_path)), exist_ok=True)
+    torch.onnx.export(
+        model,
+        tuple(dummy[name] for name in ONNX_INPUT_NAMES),
+        onnx_path,
+        input_names=ONNX_INPUT_NAMES,
+        output_names=["start_logits", "end_logits"],
+        dynamic_axes=dynamic_axes,
+        opset_version=opset,
+        do_constant_folding=True,
+    )
+    print(f"✅ Model diekspor ke ONNX: {onnx_path}")
+
+
+# === Dataset QA (dari bengkel.db) ===
+def load_qa_pairs(db_path=DB_PATH, tables=QA_TABLES, limit=None):
+    """Ambil (question, context, answer) dari tabel dataset QA."""
+    conn = sqlite3.connect(db_path)
+    rows = []
+    for table in tables:
+        try:
+            cur = conn.execute(f"SELECT question, context, answer FROM {table}")
+        except sqlite3.Error as e:
+            print(f"[WARN] tabel {table} tidak bisa dibaca: {e}")
+            continue
+        rows.extend((q or "", c or "", a or "") for q, c, a in cur.fetchall())
+    conn.close()
+    return rows[:limit] if limit else rows
+
+
+def _batches(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _run_logits(tokenizer, model, pairs):
+    inputs = tokenizer([q for q, _ in pairs], [c for _, c in pairs], return_tensors="pt",
+                       truncation=True, max_length=512, padding=True)
+    with torch.no_grad():
+        out = model(**inputs)
+    return inputs, out.start_logits, out.end_logits
+
+
+# === Parity check ===
+def parity_check(backends=("torch_int8", "onnx"), batch_size=16, limit=None):
+    """Bandingkan logits & jawaban tiap backend terhadap fp32, plus EM/F1 terhadap ground truth."""
+    from eval_chatbot import exact_match, token_f1  # metrik yang sama dengan evaluasi chatbot
+    import qa_inference
+
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_PATH)
+    data = load_qa_pairs(limit=limit)
+    if not data:
+        print("[WARN] dataset QA kosong, parity check dibatalkan")
+        return
+    pairs = [(q, c) for q, c, _ in data]
+    gts = [a for _, _, a in data]
+
+    models = {"torch_fp32": load_qa_model(backend="torch_fp32")}
+    for b in backends:
+        try:
+            models[b] = load_qa_model(backend=b)
+        except (FileNotFoundError, ImportError) as e:
+            print(f"[WARN] backend {b} dilewati: {e}")
+
+    ref = {"start": [], "end": [], "answers": []}
+    for chunk in _batches(pairs, batch_size):
+        inputs, s, e = _run_logits(tokenizer, models["torch_fp32"], chunk)
+        mask = inputs["attention_mask"].bool()
+        ref["start"].append((s, mask))
+        ref["end"].append(e)
+        ref["answers"].extend(qa_inference.answer_questions_batch(tokenizer, models["torch_fp32"], chunk))
+
+    for name, m in models.items():
+        max_diff = 0.0
+        same_argmax = 0
+        answers = []
+        for bi, chunk in enumerate(_batches(pairs, batch_size)):
+            _, s, e = _run_logits(tokenizer, m, chunk)
+            ref_s, mask = ref["start"][bi]
+            ref_e = ref["end"][bi]
+            # bandingkan hanya token non-padding
+            max_diff = max(max_diff,
+                           float((s - ref_s).abs()[mask].max()),
+                           float((e - ref_e).abs()[mask].max()))
+            neg = float("-inf")
+            same = ((s.masked_fill(~mask, neg).argmax(-1) == ref_s.masked_fill(~mask, neg).argmax(-1)) &
+                    (e.masked_fill(~mask, neg).argmax(-1) == ref_e.masked_fill(~mask, neg).argmax(-1)))
+            same_argmax += int(same.sum())
+            answers.extend(qa_inference.answer_questions_batch(tokenizer, m, chunk))
+
+        n = len(pairs)
+        em = sum(exact_match(p, g) for p, g in zip(answers, gts)) / n * 100
+        f1 = sum(token_f1(p, g) for p, g in zip(answers, gts)) / n * 100
+        agree = sum(a == r for a, r in zip(answers, ref["answers"])) / n * 100
+        print(f"📊 {name:<11} | max|Δlogit|={max_diff:.4f} | span sama={same_argmax / n * 100:.2f}% "
+              f"| jawaban sama={agree:.2f}% | EM={em:.2f}% | F1={f1:.2f}%")
+
+
+# === Benchmark ===
+def benchmark(backends=BACKENDS, batch_size=8, repeat=3, limit=200):
+    """Latency per pertanyaan (batch 1) dan throughput (batch_size) untuk tiap backend."""
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_PATH)
+    data = load_qa_pairs(limit=limit)
+    if not data:
+        print("[WARN] dataset QA kosong, benchmark dibatalkan")
+        return
+    pairs = [(q, c) for q, c, _ in data]
+
+    for name in backends:
+        try:
+            m = load_qa_model(backend=name)
+        except (FileNotFoundError, ImportError) as e:
+            print(f"[WARN] backend {name} dilewati: {e}")
+            continue
+        _run_logits(tokenizer, m, pairs[:1])  # warm-up
+
+        latencies = []
+        for q, c in pairs[:50]:
+            t0 = time.perf_counter()
+            _run_logits(tokenizer, m, [(q, c)])
+            latencies.append((time.perf_counter() - t0) * 1000)
+        latencies.sort()
+        p95 = latencies[int(0.95 * (len(latencies) - 1))]
+
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            for chunk in _batches(pairs, batch_size):
+                _run_logits(tokenizer, m, chunk)
+        qps = len(pairs) * repeat / (time.perf_counter() - t0)
+        print(f"⏱️ {name:<11} | latency p50={statistics.median(latencies):.1f} ms p95={p95:.1f} ms "
+              f"| throughput (batch {batch_size})={qps:.1f} pertanyaan/detik")
+
+
+# === Benchmark sliding window ===
+def benchmark_windows(backend="torch_fp32", lengths=(128, 256, 384, 512, 1024, 2048), repeat=10):
+    """
+    Latency satu pertanyaan per panjang context (token): sliding window (384/128, seperti finetune.py)
+    vs truncation lama (512 token, sisa context dibuang).
+    Context panjang dibuat dengan menyambung context dataset sampai panjangnya tercapai.
+    """
+    import qa_inference
+
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_PATH)
+    data = load_qa_pairs()
+    if not data:
+        print("[WARN] dataset QA kosong, benchmark dibatalkan")
+        return
+    m = load_qa_model(backend=backend)
+    question = data[0][0]
+    text = ""
+    for _, c, _ in data:
+        text += c + " "
+        if len(tokenizer(text, add_special_tokens=False)["input_ids"]) >= max(lengths):
+            break
+    full = qa_inference.encode_context(tokenizer, text)
+    if len(full.input_ids) < max(lengths):
+        print(f"[WARN] total context dataset hanya {len(full.input_ids)} token")
+
+    def timed(ctx, **kw):
+        qa_inference.predict_batch(tokenizer, m, [(question, ctx)], **kw)  # warm-up
+        lat = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            timings = {}
+            qa_inference.predict_batch(tokenizer, m, [(question, ctx)], timings=timings, **kw)
+            lat.append((time.perf_counter() - t0) * 1000)
+        return statistics.median(lat), timings.get("windows", 1)
+
+    print(f"{'token':>6} | {'window':>6} | {'window ms':>9} | {'truncate ms':>11} | {'rasio':>5}")
+    for n in lengths:
+        n = min(n, len(full.input_ids))
+        ctx = qa_inference.EncodedContext(full.text, full.input_ids[:n], full.starts[:n], full.ends[:n])
+        win_ms, windows = timed(ctx)
+        trunc_ms, _ = timed(ctx, max_length=512, stride=None)
+        print(f"{n:>6} | {windows:>6} | {win_ms:>9.1f} | {trunc_ms:>11.1f} | {win_ms / trunc_ms:>5.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backend inferensi model QA IndoBERT")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_exp = sub.add_parser("export", help="ekspor model ke ONNX")
+    p_exp.add_argument("--opset", type=int, default=ONNX_OPSET)
+
+    p_par = sub.add_parser("parity", help="cek logits & EM/F1 backend vs fp32")
+    p_par.add_argument("--batch-size", type=int, default=16)
+    p_par.add_argument("--limit", type=int, default=None)
+
+    p_bench = sub.add_parser("bench", help="bandingkan latency & throughput backend")
+    p_bench.add_argument("--batch-size", type=int, default=8)
+    p_bench.add_argument("--repeat", type=int, default=3)
+    p_bench.add_argument("--limit", type=int, default=200)
+
+    p_win = sub.add_parser("window-bench", help="latency sliding window per panjang context")
+    p_win.add_argument("--backend", choices=BACKENDS, default="torch_fp32")
+    p_win.add_argument("--repeat", type=int, default=10)
+
+    args = parser.parse_args()
+    if args.cmd == "export":
+        export_onnx(opset=args.opset)
+    elif args.cmd == "parity":
+        parity_check(batch_size=args.batch_size, limit=args.limit)
+    elif args.cmd == "bench":
+        benchmark(batch_size=args.batch_size, repeat=args.repeat, limit=args.limit)
+    elif args.cmd == "window-bench":
+        benchmark_windows(backend=args.backend, repeat=args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# qa_batcher.py — micro-batching untuk inferensi IndoBERT QA
+import asyncio  # event loop, queue & future untuk tiap pertanyaan
+import time  # hitung batas waktu tunggu batch
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+
+class MicroBatcher:
+    """
+    Kumpulkan pasangan (question, context) yang datang bersamaan dari semua mode
+    selama beberapa milidetik, lalu jalankan satu forward pass untuk semuanya.
+
+    dispatch: coroutine function list[(question, context)] -> list[jawaban] (urutan sama),
+    misalnya WorkerPool.run_model, yang menjalankan forward pass di luar event loop.
+    max_inflight: jumlah batch yang boleh berjalan bersamaan (sesuaikan dengan jumlah worker).
+    """
+
+    def __init__(self, dispatch: Callable[[List[Tuple[str, str]]], Awaitable[list]],
+                 max_batch_size: int = 8, max_wait_ms: float = 10.0, max_inflight: int = 1):
+        self.dispatch = dispatch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.max_inflight = max(1, int(max_inflight))
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_task: Optional[asyncio.Task] = None
+        self._inflight: Optional[asyncio.Semaphore] = None
+        # statistik sederhana untuk cek efektivitas batching
+        self.total_batches = 0
+        self.total_items = 0
+
+    def _ensure_worker(self):
+        # queue & worker dibuat saat pertama dipakai, di dalam loop yang sedang berjalan
+        if self._worker_task is None or self._worker_task.done():
+            self._queue = asyncio.Queue()
+            self._inflight = asyncio.Semaphore(self.max_inflight)
+            self._worker_task = asyncio.get_running_loop().create_task(self._worker())
+
+    async def submit(self, question: str, context):
+        """Masukkan satu pertanyaan (context: string atau EncodedContext) ke antrean batch dan tunggu jawabannya."""
+        self._ensure_worker()
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put(((question, context), fut))
+        return await fut
+
+    async def _collect_batch(self):
+        # tunggu item pertama, lalu kumpulkan sisanya sampai penuh atau waktu habis
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run_batch(self, batch):
+        pairs = [item for item, _ in batch]
+        try:
+            results = await self.dispatch(pairs)
+        except Exception as e:  # kirim error ke semua handler yang menunggu
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        finally:
+            self._inflight.release()
+
+        self.total_batches += 1
+        self.total_items += len(batch)
+        for (_, fut), res in zip(batch, results):
+            if not fut.done():  # handler bisa saja sudah dibatalkan
+                fut.set_result(res)
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._inflight.acquire()  # tunggu sampai ada worker kosong sebelum ambil batch baru
+            batch = await self._collect_batch()
+            loop.create_task(self._run_batch(batch))
+
+    async def stop(self):
+        """Hentikan worker (dipanggil saat bot shutdown)."""
+        if self._worker_task is not None:
+            self._worker_task.cancel()
+            try:
+                await self._worker_task
+            except asyncio.CancelledError:
+                pass
+            self._worker_task = None
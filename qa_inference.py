@@ -0,0 +1,234 @@
+# qa_inference.py — inti inferensi IndoBERT QA (dipakai bot & worker process)
+import time  # timing per tahap (tokenize / forward / decode)
+from array import array  # penyimpanan token id & offset yang ringkas
+from typing import NamedTuple
+
+import torch  # operasi tensor untuk model
+
+
+class QAPrediction(NamedTuple):
+    """Jawaban model + skor span (start_logit + end_logit) untuk reranking, prob = p(start) * p(end)."""
+    answer: str
+    score: float
+    prob: float = 0.0
+    start: int = -1  # offset karakter span di teks context (-1 = tidak ada span valid)
+    end: int = -1
+
+
+def build_model_context(keyword, context_text):
+    """Teks context yang diberikan ke model (bot, precompute & evaluasi harus memakai format yang sama)."""
+    return f"Keyword terkait: {keyword}. {context_text}"
+
+
+class EncodedContext(NamedTuple):
+    """Hasil tokenisasi satu context: token id + offset karakter (tanpa token spesial)."""
+    text: str
+    input_ids: array
+    starts: array  # offset karakter awal tiap token
+    ends: array    # offset karakter akhir tiap token
+
+
+def encode_context(tokenizer, text):
+    enc = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+    return EncodedContext(
+        text,
+        array("i", enc["input_ids"]),
+        array("i", (s for s, _ in enc["offset_mapping"])),
+        array("i", (e for _, e in enc["offset_mapping"])),
+    )
+
+
+class ContextEncodingStore:
+    """
+    Token id & offset semua paragraf, dihitung sekali saat dataset di-load.
+    Disimpan rata di array("i") + pointer per paragraf; context yang sama
+    (banyak baris QA memakai paragraf yang sama) hanya disimpan sekali.
+    """
+
+    def __init__(self, tokenizer, contexts):
+        self.texts = []                # teks unik
+        self.ids = array("i")          # semua token id, disambung
+        self.starts = array("i")       # offset awal karakter per token
+        self.ends = array("i")         # offset akhir karakter per token
+        self.ptr = array("i", [0])     # batas token tiap teks unik di array di atas
+        self.row_slot = array("i")     # baris dataset -> index teks unik
+
+        slot_of = {}
+        for text in contexts:
+            if text not in slot_of:
+                slot_of[text] = len(self.texts)
+                self.texts.append(text)
+            self.row_slot.append(slot_of[text])
+
+        if self.texts:
+            enc = tokenizer(self.texts, add_special_tokens=False, return_offsets_mapping=True)  # satu panggilan untuk semua
+            for ids, offsets in zip(enc["input_ids"], enc["offset_mapping"]):
+                self.ids.extend(ids)
+                self.starts.extend(s for s, _ in offsets)
+                self.ends.extend(e for _, e in offsets)
+                self.ptr.append(len(self.ids))
+
+    def __len__(self):
+        return len(self.row_slot)
+
+    def get(self, row):
+        slot = self.row_slot[row]
+        a, b = self.ptr[slot], self.ptr[slot + 1]
+        return EncodedContext(self.texts[slot], self.ids[a:b], self.starts[a:b], self.ends[a:b])
+
+
+# Sama dengan finetune.py: model dilatih dengan window 384 token, overlap (stride) 128 token
+WINDOW_MAX_LENGTH = 384
+WINDOW_STRIDE = 128
+
+
+def _split_budget(q_len, c_len, budget):
+    # mirip truncation="longest_first": potong bagian yang lebih panjang lebih dulu
+    if q_len + c_len <= budget:
+        return q_len, c_len
+    q_keep = min(q_len, max(budget - c_len, budget // 2))
+    return q_keep, min(c_len, budget - q_keep)
+
+
+def _window_starts(c_len, c_keep, stride):
+    """Awal tiap window context (token); window berikutnya mundur `stride` token dari ujung window sebelumnya."""
+    if stride is None or c_len <= c_keep:
+        return [0]
+    step = max(1, c_keep - stride)
+    starts = list(range(0, c_len - c_keep, step))
+    starts.append(c_len - c_keep)  # window terakhir pas di ujung context
+    return starts
+
+
+def build_batch_inputs(tokenizer, questions, contexts, max_length=WINDOW_MAX_LENGTH, stride=WINDOW_STRIDE):
+    """
+    Susun input [CLS] question [SEP] context [SEP] dari token context yang sudah jadi.
+    Context yang lebih panjang dari window dipecah menjadi beberapa window yang saling overlap
+    (stride=None → dipotong seperti truncation biasa). Padding dinamis ke sekuens terpanjang.
+    Return: (inputs tensor dict, list (ctx_start, EncodedContext window) per baris,
+             list index pasangan asal per baris)
+    """
+    q_ids = tokenizer(list(questions), add_special_tokens=False)["input_ids"]
+    cls_id, sep_id, pad_id = tokenizer.cls_token_id, tokenizer.sep_token_id, tokenizer.pad_token_id
+    budget = max_length - 3  # [CLS], [SEP], [SEP]
+
+    rows, spans, owners = [], [], []
+    for pair_idx, (q, ctx) in enumerate(zip(q_ids, contexts)):
+        c_len = len(ctx.input_ids)
+        if stride is None:
+            q_keep, c_keep = _split_budget(len(q), c_len, budget)
+        else:
+            q_keep = min(len(q), budget // 2)  # sisa budget untuk context; context panjang → beberapa window
+            c_keep = min(c_len, budget - q_keep)
+        ctx_start = q_keep + 2
+        for w in _window_starts(c_len, c_keep, stride):
+            ids = [cls_id] + q[:q_keep] + [sep_id] + list(ctx.input_ids[w:w + c_keep]) + [sep_id]
+            rows.append((ids, ctx_start))
+            # offset karakter tetap relatif ke teks context utuh
+            spans.append((ctx_start, EncodedContext(ctx.text, ctx.input_ids[w:w + c_keep],
+                                                    ctx.starts[w:w + c_keep], ctx.ends[w:w + c_keep])))
+            owners.append(pair_idx)
+
+    seq_len = max(len(ids) for ids, _ in rows)
+    input_ids = torch.full((len(rows), seq_len), pad_id, dtype=torch.long)
+    token_type_ids = torch.zeros((len(rows), seq_len), dtype=torch.long)
+    attention_mask = torch.zeros((len(rows), seq_len), dtype=torch.long)
+    for i, (ids, ctx_start) in enumerate(rows):
+        n = len(ids)
+        input_ids[i, :n] = torch.tensor(ids, dtype=torch.long)
+        token_type_ids[i, ctx_start:n] = 1
+        attention_mask[i, :n] = 1
+    inputs = {"input_ids": input_ids, "token_type_ids": token_type_ids, "attention_mask": attention_mask}
+    return inputs, spans, owners
+
+
+def context_token_mask(spans, seq_len):
+    """True hanya di token context (tanpa [CLS], pertanyaan, [SEP] dan padding)."""
+    mask = torch.zeros((len(spans), seq_len), dtype=torch.bool)
+    for i, (ctx_start, ctx) in enumerate(spans):
+        mask[i, ctx_start:ctx_start + len(ctx.input_ids)] = True
+    return mask
+
+
+# === Decoder span ===
+MAX_ANSWER_TOKENS = 64  # span lebih panjang dari ini tidak dipilih
+SPAN_TOP_N = 20         # kandidat start x end yang dicek per baris
+
+
+class SpanBatch(NamedTuple):
+    """Span terbaik per baris (tensor shape (B,)); score = -inf jika tidak ada span valid."""
+    start: torch.Tensor
+    end: torch.Tensor
+    score: torch.Tensor  # start_logit + end_logit
+    prob: torch.Tensor   # softmax start x softmax end (hanya atas token context)
+
+
+def decode_spans(start_logits, end_logits, ctx_mask, top_n=SPAN_TOP_N, max_answer_tokens=MAX_ANSWER_TOKENS):
+    """
+    Cari span terbaik secara vektor untuk satu batch logits (B, L):
+    top-n start x top-n end, hanya token context (ctx_mask), start <= end dan
+    panjang span <= max_answer_tokens. Dipakai bot (predict_batch) dan skrip evaluasi.
+    """
+    neg = float("-inf")
+    start_logits = start_logits.float().masked_fill(~ctx_mask, neg)
+    end_logits = end_logits.float().masked_fill(~ctx_mask, neg)
+    n = min(top_n, start_logits.shape[-1])
+    s_val, s_idx = start_logits.topk(n, dim=-1)                     # (B, n)
+    e_val, e_idx = end_logits.topk(n, dim=-1)
+    length = e_idx[:, None, :] - s_idx[:, :, None]                   # (B, n, n)
+    valid = (length >= 0) & (length < max_answer_tokens)
+    scores = (s_val[:, :, None] + e_val[:, None, :]).masked_fill(~valid, neg)
+    best, flat = scores.flatten(1).max(dim=-1)
+    start = s_idx.gather(1, torch.div(flat, n, rounding_mode="floor")[:, None]).squeeze(1)
+    end = e_idx.gather(1, (flat % n)[:, None]).squeeze(1)
+    log_p = (start_logits.log_softmax(-1).gather(1, start[:, None]) +
+             end_logits.log_softmax(-1).gather(1, end[:, None])).squeeze(1)
+    prob = log_p.exp().masked_fill(~torch.isfinite(best), 0.0)
+    return SpanBatch(start, end, best, prob)
+
+
+def predict_batch(tokenizer, model, pairs, max_length=WINDOW_MAX_LENGTH, stride=WINDOW_STRIDE, timings=None):
+    """
+    Jawab banyak pasangan (question, context) dalam satu forward pass → list QAPrediction.
+    context boleh berupa string atau EncodedContext (sudah ditokenisasi di ContextEncodingStore).
+    Context panjang dipecah ke beberapa window (ikut satu forward pass yang sama); span terbaik
+    dari semua window dipilih berdasarkan start_logit + end_logit.
+    Jawaban diambil langsung dari teks context lewat offset karakter, tanpa tokenizer.decode.
+    timings: dict opsional, diisi lama tahap tokenize / forward / decode (detik) untuk batch ini.
+    """
+    if not pairs:
+        return []
+    t0 = time.perf_counter()
+    questions = [q for q, _ in pairs]
+    contexts = [c if isinstance(c, EncodedContext) else encode_context(tokenizer, c) for _, c in pairs]
+    inputs, spans, owners = build_batch_inputs(tokenizer, questions, contexts, max_length, stride)  #  encoding satu batch
+    t1 = time.perf_counter()
+    with torch.no_grad():                                             #  matikan gradient (evaluasi mode)
+        outputs = model(**inputs)                                     #  forward pass model
+    t2 = time.perf_counter()
+    # hanya token context yang boleh terpilih, supaya skor antar window sebanding
+    ctx_mask = context_token_mask(spans, inputs["input_ids"].shape[1])
+    found = decode_spans(outputs.start_logits, outputs.end_logits, ctx_mask)
+    best = [None] * len(pairs)  # per pasangan: (valid, skor, prob, jawaban) terbaik dari semua window-nya
+    for owner, (ctx_start, ctx), s, e, score, prob in zip(owners, spans, found.start.tolist(), found.end.tolist(),
+                                                         found.score.tolist(), found.prob.tolist()):
+        valid = score != float("-inf")
+        s -= ctx_start
+        e -= ctx_start
+        char_span = (ctx.starts[s], ctx.ends[e]) if valid else (-1, -1)
+        answer = ctx.text[char_span[0]:char_span[1]].strip() if valid else ""  #  teks jawaban dari offset
+        cand = (valid, score, prob, answer, char_span)
+        if best[owner] is None or cand[:2] > best[owner][:2]:
+            best[owner] = cand
+    preds = [QAPrediction(answer, score, prob, *span) for _, score, prob, answer, span in best]
+    if timings is not None:
+        timings["tokenize"] = t1 - t0
+        timings["forward"] = t2 - t1
+        timings["decode"] = time.perf_counter() - t2
+        timings["windows"] = len(spans)
+    return preds
+
+
+def answer_questions_batch(tokenizer, model, pairs, max_length=WINDOW_MAX_LENGTH, stride=WINDOW_STRIDE):
+    """Seperti predict_batch, tapi hanya mengembalikan teks jawaban."""
+    return [p.answer for p in predict_batch(tokenizer, model, pairs, max_length, stride)]
@@ -0,0 +1,123 @@
+# replay_webhook.py — kirim payload update Telegram ke webhook lokal (uji BOT_MODE = "webhook")
+#
+# Pemakaian:
+#   python replay_webhook.py --file updates.jsonl                  # satu JSON Update per baris
+#   python replay_webhook.py --from-chatlog --users 16 --limit 200  # update sintetis dari chat_log_*.txt
+#
+# Catatan: balasan bot tetap dikirim ke API Telegram; chat_id sintetis akan ditolak Telegram
+# ("chat not found") tapi jalur webhook → antrean → handler tetap teruji.
+import argparse  # argumen command line
+import json  # payload update
+import statistics  # median latency
+import time  # ukur latency & throughput
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from eval_chatbot import CHATLOG_FILES, read_chatlog_lines
+
+URL = "http://127.0.0.1:8443/telegram"  # WEBHOOK_LISTEN/WEBHOOK_PORT/WEBHOOK_PATH di Main_Final.py
+MODE_CALLBACKS = {"layanan": "mode_1", "harga_oli": "mode_3", "harga_umum_mobil": "mode_4", "harga_umum_bis": "mode_5"}
+
+
+def _user(chat_id):
+    return {"id": chat_id, "is_bot": False, "first_name": f"Replay{chat_id}"}
+
+
+def message_update(update_id, chat_id, text):
+    return {"update_id": update_id, "message": {
+        "message_id": update_id, "date": int(time.time()), "text": text,
+        "chat": {"id": chat_id, "type": "private"}, "from": _user(chat_id)}}
+
+
+def callback_update(update_id, chat_id, data):
+    return {"update_id": update_id, "callback_query": {
+        "id": str(update_id), "from": _user(chat_id), "chat_instance": str(chat_id), "data": data,
+        "message": {"message_id": update_id, "date": int(time.time()), "text": "menu",
+                    "chat": {"id": chat_id, "type": "private"}}}}
+
+
+def updates_from_chatlog(users, limit, chat_id_base=900_000_000):
+    """Bagi pertanyaan chat log ke beberapa user; tiap user memilih mode dulu lewat callback."""
+    items = [(r["mode"], r["question"]) for path in CHATLOG_FILES.values() for r in read_chatlog_lines(path)
+             if r.get("mode") in MODE_CALLBACKS and r.get("question")]
+    items = items[:limit] if limit else items
+    per_chat, uid = {}, 1
+    for i, (mode, question) in enumerate(items):
+        chat_id = chat_id_base + i % users
+        seq = per_chat.setdefault(chat_id, [])
+        if not seq or seq[-1][0] != mode:
+            seq.append((mode, callback_update(uid, chat_id, MODE_CALLBACKS[mode])))
+            uid += 1
+        seq.append((mode, message_update(uid, chat_id, question)))
+        uid += 1
+    return [[u for _, u in seq] for seq in per_chat.values()]
+
+
+def updates_from_file(path):
+    """Payload rekaman: urutan per chat dipertahankan, chat berbeda dikirim paralel."""
+    per_chat = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            upd = json.loads(line)
+            body = upd.get("message") or upd.get("callback_query", {}).get("message") or {}
+            per_chat.setdefault(body.get("chat", {}).get("id"), []).append(upd)
+    return list(per_chat.values())
+
+
+def post(url, payload, secret):
+    headers = {"Content-Type": "application/json"}
+    if secret:
+        headers["X-Telegram-Bot-Api-Secret-Token"] = secret
+    req = urllib.request.Request(url, data=json.dumps(payload).encode("utf-8"), headers=headers)
+    t0 = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except urllib.error.URLError as e:
+        status = f"error: {e.reason}"
+    return status, (time.perf_counter() - t0) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay update Telegram ke webhook lokal")
+    parser.add_argument("--url", default=URL)
+    parser.add_argument("--secret", default="", help="sama dengan WEBHOOK_SECRET")
+    parser.add_argument("--file", help="JSONL berisi payload Update rekaman")
+    parser.add_argument("--from-chatlog", action="store_true", help="buat update sintetis dari chat_log_*.txt")
+    parser.add_argument("--users", type=int, default=8, help="jumlah chat sintetis (--from-chatlog)")
+    parser.add_argument("--limit", type=int, default=0)
+    parser.add_argument("--concurrency", type=int, default=8, help="jumlah chat yang dikirim paralel")
+    args = parser.parse_args()
+
+    if args.file:
+        chats = updates_from_file(args.file)
+    elif args.from_chatlog:
+        chats = updates_from_chatlog(args.users, args.limit)
+    else:
+        parser.error("pilih --file atau --from-chatlog")
+
+    def send_chat(updates):
+        return [post(args.url, u, args.secret) for u in updates]  # berurutan dalam satu chat
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as ex:
+        results = [r for chat in ex.map(send_chat, chats) for r in chat]
+    elapsed = time.perf_counter() - t0
+
+    statuses = Counter(s for s, _ in results)
+    lat = sorted(ms for _, ms in results)
+    print(f"📨 {len(results)} update dalam {elapsed:.2f}s ({len(results) / elapsed if elapsed else 0:.1f}/s)")
+    print(f"   status: {dict(statuses)}")
+    if lat:
+        print(f"   latency ack p50={statistics.median(lat):.1f} ms p95={lat[int(0.95 * (len(lat) - 1))]:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
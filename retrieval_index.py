@@ -0,0 +1,253 @@
+# retrieval_index.py — satu index TF-IDF untuk semua mode/katalog
+import json  # metadata artefak index
+import os  # path artefak
+import sys  # sys.intern untuk string keyword yang berulang
+import time  # id build artefak
+from array import array  # metadata baris yang ringkas
+from typing import List, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.preprocessing import normalize
+
+ARTIFACT_VERSION = 1  # naikkan jika format artefak berubah (artefak lama otomatis dianggap basi)
+_ARRAYS = ("matrix_data", "matrix_indices", "matrix_indptr", "idf", "mode_ids", "row_ctx")
+
+
+class RetrievalIndex:
+    """
+    Semua dataset (layanan, oli, umum mobil, bis/truk, ...) dalam satu matriks CSR.
+    Baris tiap mode berurutan dan punya kolom mode_id, sehingga pencarian per mode cukup
+    memotong rentang baris mode tsb.
+
+    Bobot IDF dihitung per mode (baris di luar mode tidak ikut dihitung), jadi skor cosine
+    sama persis dengan TfidfVectorizer yang di-fit terpisah per mode seperti sebelumnya,
+    dan TFIDF_THRESHOLD tetap bermakna sama.
+    """
+
+    def __init__(self, datasets):
+        """datasets: dict mode -> (keywords, paragraphs) dengan urutan baris yang sama."""
+        self.mode_names = list(datasets)
+        self.mode_ranges = {}          # mode -> (baris awal, baris akhir)
+        mode_ids = []
+        all_keywords = []
+
+        # metadata paragraf: context disimpan sekali per teks unik, baris cukup menyimpan index-nya
+        self.keywords = []             # keyword per baris (di-intern, banyak yang berulang)
+        self.contexts = []             # teks context unik
+        self.row_ctx = array("i")      # baris -> index di self.contexts
+        self.questions = []            # pertanyaan dataset per baris
+        self.answers = []              # jawaban dataset per baris
+        ctx_slot = {}
+
+        for mode_id, (mode, (kws, paras)) in enumerate(datasets.items()):
+            start = len(all_keywords)
+            for kw, para in zip(kws, paras):
+                kw = sys.intern(kw)
+                all_keywords.append(kw)
+                self.keywords.append(kw)
+                ctx = para.get("context", "") or ""
+                if ctx not in ctx_slot:
+                    ctx_slot[ctx] = len(self.contexts)
+                    self.contexts.append(ctx)
+                self.row_ctx.append(ctx_slot[ctx])
+                qa = (para.get("qas") or [{}])[0]
+                self.questions.append(qa.get("question", "") or "")
+                self.answers.append(((qa.get("answers") or [{}])[0]).get("text", "") or "")
+                mode_ids.append(mode_id)
+            self.mode_ranges[mode] = (start, len(all_keywords))
+
+        self.mode_ids = np.array(mode_ids, dtype=np.int16)  # kolom mode-id per baris
+        self._index_context_rows()
+
+        # kosakata gabungan; tokenisasi sama dengan TfidfVectorizer default
+        self.vectorizer = CountVectorizer().fit(all_keywords or ["__nokey__"])
+        counts = self.vectorizer.transform(all_keywords).tocsr().astype(np.float64)
+
+        self.idf = {}
+        blocks = []
+        for mode in self.mode_names:
+            start, end = self.mode_ranges[mode]
+            block = counts[start:end]
+            n = end - start
+            df = np.bincount(block.indices, minlength=counts.shape[1])
+            # smooth idf ala sklearn; istilah yang tidak muncul di mode ini diberi bobot 0
+            idf = np.where(df > 0, np.log((1 + n) / (1 + df)) + 1.0, 0.0)
+            self.idf[mode] = idf
+            blocks.append(normalize(block @ sp.diags(idf)))  # tf * idf lalu l2-normalisasi per baris
+        self.matrix = sp.vstack(blocks, format="csr") if blocks else counts
+
+    def __len__(self):
+        return len(self.keywords)
+
+    # --- artefak di disk ---
+    def save(self, path, signatures):
+        """
+        Simpan index ke folder path: array numpy (.npy, bisa di-mmap) + metadata json.
+        signatures: signature isi tabel per mode saat index dibangun (untuk cek basi saat load).
+        File array diberi id build; meta.json ditulis terakhir (atomic replace), jadi pembaca
+        tidak pernah melihat artefak setengah jadi.
+        """
+        os.makedirs(path, exist_ok=True)
+        build = f"{int(time.time() * 1000):x}"
+        terms = [None] * len(self.vectorizer.vocabulary_)
+        for term, i in self.vectorizer.vocabulary_.items():
+            terms[i] = term
+        arrays = {
+            "matrix_data": self.matrix.data,
+            "matrix_indices": self.matrix.indices,
+            "matrix_indptr": self.matrix.indptr,
+            "idf": np.vstack([self.idf[m] for m in self.mode_names]) if self.mode_names else np.zeros((0, len(terms))),
+            "mode_ids": self.mode_ids,
+            "row_ctx": np.frombuffer(self.row_ctx, dtype=np.int32) if len(self.row_ctx) else np.zeros(0, np.int32),
+        }
+        for name, arr in arrays.items():
+            np.save(os.path.join(path, f"{name}.{build}.npy"), np.ascontiguousarray(arr))
+        with open(os.path.join(path, f"rows.{build}.json"), "w", encoding="utf-8") as f:
+            json.dump({"keywords": self.keywords, "contexts": self.contexts,
+                       "questions": self.questions, "answers": self.answers}, f, ensure_ascii=False)
+        meta = {
+            "version": ARTIFACT_VERSION,
+            "build": build,
+            "signatures": signatures,
+            "mode_names": self.mode_names,
+            "mode_ranges": self.mode_ranges,
+            "shape": list(self.matrix.shape),
+            "vocabulary": terms,
+        }
+        tmp = os.path.join(path, "meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp, os.path.join(path, "meta.json"))
+        # hapus artefak build lama
+        for name in os.listdir(path):
+            parts = name.split(".")
+            if len(parts) == 3 and parts[0] in _ARRAYS + ("rows",) and parts[1] != build:
+                try:
+                    os.remove(os.path.join(path, name))
+                except OSError:
+                    pass  # mungkin masih di-mmap proses lain (Windows)
+
+    @classmethod
+    def load(cls, path, signatures=None, mmap=True) -> Optional["RetrievalIndex"]:
+        """
+        Load index dari artefak save(). Return None jika artefak tidak ada, versinya lain,
+        atau signatures berbeda dengan yang tersimpan (isi tabel sudah berubah → perlu fit ulang).
+        """
+        try:
+            with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta.get("version") != ARTIFACT_VERSION:
+            return None
+        if signatures is not None and meta.get("signatures") != signatures:
+            return None
+        build = meta["build"]
+        try:
+            arrays = {name: np.load(os.path.join(path, f"{name}.{build}.npy"), mmap_mode="r" if mmap else None)
+                      for name in _ARRAYS}
+            with open(os.path.join(path, f"rows.{build}.json"), "r", encoding="utf-8") as f:
+                rows = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        self = cls.__new__(cls)
+        self.mode_names = meta["mode_names"]
+        self.mode_ranges = {m: tuple(r) for m, r in meta["mode_ranges"].items()}
+        self.mode_ids = arrays["mode_ids"]
+        self.keywords = [sys.intern(k) for k in rows["keywords"]]
+        self.contexts = rows["contexts"]
+        self.row_ctx = array("i", arrays["row_ctx"].tolist())
+        self.questions = rows["questions"]
+        self.answers = rows["answers"]
+        self._index_context_rows()
+        # vocabulary tetap → CountVectorizer tidak perlu di-fit ulang
+        self.vectorizer = CountVectorizer(vocabulary=meta["vocabulary"])
+        self.idf = {m: arrays["idf"][i] for i, m in enumerate(self.mode_names)}
+        self.matrix = sp.csr_matrix(
+            (arrays["matrix_data"], arrays["matrix_indices"], arrays["matrix_indptr"]), shape=tuple(meta["shape"]))
+        return self
+
+    # --- metadata ---
+    def mode_of(self, row):
+        return self.mode_names[self.mode_ids[row]]
+
+    def local_index(self, row):
+        """Index baris di dalam mode-nya (sama dengan best_index lama di log)."""
+        return row - self.mode_ranges[self.mode_of(row)][0]
+
+    def row_of(self, mode, local_idx):
+        return self.mode_ranges[mode][0] + local_idx
+
+    def context(self, row):
+        return self.contexts[self.row_ctx[row]]
+
+    def _index_context_rows(self):
+        self.ctx_rows = [[] for _ in self.contexts]  # index context -> semua baris yang memakainya
+        for row, slot in enumerate(self.row_ctx):
+            self.ctx_rows[slot].append(row)
+
+    def rows_with_context(self, row):
+        """
+        Semua baris satu mode yang memakai context yang sama dengan row (termasuk row sendiri).
+        _top_k hanya menyisakan satu baris per context, parafrase lain ada di sini.
+        """
+        mode_id = self.mode_ids[row]
+        return [r for r in self.ctx_rows[self.row_ctx[row]] if self.mode_ids[r] == mode_id]
+
+    def export_mode(self, mode):
+        """
+        Kembalikan (keywords, paragraphs) satu mode dari metadata index, supaya index baru
+        bisa dibangun ulang tanpa membaca ulang tabel mode yang tidak berubah.
+        """
+        start, end = self.mode_ranges[mode]
+        paras = [{
+            "context": self.context(r),
+            "qas": [{"question": self.questions[r], "answers": [{"text": self.answers[r]}]}],
+        } for r in range(start, end)]
+        return self.keywords[start:end], paras
+
+    # --- pencarian ---
+    def _mode_scores(self, q_counts, mode):
+        start, end = self.mode_ranges[mode]
+        if start == end:
+            return np.zeros(0)
+        q_vec = normalize(q_counts @ sp.diags(self.idf[mode]))
+        return (self.matrix[start:end] @ q_vec.T).toarray().ravel()
+
+    def _top_k(self, sims, offset, k):
+        # baris dengan context sama tidak dihitung sebagai kandidat baru (jawabannya sama)
+        pool = max(1, min(k * 8, sims.shape[0]))
+        top = np.argpartition(-sims, pool - 1)[:pool]       # kandidat terbaik tanpa mengurutkan seluruh vektor
+        top = top[np.argsort(-sims[top], kind="stable")]
+        results, seen = [], set()
+        for i in top:
+            row = offset + int(i)
+            slot = self.row_ctx[row]
+            if slot in seen:
+                continue
+            seen.add(slot)
+            results.append((row, float(sims[i])))
+            if len(results) == k:
+                break
+        return results
+
+    def search(self, question, mode, k=1) -> List[Tuple[int, float]]:
+        """Top-k (baris global, skor) hanya di dalam satu mode."""
+        sims = self._mode_scores(self.vectorizer.transform([question]), mode)
+        if sims.shape[0] == 0:
+            return []
+        return self._top_k(sims, self.mode_ranges[mode][0], k)
+
+    def search_everywhere(self, question, k=1) -> List[Tuple[int, float]]:
+        """Top-k di semua mode (tiap mode dinilai dengan IDF-nya sendiri)."""
+        q_counts = self.vectorizer.transform([question])
+        results = []
+        for mode in self.mode_names:
+            sims = self._mode_scores(q_counts, mode)
+            if sims.shape[0]:
+                results.extend(self._top_k(sims, self.mode_ranges[mode][0], k))
+        results.sort(key=lambda r: -r[1])
+        return results[:k]
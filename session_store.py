@@ -0,0 +1,221 @@
+# session_store.py — state percakapan per chat_id (mode aktif + form keluhan)
+import asyncio  # task flush write-behind
+import sqlite3  # persistensi sesi (opsional)
+import threading  # lock koneksi SQLite yang dipakai bersama
+import time  # TTL & last_seen
+from collections import OrderedDict  # urutan LRU
+from typing import Dict, Optional
+
+# langkah form keluhan (mode "keluhan")
+STEP_TEMPLATE = "template"        # menunggu template Nama/Merek/Jenis/Keluhan
+STEP_PLAT = "plat"                # menunggu nomor plat
+STEP_KONFIRMASI = "konfirmasi"    # menunggu "Ya, Buatkan."
+
+_FIELDS = ("mode", "step", "nama", "merek", "jenis", "keluhan", "plat", "last_seen")
+
+
+class Session:
+    """Satu sesi chat. __slots__ supaya ribuan sesi tetap kecil di memori."""
+    __slots__ = ("chat_id",) + _FIELDS
+
+    def __init__(self, chat_id, mode=None, step=None, nama=None, merek=None, jenis=None,
+                 keluhan=None, plat=None, last_seen=None):
+        self.chat_id = chat_id
+        self.mode = mode
+        self.step = step
+        self.nama = nama
+        self.merek = merek
+        self.jenis = jenis
+        self.keluhan = keluhan
+        self.plat = plat
+        self.last_seen = last_seen if last_seen is not None else time.time()
+
+    def row(self):
+        return (self.chat_id,) + tuple(getattr(self, f) for f in _FIELDS)
+
+
+def ensure_session_table(conn: sqlite3.Connection):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS user_session (
+        chat_id INTEGER PRIMARY KEY,
+        mode TEXT,
+        step TEXT,
+        nama TEXT,
+        merek TEXT,
+        jenis TEXT,
+        keluhan TEXT,
+        plat TEXT,
+        last_seen REAL
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_user_session_last_seen ON user_session(last_seen)")
+    conn.commit()
+
+
+class SessionStore:
+    """
+    Sesi di memori dengan TTL (sesi yang lama tidak aktif dibuang) dan batas jumlah
+    (sesi paling lama tidak dipakai dibuang lebih dulu / LRU).
+
+    Jika conn diberikan, perubahan dicatat lalu ditulis ke tabel user_session secara
+    berkala (write-behind) oleh flush(). Sesi yang terbuang dari memori karena LRU tetap
+    bisa dibaca ulang dari DB, dan form keluhan yang belum selesai bertahan saat restart.
+    """
+
+    def __init__(self, ttl_seconds=12 * 3600, max_sessions=10000, conn=None, lock=None,
+                 flush_interval=5.0, run_blocking=None, touch_interval=300.0):
+        self.ttl = ttl_seconds
+        self.max_sessions = max_sessions
+        self.conn = conn
+        self.lock = lock or threading.Lock()
+        self.flush_interval = flush_interval
+        self.touch_interval = touch_interval  # last_seen di DB diperbarui paling sering sekali per jeda ini
+        self.run_blocking = run_blocking or asyncio.to_thread
+        self._sessions: "OrderedDict[int, Session]" = OrderedDict()
+        self._dirty: Dict[int, Optional[Session]] = {}     # chat_id -> sesi (upsert) / None (hapus)
+        self._flushing: Dict[int, Optional[Session]] = {}  # batch yang sedang ditulis ke DB
+        self._task = None
+        self.evicted = 0
+        if conn is not None:
+            with self.lock:
+                ensure_session_table(conn)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _expired(self, sess, now):
+        return self.ttl and now - sess.last_seen > self.ttl
+
+    def _pending(self, chat_id):
+        # sesi yang tidak ada di memori tapi masih di antrean write-behind: (True, sesi/None)
+        for pending in (self._dirty, self._flushing):
+            if chat_id in pending:
+                return True, pending[chat_id]
+        return False, None
+
+    def _select(self, chat_id) -> Optional[Session]:
+        # dipanggil di worker thread (run_blocking), bukan di event loop
+        with self.lock:
+            r = self.conn.execute(f"SELECT chat_id, {', '.join(_FIELDS)} FROM user_session WHERE chat_id = ?",
+                                  (chat_id,)).fetchone()
+        return Session(*r) if r else None
+
+    async def get(self, chat_id) -> Optional[Session]:
+        """
+        Sesi aktif chat_id (None jika belum ada atau sudah kedaluwarsa).
+        Hit di memori tidak menyentuh DB; miss dibaca dari user_session lewat run_blocking
+        supaya event loop tidak menunggu db_lock.
+        """
+        sess = self._sessions.get(chat_id)
+        if sess is None:
+            found, sess = self._pending(chat_id)
+            if not found and self.conn is not None:
+                sess = await self.run_blocking(self._select, chat_id)
+                # selama menunggu DB, handler lain bisa sudah membuat/menghapus sesi ini
+                found, pending = self._pending(chat_id)
+                if chat_id in self._sessions:
+                    sess = self._sessions[chat_id]
+                elif found:
+                    sess = pending
+            if sess is None:
+                return None
+            self._put(sess)
+        else:
+            self._sessions.move_to_end(chat_id)
+        now = time.time()
+        if self._expired(sess, now):
+            self.drop(chat_id)
+            return None
+        touched = now - sess.last_seen >= self.touch_interval
+        sess.last_seen = now
+        if touched and self.conn is not None:
+            # tanpa ini last_seen di DB tertinggal dan sesi aktif terhapus oleh pembersihan TTL di _write
+            self._dirty[chat_id] = sess
+        return sess
+
+    def start(self, chat_id, mode) -> Session:
+        """Mulai sesi baru dengan mode tertentu (state lama dibuang)."""
+        sess = Session(chat_id, mode, STEP_TEMPLATE if mode == "keluhan" else None)
+        self._put(sess)
+        self.save(sess)
+        return sess
+
+    def save(self, sess: Session):
+        """Tandai sesi berubah supaya ikut ditulis pada flush berikutnya."""
+        sess.last_seen = time.time()
+        if self.conn is not None:
+            self._dirty[sess.chat_id] = sess
+
+    def drop(self, chat_id):
+        self._sessions.pop(chat_id, None)
+        if self.conn is not None:
+            self._dirty[chat_id] = None
+
+    def _put(self, sess):
+        self._sessions[sess.chat_id] = sess
+        self._sessions.move_to_end(sess.chat_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)  # sesi ini masih ada di DB / antrean write-behind
+            self.evicted += 1
+
+    def sweep(self):
+        """Buang sesi kedaluwarsa dari memori."""
+        now = time.time()
+        for chat_id in [c for c, s in self._sessions.items() if self._expired(s, now)]:
+            self.drop(chat_id)
+
+    # --- write-behind ---
+    def _write(self, batch):
+        upserts = [s.row() for s in batch.values() if s is not None]
+        deletes = [(c,) for c, s in batch.items() if s is None]
+        with self.lock:
+            with self.conn:
+                if upserts:
+                    self.conn.executemany(f"""
+                        INSERT OR REPLACE INTO user_session (chat_id, {', '.join(_FIELDS)})
+                        VALUES ({', '.join('?' for _ in range(len(_FIELDS) + 1))})
+                    """, upserts)
+                if deletes:
+                    self.conn.executemany("DELETE FROM user_session WHERE chat_id = ?", deletes)
+                if self.ttl:
+                    self.conn.execute("DELETE FROM user_session WHERE last_seen < ?", (time.time() - self.ttl,))
+
+    async def flush(self):
+        self.sweep()
+        if self.conn is None or not self._dirty:
+            return
+        self._flushing, self._dirty = self._dirty, {}
+        try:
+            await self.run_blocking(self._write, self._flushing)
+        except Exception:
+            # gagal tulis: kembalikan ke antrean (perubahan yang lebih baru tetap menang)
+            for chat_id, sess in self._flushing.items():
+                self._dirty.setdefault(chat_id, sess)
+            raise
+        finally:
+            self._flushing = {}
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"[WARN] Gagal menyimpan sesi: {e}")
+
+    def start_flusher(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Hentikan flush berkala lalu tulis semua perubahan yang tersisa."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.conn is not None and self._dirty:
+            batch, self._dirty = self._dirty, {}
+            self._write(batch)  # langsung: executor bisa jadi sudah ditutup
@@ -0,0 +1,115 @@
+# webhook_server.py — server HTTP asyncio kecil untuk menerima update Telegram (mode webhook)
+import asyncio  # asyncio.start_server, berjalan di event loop yang sama dengan bot
+import hmac  # bandingkan secret token tanpa timing leak
+import json  # payload update
+from typing import Optional
+
+from telegram import Update
+
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 1024 * 1024  # update Telegram jauh lebih kecil dari ini
+
+
+class WebhookServer:
+    """
+    Terima POST berisi JSON Update dari Telegram lalu masukkan ke app.update_queue;
+    handler tetap dijalankan oleh Application (batas concurrent_updates berlaku seperti polling).
+
+    - secret_token: jika diisi, header X-Telegram-Bot-Api-Secret-Token harus sama (403 jika tidak)
+    - max_pending: jika antrean update sudah sepanjang ini, balas 503 → Telegram mengirim ulang nanti
+    Koneksi keep-alive didukung (Telegram memakai ulang koneksi untuk banyak update).
+    """
+
+    def __init__(self, app, listen="0.0.0.0", port=8443, path="/telegram",
+                 secret_token: Optional[str] = None, max_pending=1000):
+        self.app = app
+        self.listen = listen
+        self.port = port
+        self.path = path
+        self.secret_token = secret_token or None
+        self.max_pending = max_pending
+        self._server = None
+        self.accepted = 0
+        self.rejected = 0
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.listen, self.port)
+        print(f"[INFO] Webhook mendengarkan di http://{self.listen}:{self.port}{self.path}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _respond(self, writer, status, reason, keep_alive):
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\nContent-Length: 0\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("ascii")
+        )
+        await writer.drain()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    return  # klien menutup koneksi / header terlalu besar
+                if len(head) > MAX_HEADER_BYTES:
+                    return
+                lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = lines[0].split(" ", 2)
+                except ValueError:
+                    await self._respond(writer, 400, "Bad Request", False)
+                    return
+                headers = {}
+                for line in lines[1:]:
+                    if ":" in line:
+                        k, v = line.split(":", 1)
+                        headers[k.strip().lower()] = v.strip()
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+
+                try:
+                    length = int(headers.get("content-length") or 0)
+                except ValueError:
+                    await self._respond(writer, 400, "Bad Request", False)
+                    return
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, "Payload Too Large", False)
+                    return
+                body = await reader.readexactly(length) if length else b""
+
+                status, reason = await self._dispatch(method, target.split("?", 1)[0], headers, body)
+                await self._respond(writer, status, reason, keep_alive)
+                if not keep_alive:
+                    return
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method, path, headers, body):
+        if path != self.path:
+            return 404, "Not Found"
+        if method != "POST":
+            return 405, "Method Not Allowed"
+        if self.secret_token is not None:
+            token = headers.get("x-telegram-bot-api-secret-token", "")
+            # bandingkan bytes: compare_digest menolak str non-ASCII dengan TypeError, bukan 403
+            # (header di-decode latin-1 → encode latin-1 mengembalikan bytes aslinya)
+            if not hmac.compare_digest(token.encode("latin-1"), self.secret_token.encode("utf-8")):
+                return 403, "Forbidden"
+        if self.app.update_queue.qsize() >= self.max_pending:
+            self.rejected += 1
+            return 503, "Service Unavailable"  # backpressure: Telegram akan mencoba lagi
+        try:
+            update = Update.de_json(json.loads(body), self.app.bot)
+        except (ValueError, TypeError, KeyError):
+            return 400, "Bad Request"
+        if update is None:
+            return 400, "Bad Request"
+        await self.app.update_queue.put(update)
+        self.accepted += 1
+        return 200, "OK"
@@ -0,0 +1,141 @@
+# worker_pool.py — lapisan executor supaya kerja berat tidak memblokir event loop bot
+import asyncio  # run_in_executor & semaphore untuk backpressure
+import functools  # bungkus fungsi + argumen untuk executor
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+# --- state model di dalam worker process ---
+# Di Linux (fork) nilai ini diwarisi dari proses utama yang sudah load model;
+# di Windows (spawn) initializer akan load ulang model dari path.
+_worker_tokenizer = None
+_worker_model = None
+
+
+def set_local_model(tokenizer, model):
+    """Daftarkan model yang sudah di-load di proses utama (diwarisi worker saat fork)."""
+    global _worker_tokenizer, _worker_model
+    _worker_tokenizer = tokenizer
+    _worker_model = model
+
+
+def _init_process_worker(model_path, torch_threads, backend, onnx_path):
+    global _worker_tokenizer, _worker_model
+    import torch
+    torch.set_num_threads(torch_threads)  # cegah N worker x semua core saling berebut CPU
+    if _worker_model is None:
+        from transformers import AutoTokenizer
+        import qa_backend
+        _worker_tokenizer = AutoTokenizer.from_pretrained(model_path)
+        _worker_model = qa_backend.load_qa_model(model_path, backend, onnx_path)
+
+
+def _process_answer_batch(pairs):
+    # dijalankan di worker process: pakai model milik worker; timing per tahap ikut dikirim balik
+    from qa_inference import predict_batch  # import di sini: torch tidak ikut ter-import saat bot start
+    timings = {}
+    preds = predict_batch(_worker_tokenizer, _worker_model, pairs, timings=timings)
+    return preds, timings
+
+
+def _noop():
+    return None
+
+
+class WorkerPool:
+    """
+    Executor yang bisa dipilih:
+    - "thread" : semua kerja (TF-IDF, DB, model) di ThreadPoolExecutor
+    - "process": inferensi model di ProcessPoolExecutor (model sudah ter-load di tiap worker),
+                 TF-IDF & SQLite tetap di thread karena objeknya tidak bisa dipickle.
+
+    queue_size membatasi jumlah pekerjaan yang menunggu; jika penuh, handler akan
+    menunggu (backpressure) alih-alih menumpuk pekerjaan tanpa batas.
+    """
+
+    def __init__(self, kind="thread", workers=2, queue_size=32, model_path=None, backend="torch_fp32",
+                 onnx_path=None, local_model_fn=None, torch_threads=1, on_model_timings=None):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"kind executor tidak dikenal: {kind}")
+        self.kind = kind
+        self.workers = max(1, int(workers))
+        self.queue_size = max(0, int(queue_size))
+        self.model_path = model_path
+        self.backend = backend
+        self.onnx_path = onnx_path
+        self.local_model_fn = local_model_fn  # fungsi batch model untuk mode "thread"
+        self.torch_threads = torch_threads
+        self.on_model_timings = on_model_timings  # callback(timings, batch_size) untuk batch di worker process
+        self.thread_executor = None
+        self.process_executor = None
+        self._slots = None
+        self._inflight = 0
+
+    def start(self):
+        """Buat executor. Panggil sebelum polling dimulai agar fork terjadi sebelum ada event loop."""
+        if self.thread_executor is not None:
+            return
+        self.thread_executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bot-worker")
+        if self.kind == "process":
+            self.process_executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_process_worker,
+                initargs=(self.model_path, self.torch_threads, self.backend, self.onnx_path),
+            )
+            # paksa semua worker hidup sekarang (model langsung siap di tiap worker)
+            for f in [self.process_executor.submit(_noop) for _ in range(self.workers)]:
+                f.result()
+
+    def shutdown(self):
+        if self.process_executor is not None:
+            self.process_executor.shutdown(wait=True, cancel_futures=True)
+            self.process_executor = None
+        if self.thread_executor is not None:
+            self.thread_executor.shutdown(wait=True, cancel_futures=True)
+            self.thread_executor = None
+        self._slots = None  # semaphore terikat ke event loop lama; start() berikutnya bisa di loop lain
+
+    @property
+    def model_executor(self):
+        return self.process_executor if self.kind == "process" else self.thread_executor
+
+    @property
+    def model_batch_fn(self):
+        return _process_answer_batch if self.kind == "process" else self.local_model_fn
+
+    def _ensure_slots(self):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers + self.queue_size)
+
+    @property
+    def pending(self):
+        """Jumlah pekerjaan yang sedang berjalan + menunggu."""
+        return self._inflight
+
+    async def run(self, fn, *args, **kwargs):
+        """Jalankan fungsi blocking (TF-IDF, SQLite, file) di thread pool."""
+        self.start()
+        self._ensure_slots()
+        self._inflight += 1
+        try:
+            async with self._slots:  # backpressure: tunggu jika antrean penuh
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self.thread_executor, functools.partial(fn, *args, **kwargs))
+        finally:
+            self._inflight -= 1
+
+    async def run_model(self, pairs):
+        """Jalankan satu batch inferensi QA di executor model (thread atau process)."""
+        self.start()
+        self._ensure_slots()
+        self._inflight += 1
+        try:
+            async with self._slots:
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(self.model_executor, self.model_batch_fn, pairs)
+        finally:
+            self._inflight -= 1
+        if self.kind != "process":
+            return result
+        preds, timings = result
+        if self.on_model_timings is not None:
+            self.on_model_timings(timings, len(pairs))
+        return preds